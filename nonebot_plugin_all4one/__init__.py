@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 from nonebot.adapters import Bot, Event
 from nonebot.plugin import PluginMetadata
 from nonebot import on, require, get_driver
@@ -35,8 +33,4 @@ on(priority=1, block=False)
 async def _(bot: Bot, event: Event):
     if middleware := obimpl.middlewares.get(bot.self_id, None):
         for event in await middleware.to_onebot_event(event):
-            for queue in obimpl.queues:
-                if queue.full():
-                    await queue.get()
-                event = deepcopy(event)
-                await queue.put(deepcopy(event))
+            await obimpl.dispatch(event)
@@ -1,23 +1,50 @@
+from asyncio import sleep
 from hashlib import sha256
-from base64 import b64decode
 from uuid import UUID, uuid4
-from typing import Union, Optional
+from secrets import token_hex
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Union, Optional, cast
 
 from anyio import open_file
 from httpx import AsyncClient
-from sqlalchemy import JSON, Uuid, select
-from sqlalchemy.orm import Mapped, mapped_column
+from anyio import Path as AsyncPath
+from nonebot import get_plugin_config
+from sqlalchemy.exc import IntegrityError
 from nonebot_plugin_orm import Model, get_session
+from sqlalchemy.engine import Engine, CursorResult
 from nonebot_plugin_localstore import get_plugin_data_dir
+from sqlalchemy.orm import Mapped, aliased, mapped_column
 from nonebot.adapters.onebot.v12.exception import DatabaseError
+from sqlalchemy import (
+    JSON,
+    Uuid,
+    DateTime,
+    LargeBinary,
+    case,
+    func,
+    event,
+    select,
+    update,
+)
 
+from ..logger import log
+from .url import make_url
+from .config import Config
 from .fleep import get as get_file_info
+from ..offload import offload, decode_base64
+from .storage import Storage, BlobCache, S3Storage, LocalStorage
 
 
 def get_sha256(data: bytes) -> str:
     return sha256(data).hexdigest()
 
 
+def inspect_data(data: bytes) -> tuple[str, list[str]]:
+    """计算文件的 SHA256 并根据文件头推断扩展名"""
+    return get_sha256(data), get_file_info(data[:128]).extensions
+
+
 class File(Model):
     id: Mapped[UUID] = mapped_column(Uuid, primary_key=True, default=uuid4)
     name: Mapped[str]
@@ -27,12 +54,117 @@ class File(Model):
     headers: Mapped[Optional[dict[str, str]]] = mapped_column(JSON)
     path: Mapped[Optional[str]]
     sha256: Mapped[Optional[str]]
+    size: Mapped[Optional[int]]
+    atime: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class Blob(Model):
+    """内联保存在数据库中的小文件内容"""
+
+    sha256: Mapped[str] = mapped_column(primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+
+
+class UrlCache(Model):
+    """URL 下载结果的缓存，记录验证器用于条件请求"""
+
+    url: Mapped[str] = mapped_column(primary_key=True)
+    etag: Mapped[Optional[str]]
+    last_modified: Mapped[Optional[str]]
+    sha256: Mapped[str]
+    checked_at: Mapped[datetime] = mapped_column(DateTime)
 
 
 DATA_PATH = get_plugin_data_dir()
 FILE_PATH = DATA_PATH / "file"
 FILE_PATH.mkdir(parents=True, exist_ok=True)
 
+plugin_config = get_plugin_config(Config)
+
+
+def get_storage(config: Config) -> Storage:
+    if config.obimpl_storage == "s3":
+        if config.obimpl_s3_endpoint is None:
+            raise ValueError("obimpl_s3_endpoint must be set when storage is s3")
+        return S3Storage(
+            config.obimpl_s3_endpoint,
+            config.obimpl_s3_bucket,
+            config.obimpl_s3_region,
+            config.obimpl_s3_access_key,
+            config.obimpl_s3_secret_key,
+            config.obimpl_s3_prefix,
+        )
+    return LocalStorage(FILE_PATH, config.obimpl_storage_depth)
+
+
+storage = get_storage(plugin_config)
+blob_cache = BlobCache(plugin_config.obimpl_storage_inline_cache_size)
+# 未配置签名密钥时使用随机密钥，重启后之前签发的 URL 失效；
+# 多进程部署时各进程的随机密钥不同，必须配置 obimpl_file_url_secret
+file_url_secret = plugin_config.obimpl_file_url_secret or token_hex(32)
+FILE_ROUTE = "/all4one/file"
+
+# 最近访问时间先记录在内存中，由回收任务批量写入数据库
+touched: dict[UUID, datetime] = {}
+# 文件内容的位置每次变化时递增，依赖文件内容的缓存据此失效
+file_version = 0
+
+
+def get_file_version() -> int:
+    return file_version
+
+
+def invalidate_files() -> None:
+    """标记文件记录的内容位置已经变化"""
+    global file_version
+    file_version += 1
+
+
+def is_collecting() -> bool:
+    return (
+        plugin_config.obimpl_storage_quota is not None
+        or plugin_config.obimpl_storage_max_age is not None
+    )
+
+
+def touch(file: File) -> File:
+    """记录文件的访问时间，仅在启用回收时记录"""
+    if is_collecting():
+        touched[file.id] = datetime.now()
+    return file
+
+
+def touch_files(file_ids: Iterable[str]) -> None:
+    """按文件 ID 记录访问时间，用于没有经过 get_file 的访问，例如消息缓存命中"""
+    if is_collecting():
+        now = datetime.now()
+        for file_id in file_ids:
+            try:
+                touched[UUID(file_id)] = now
+            except ValueError:
+                pass
+
+
+def enable_shared_access() -> None:
+    """为 SQLite 启用 WAL 与忙等待，使多个进程可以安全地共享同一个数据库
+
+    只作用于本插件模型所在的数据库，需要在 ORM 初始化之后调用
+    """
+    engine = cast(Engine, get_session().get_bind(File))
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    # 丢弃已经建立的连接，之后的连接都会执行上面的设置；内存数据库不能重新连接
+    if engine.url.database not in (None, "", ":memory:"):
+        engine.dispose(close=False)
+
 
 async def get_file(file_id: str, src: Optional[str] = None) -> File:
     async with get_session() as session:
@@ -43,10 +175,10 @@ async def get_file(file_id: str, src: Optional[str] = None) -> File:
             raise DatabaseError("failed", 31001, "file not found", {})
         if src is None:
             if file.sha256:
-                return file
+                return touch(file)
         else:
             if file.src == src:
-                return file
+                return touch(file)
             else:
                 if file.sha256 is None:
                     raise DatabaseError("failed", 31001, "file not found", {})
@@ -55,15 +187,133 @@ async def get_file(file_id: str, src: Optional[str] = None) -> File:
                         select(File).where(File.sha256 == file.sha256, File.src == src)
                     )
                 ).first():
-                    return file_
+                    return touch(file_)
                 else:
                     file.src = src
                     file.src_id = None
-                    return file
+                    return touch(file)
 
         raise DatabaseError("failed", 31001, "file not found", {})
 
 
+def is_inline(size: Optional[int]) -> bool:
+    return size is not None and size < plugin_config.obimpl_storage_inline_threshold
+
+
+async def put_blob(key: str, data: bytes) -> None:
+    """保存文件内容，小于内联阈值的文件保存在数据库中，内容相同的文件只保存一份"""
+    if not is_inline(len(data)):
+        if not await storage.exists(key):
+            await storage.put(key, data)
+        return
+    async with get_session() as session:
+        if await session.get(Blob, key) is None:
+            session.add(Blob(sha256=key, data=data))
+            try:
+                await session.commit()
+            # 相同内容被并发写入，已经保存过
+            except IntegrityError:
+                await session.rollback()
+    blob_cache.put(key, data)
+
+
+async def get_inline_blob(key: str) -> Optional[bytes]:
+    """从内存缓存或数据库中读取内联保存的文件内容"""
+    if (data := blob_cache.get(key)) is None:
+        async with get_session() as session:
+            if blob := await session.get(Blob, key):
+                data = blob.data
+                blob_cache.put(key, data)
+    return data
+
+
+async def get_blob(
+    key: str, size: Optional[int] = None, start: int = 0, end: Optional[int] = None
+) -> bytes:
+    """读取文件内容中 [start, end) 范围内的数据
+
+    小文件依次从内存缓存、数据库、存储后端中读取；内联阈值调整后，
+    文件可能保存在另一层中，在存储后端中找不到时再从数据库中读取
+    """
+    if is_inline(size) and (data := await get_inline_blob(key)) is not None:
+        return data[start:end]
+    try:
+        return await storage.read(key, start, end)
+    except FileNotFoundError:
+        if is_inline(size) or (data := await get_inline_blob(key)) is None:
+            raise
+    return data[start:end]
+
+
+async def delete_blob(key: str) -> None:
+    blob_cache.pop(key)
+    async with get_session() as session:
+        if blob := await session.get(Blob, key):
+            await session.delete(blob)
+            await session.commit()
+    await storage.delete(key)
+
+
+async def fetch_url(
+    url: str, headers: Optional[dict[str, str]] = None
+) -> tuple[Optional[File], Optional[bytes]]:
+    """下载 URL 的内容，已缓存且内容仍然可用时返回已有的文件记录
+
+    在 obimpl_url_cache_ttl 秒内不发出请求，超过后使用 ETag 与 Last-Modified
+    发出条件请求，服务器返回 304 时不重新下载
+    """
+    async with get_session() as session:
+        cache = (
+            await session.get(UrlCache, url) if plugin_config.obimpl_url_cache else None
+        )
+        file = None
+        if cache is not None:
+            file = (
+                await session.scalars(
+                    select(File).where(
+                        File.sha256 == cache.sha256, File.path.is_not(None)
+                    )
+                )
+            ).first()
+        now = datetime.now()
+        if cache is not None and file is not None:
+            if now - cache.checked_at < timedelta(
+                seconds=plugin_config.obimpl_url_cache_ttl
+            ):
+                return file, None
+            headers = dict(headers or {})
+            if cache.etag:
+                headers["If-None-Match"] = cache.etag
+            if cache.last_modified:
+                headers["If-Modified-Since"] = cache.last_modified
+        async with AsyncClient() as client:
+            response = await client.get(url, headers=headers)
+        if cache is not None and file is not None and response.status_code == 304:
+            cache.checked_at = now
+            await session.commit()
+            await session.refresh(file)
+            return file, None
+        data = response.content
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not plugin_config.obimpl_url_cache or not response.is_success:
+            return None, data
+        # 没有验证器时也缓存，在新鲜期内可以跳过下载
+        if cache is None:
+            cache = UrlCache(url=url)
+            session.add(cache)
+        cache.etag = etag
+        cache.last_modified = last_modified
+        cache.sha256 = await offload(get_sha256, len(data), data)
+        cache.checked_at = now
+        try:
+            await session.commit()
+        # 同一 URL 被并发下载，缓存已由另一个请求写入
+        except IntegrityError:
+            await session.rollback()
+        return None, data
+
+
 async def upload_file(
     name: Optional[str] = None,
     src: Optional[str] = None,
@@ -95,6 +345,7 @@ async def upload_file(
                     headers=file.headers,
                     path=file.path,
                     sha256=sha256,
+                    size=file.size,
                 )
                 session.add(file)
                 await session.commit()
@@ -105,34 +356,243 @@ async def upload_file(
         async with await open_file(path, "rb") as f:
             data = await f.read()
     elif url:
-        async with AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            data = response.content
+        cached, data = await fetch_url(url, headers)
+        if cached is not None:
+            file = File(
+                name=name or cached.name,
+                src=src,
+                src_id=src_id,
+                url=url,
+                headers=headers,
+                path=cached.path,
+                sha256=cached.sha256,
+                size=cached.size,
+            )
+            async with get_session() as session:
+                session.add(file)
+                await session.commit()
+                await session.refresh(file)
+                return touch(file).id.hex
     if not data:
         # FIXME: 还没决定放什么异常
         raise
     # 如果是 JSON 格式，bytes 编码为 base64
     # https://12.onebot.dev/connect/data-protocol/basic-types/#_5
     if isinstance(data, str):
-        data = b64decode(data)
+        data = await offload(decode_base64, len(data), data)
 
-    sha256 = get_sha256(data)
-    extensions = get_file_info(data[:128]).extensions
+    sha256, extensions = await offload(inspect_data, len(data), data)
     filename = f"{sha256}{'.'+extensions[0] if extensions else ''}"
-    path = str(FILE_PATH / filename)
-    async with await open_file(path, "wb") as f:
-        await f.write(data)
+    # 以 SHA256 作为 key 寻址，内容相同的文件只保存一份
+    await put_blob(sha256, data)
     file = File(
         name=name or filename,
         src=src,
         src_id=src_id,
         url=url,
         headers=headers,
-        path=path,
+        path=sha256,
         sha256=sha256,
+        size=len(data),
     )
     async with get_session() as session:
         session.add(file)
         await session.commit()
         await session.refresh(file)
         return file.id.hex
+
+
+async def migrate_layout(batch_size: int = 100) -> int:
+    """将旧的平铺布局中的文件迁移到以 SHA256 寻址的分片目录中，返回迁移的记录数
+
+    分批进行：先把文件链接到新位置并更新记录，提交后再删除旧文件，
+    迁移期间旧记录仍然可以读取
+    """
+    if not isinstance(storage, LocalStorage):
+        return 0
+    count = 0
+    while True:
+        async with get_session() as session:
+            files = (
+                await session.scalars(
+                    select(File)
+                    .where(
+                        File.sha256.is_not(None),
+                        File.path.is_not(None),
+                        File.path != File.sha256,
+                    )
+                    .limit(batch_size)
+                )
+            ).all()
+            if not files:
+                return count
+            sources = set()
+            for file in files:
+                # 旧记录保存的是绝对路径或平铺布局下的文件名
+                source = storage.root / cast(str, file.path)
+                if not await storage.adopt(source, cast(str, file.sha256)):
+                    log("WARNING", f"File {file.id.hex} is missing on disk")
+                sources.add(source)
+                file.path = file.sha256
+            await session.commit()
+        invalidate_files()
+        for source in sources:
+            await AsyncPath(source).unlink(missing_ok=True)
+        count += len(files)
+        # 让出事件循环，避免迁移阻塞其它任务
+        await sleep(0)
+
+
+async def collect_garbage(
+    quota: Optional[int] = None, max_age: Optional[int] = None
+) -> int:
+    """回收文件内容，返回回收的字节数
+
+    只回收所有记录都带有 url、读取时可以重新下载的文件，
+    按最近访问时间从旧到新回收超过 max_age 秒未访问的文件，直到总大小不超过 quota
+
+    参数:
+        quota: 总大小上限，单位：字节
+        max_age: 未访问的最长时间，单位：秒
+    """
+    async with get_session() as session:
+        # 写入内存中记录的访问时间
+        for file_id, atime in list(touched.items()):
+            await session.execute(
+                update(File).where(File.id == file_id).values(atime=atime)
+            )
+            touched.pop(file_id, None)
+        # 补全旧记录的文件大小
+        for path in (
+            await session.scalars(
+                select(File.path)
+                .where(File.path.is_not(None), File.size.is_(None))
+                .distinct()
+            )
+        ).all():
+            size = await storage.size(cast(str, path))
+            await session.execute(
+                update(File).where(File.path == path).values(size=size or 0)
+            )
+        await session.commit()
+
+        # 只有 src_id 的记录无法重新下载，与本地文件一样不能回收
+        local = File.url.is_(None)
+        blobs = (
+            await session.execute(
+                select(
+                    File.path,
+                    func.max(File.size),
+                    func.max(File.atime),
+                    func.sum(case((local, 1), else_=0)),
+                )
+                .where(File.path.is_not(None))
+                .group_by(File.path)
+            )
+        ).all()
+
+    total = sum(size or 0 for _, size, _, _ in blobs)
+    deadline = None if max_age is None else datetime.now() - timedelta(seconds=max_age)
+    candidates = sorted(
+        (
+            (atime or datetime.min, path, size or 0)
+            for path, size, atime, n in blobs
+            if not n
+        ),
+    )
+    freed = 0
+    for atime, path, size in candidates:
+        expired = deadline is not None and atime < deadline
+        if not expired and (quota is None or total - freed <= quota):
+            break
+        async with get_session() as session:
+            # 选出候选后可能有新的记录引用同一内容，更新时再次检查
+            other = aliased(File)
+            result = await session.execute(
+                update(File)
+                .where(
+                    File.path == path,
+                    ~select(other.id)
+                    .where(other.path == path, other.url.is_(None))
+                    .exists(),
+                )
+                .values(path=None)
+            )
+            await session.commit()
+        if not cast(CursorResult, result).rowcount:
+            continue
+        invalidate_files()
+        await delete_blob(path)
+        freed += size
+    return freed
+
+
+async def read_file(file: File, start: int = 0, end: Optional[int] = None) -> bytes:
+    """读取文件内容中 [start, end) 范围内的数据
+
+    内容已被回收时从 url 重新下载
+    """
+    if file.path is not None:
+        try:
+            return await get_blob(file.path, file.size, start, end)
+        except FileNotFoundError:
+            pass
+    if file.url is None:
+        raise DatabaseError("failed", 31001, "file not found", {})
+    async with AsyncClient() as client:
+        response = await client.get(file.url, headers=file.headers)
+    if not response.is_success:
+        raise DatabaseError(
+            "failed", 31001, f"file download failed: {response.status_code}", {}
+        )
+    data = response.content
+    key = await offload(get_sha256, len(data), data)
+    # 内容与记录不一致时不覆盖记录
+    if file.sha256 is not None and key != file.sha256:
+        raise DatabaseError("failed", 31001, "file content changed", {})
+    await put_blob(key, data)
+    async with get_session() as session:
+        await session.execute(
+            update(File)
+            .where(File.id == file.id)
+            .values(path=key, sha256=key, size=len(data))
+        )
+        # 同一内容的其它记录一并恢复
+        await session.execute(
+            update(File)
+            .where(File.sha256 == key, File.path.is_(None))
+            .values(path=key, size=len(data))
+        )
+        await session.commit()
+    invalidate_files()
+    file.path = file.sha256 = key
+    file.size = len(data)
+    return data[start:end]
+
+
+def get_file_url(file: File) -> Optional[str]:
+    """获取由本实现提供的带签名的文件 URL，未配置 obimpl_file_url_base 时返回 None"""
+    if plugin_config.obimpl_file_url_base is None or file.path is None:
+        return None
+    return make_url(
+        plugin_config.obimpl_file_url_base.rstrip("/") + FILE_ROUTE,
+        file_url_secret,
+        file.id.hex,
+        plugin_config.obimpl_file_url_expire,
+    )
+
+
+async def get_local_path(file: File, create: bool = False) -> Optional[str]:
+    """获取文件在本地磁盘上的路径，存储后端不在本地时返回 None
+
+    文件内联保存或内容已被回收时，create 为 True 则先将内容写入本地存储，否则返回 None
+    """
+    key = file.path or file.sha256
+    if key is None or (path := storage.local_path(key)) is None:
+        return None
+    if await AsyncPath(path).exists():
+        return str(path)
+    if not create:
+        return None
+    await storage.put(key, await read_file(file))
+    return str(path)
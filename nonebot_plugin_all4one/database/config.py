@@ -0,0 +1,29 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+
+class Config(BaseModel):
+    obimpl_storage: Literal["local", "s3"] = "local"
+    obimpl_storage_depth: int = 2
+    obimpl_storage_migrate: bool = True
+    obimpl_storage_quota: Optional[int] = None
+    obimpl_storage_max_age: Optional[int] = None
+    obimpl_storage_gc_interval: int = 3600
+    obimpl_storage_inline_threshold: int = 64 * 1024
+    obimpl_storage_inline_cache_size: int = 16 * 1024 * 1024
+    obimpl_url_cache: bool = True
+    obimpl_url_cache_ttl: int = 300
+    obimpl_file_url_base: Optional[str] = None
+    obimpl_file_url_secret: str = ""
+    obimpl_file_url_expire: int = 3600
+    obimpl_file_url_threshold: Optional[int] = None
+    obimpl_s3_endpoint: Optional[str] = None
+    obimpl_s3_bucket: str = ""
+    obimpl_s3_region: str = "us-east-1"
+    obimpl_s3_access_key: str = ""
+    obimpl_s3_secret_key: str = ""
+    obimpl_s3_prefix: str = ""
+
+    class Config:
+        extra = "ignore"
@@ -0,0 +1,357 @@
+import os
+import hmac
+import shutil
+from uuid import uuid4
+from pathlib import Path
+from hashlib import sha256
+from urllib.parse import quote
+from xml.etree import ElementTree
+from typing import Union, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from collections.abc import AsyncIterable, AsyncIterator
+
+from anyio import Path as AsyncPath
+from anyio import open_file, to_thread
+from httpx import Response, AsyncClient
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobCache:
+    """按总字节数限制大小的 LRU 缓存"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.items: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        if (data := self.items.get(key)) is not None:
+            self.items.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.capacity:
+            return
+        self.pop(key)
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.capacity:
+            self.size -= len(self.items.popitem(last=False)[1])
+
+    def pop(self, key: str) -> None:
+        if (data := self.items.pop(key, None)) is not None:
+            self.size -= len(data)
+
+
+class Storage(ABC):
+    """文件内容的存储后端，文件以 key 寻址"""
+
+    @abstractmethod
+    async def put(self, key: str, data: Union[bytes, AsyncIterable[bytes]]) -> None:
+        """写入文件，data 可以是完整的数据或异步的数据块流"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """以数据块流的形式读取文件中 [start, end) 范围内的数据
+
+        文件不存在时抛出 FileNotFoundError
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """获取文件大小，文件不存在时返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """删除文件，文件不存在时不做任何操作"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        return await self.size(key) is not None
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """读取文件中 [start, end) 范围内的数据"""
+        return b"".join([chunk async for chunk in self.get(key, start, end)])
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """获取文件在本地磁盘上的路径，不在本地的存储后端返回 None"""
+        return None
+
+
+class LocalStorage(Storage):
+    """本地磁盘存储
+
+    参数:
+        root: 存储根目录
+        depth: 目录分片层数，每层取 key 的两个字符作为子目录名
+    """
+
+    def __init__(self, root: Path, depth: int = 0):
+        self.root = root
+        self.depth = depth
+
+    def local_path(self, key: str) -> Path:
+        # 兼容以绝对路径保存的旧记录
+        if Path(key).is_absolute():
+            return Path(key)
+        parts = [key[i * 2 : i * 2 + 2] for i in range(self.depth)]
+        return self.root.joinpath(*parts, key)
+
+    async def put(self, key: str, data: Union[bytes, AsyncIterable[bytes]]) -> None:
+        path = AsyncPath(self.local_path(key))
+        await path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写入临时文件再重命名，避免多个进程同时写入同一个文件
+        temp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+        try:
+            async with await open_file(temp_path, "wb") as f:
+                if isinstance(data, bytes):
+                    await f.write(data)
+                else:
+                    async for chunk in data:
+                        await f.write(chunk)
+            await temp_path.replace(path)
+        finally:
+            await temp_path.unlink(missing_ok=True)
+
+    async def get(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        async with await open_file(self.local_path(key), "rb") as f:
+            await f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                if not (chunk := await f.read(size)):
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await AsyncPath(self.local_path(key)).stat()).st_size
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, key: str) -> None:
+        await AsyncPath(self.local_path(key)).unlink(missing_ok=True)
+
+    async def adopt(self, source: Path, key: str) -> bool:
+        """将已有的文件放到 key 对应的位置，不删除原文件
+
+        优先使用硬链接，跨文件系统时复制；返回 key 对应的文件是否存在
+        """
+        return await to_thread.run_sync(self._adopt, source, self.local_path(key))
+
+    @staticmethod
+    def _adopt(source: Path, target: Path) -> bool:
+        if target.exists():
+            return True
+        if not source.exists():
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(f"{target.name}.{uuid4().hex}.tmp")
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+        return True
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode(), sha256).digest()
+
+
+class S3Storage(Storage):
+    """S3 兼容的对象存储，使用路径风格的 URL 与 AWS Signature V4 签名
+
+    写入数据块流时，超过 part_size 的数据使用分段上传
+
+    参数:
+        endpoint: 服务地址，例如 https://s3.us-east-1.amazonaws.com
+        bucket: 存储桶名称
+        region: 区域
+        access_key: 访问密钥 ID
+        secret_key: 访问密钥
+        prefix: 对象 key 的前缀
+        client: 自定义的 HTTP 客户端
+        part_size: 分段上传的分段大小，S3 要求不小于 5 MiB
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        prefix: str = "",
+        client: Optional[AsyncClient] = None,
+        part_size: int = 8 * 1024 * 1024,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix
+        self.client = client or AsyncClient()
+        self.part_size = part_size
+
+    def _sign(
+        self, method: str, path: str, query: str, host: str, payload_hash: str
+    ) -> dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        signed_headers = "host;x-amz-content-sha256;x-amz-date"
+        canonical_request = "\n".join(
+            [
+                method,
+                path,
+                query,
+                f"host:{host}\nx-amz-content-sha256:{payload_hash}\n"
+                f"x-amz-date:{amz_date}\n",
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                scope,
+                sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        key = f"AWS4{self.secret_key}".encode()
+        for msg in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = _hmac(key, msg)
+        signature = hmac.new(key, string_to_sign.encode(), sha256).hexdigest()
+        return {
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+            "Authorization": (
+                f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                f"SignedHeaders={signed_headers}, Signature={signature}"
+            ),
+        }
+
+    async def _request(
+        self,
+        method: str,
+        key: str,
+        params: Optional[dict[str, str]] = None,
+        content: bytes = b"",
+        headers: Optional[dict[str, str]] = None,
+        stream: bool = False,
+    ) -> Response:
+        path = quote(f"/{self.bucket}/{self.prefix}{key}", safe="/-_.~")
+        query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+            for k, v in sorted((params or {}).items())
+        )
+        url = f"{self.endpoint}{path}" + (f"?{query}" if query else "")
+        host = url.split("://", 1)[1].split("/", 1)[0]
+        request = self.client.build_request(
+            method,
+            url,
+            content=content,
+            headers={
+                **(headers or {}),
+                **self._sign(method, path, query, host, sha256(content).hexdigest()),
+            },
+        )
+        return await self.client.send(request, stream=stream)
+
+    async def _put_multipart(
+        self, key: str, first: bytes, chunks: AsyncIterator[bytes]
+    ) -> None:
+        resp = await self._request("POST", key, {"uploads": ""})
+        resp.raise_for_status()
+        upload_id = ElementTree.fromstring(resp.content).findtext(".//{*}UploadId")
+        if not upload_id:
+            raise ValueError("Invalid CreateMultipartUpload response")
+        parts: list[tuple[int, str]] = []
+        try:
+            buffer = first
+            eof = False
+            while not eof or buffer:
+                while not eof and len(buffer) < self.part_size:
+                    try:
+                        buffer += await chunks.__anext__()
+                    except StopAsyncIteration:
+                        eof = True
+                part, buffer = buffer[: self.part_size], buffer[self.part_size :]
+                number = len(parts) + 1
+                resp = await self._request(
+                    "PUT",
+                    key,
+                    {"partNumber": str(number), "uploadId": upload_id},
+                    part,
+                )
+                resp.raise_for_status()
+                parts.append((number, resp.headers.get("ETag", "")))
+            body = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in parts
+            )
+            resp = await self._request(
+                "POST",
+                key,
+                {"uploadId": upload_id},
+                f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode(),
+            )
+            resp.raise_for_status()
+        except BaseException:
+            await self._request("DELETE", key, {"uploadId": upload_id})
+            raise
+
+    async def put(self, key: str, data: Union[bytes, AsyncIterable[bytes]]) -> None:
+        if not isinstance(data, bytes):
+            chunks = data.__aiter__()
+            buffer = b""
+            async for chunk in chunks:
+                buffer += chunk
+                if len(buffer) > self.part_size:
+                    return await self._put_multipart(key, buffer, chunks)
+            data = buffer
+        resp = await self._request("PUT", key, content=data)
+        resp.raise_for_status()
+
+    async def get(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        resp = await self._request("GET", key, headers=headers, stream=True)
+        try:
+            if resp.status_code == 404:
+                raise FileNotFoundError(key)
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    async def size(self, key: str) -> Optional[int]:
+        resp = await self._request("HEAD", key)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return int(resp.headers["Content-Length"])
+
+    async def delete(self, key: str) -> None:
+        resp = await self._request("DELETE", key)
+        if resp.status_code != 404:
+            resp.raise_for_status()
@@ -0,0 +1,62 @@
+import hmac
+from time import time
+from hashlib import sha256
+from typing import Optional
+from urllib.parse import urlencode
+
+
+def sign(secret: str, file_id: str, expires: int) -> str:
+    """计算文件 URL 的签名"""
+    return hmac.new(
+        secret.encode(), f"{file_id}:{expires}".encode(), sha256
+    ).hexdigest()
+
+
+def make_url(base: str, secret: str, file_id: str, expire: int) -> str:
+    """生成带签名、会过期的文件 URL
+
+    参数:
+        base: 文件服务路由的完整地址
+        secret: 签名密钥
+        file_id: 文件 ID
+        expire: 有效期，单位：秒
+    """
+    expires = int(time()) + expire
+    query = urlencode(
+        {"file_id": file_id, "expires": expires, "sig": sign(secret, file_id, expires)}
+    )
+    return f"{base}?{query}"
+
+
+def verify(secret: str, file_id: str, expires: str, sig: str) -> bool:
+    """校验文件 URL 的签名与有效期"""
+    try:
+        if int(expires) < time():
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(sign(secret, file_id, int(expires)), sig)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """解析单个范围的 Range 请求头，返回 [start, end)
+
+    没有 Range 请求头时返回 None，范围无效时抛出 ValueError
+    """
+    if not header:
+        return None
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        raise ValueError("Unsupported range")
+    start, _, end = ranges.strip().partition("-")
+    if not start:
+        # 后缀范围：最后 N 个字节
+        length = int(end)
+        if length <= 0:
+            raise ValueError("Invalid range")
+        return max(size - length, 0), size
+    first = int(start)
+    last = int(end) if end else size - 1
+    if first >= size or last < first:
+        raise ValueError("Invalid range")
+    return first, min(last, size - 1) + 1
@@ -1,14 +1,104 @@
+from copy import deepcopy
+from functools import lru_cache
+from inspect import isawaitable
+from operator import attrgetter
 from abc import ABC, abstractmethod
-from typing import Any, Union, Literal, Optional
+from asyncio import Semaphore, gather
+from datetime import datetime, timezone
+from collections.abc import Callable, Iterable, Awaitable
+from typing import Any, Union, Literal, ClassVar, Optional
 
-from anyio import open_file
+from pydantic import TypeAdapter
+from nonebot import get_plugin_config
 from nonebot.adapters import Bot, Event, Message
 from nonebot.adapters.onebot.v12.event import BotSelf
-from nonebot.adapters.onebot.v12 import UnsupportedAction
-from nonebot.adapters.onebot.v12.exception import BadParam
 from nonebot.adapters.onebot.v12 import Event as OneBotEvent
-
-from ..database import get_file, upload_file
+from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
+from nonebot.adapters.onebot.v12 import Message as OneBotMessage
+from nonebot.adapters.onebot.v12.utils import flattened_to_nested
+from nonebot.adapters.onebot.v12.exception import BadParam, UnsupportedParam
+from nonebot.adapters.onebot.v12 import UnsupportedAction, ActionFailedWithRetcode
+
+from .config import Config
+from .cache import MessageCache, get_message_digest
+from ..database import plugin_config as database_config
+from ..database import (
+    get_local_path,
+    get_file_version,
+)
+from ..database import (
+    get_file,
+    read_file,
+    touch_files,
+    upload_file,
+    get_file_url,
+)
+
+IMPL_NAME = "nonebot-plugin-all4one"
+
+plugin_config = get_plugin_config(Config)
+message_cache = MessageCache(
+    plugin_config.obimpl_message_cache_size, plugin_config.obimpl_message_cache_bytes
+)
+
+
+@lru_cache
+def get_event_model(
+    platform: str, type: str, detail_type: str, sub_type: str
+) -> type[OneBotEvent]:
+    """按 type、detail_type、sub_type 查找最具体的事件模型"""
+    data = {
+        "type": type,
+        "detail_type": detail_type,
+        "sub_type": sub_type,
+        "self": {"platform": platform},
+    }
+    return next(OneBotAdapter.get_event_model(data, IMPL_NAME), OneBotEvent)
+
+
+@lru_cache
+def get_str_fields(model: type[OneBotEvent]) -> frozenset[str]:
+    return frozenset(
+        name for name, field in model.model_fields.items() if field.annotation is str
+    )
+
+
+def build_event(data: dict[str, Any]) -> Optional[OneBotEvent]:
+    """由中间件构造的字段创建 OneBot 事件
+
+    字段来自已经校验过的适配器模型，只做少量类型转换后直接用 model_construct 创建，
+    跳过完整的校验；开启 obimpl_validate_events 时使用 json_to_event 完整校验
+
+    参数:
+        data: 事件字段，self 与 message 可以直接传入模型对象
+    """
+    if plugin_config.obimpl_validate_events:
+        if isinstance(bot_self := data.get("self"), BotSelf):
+            data = {**data, "self": bot_self.model_dump()}
+        return OneBotAdapter.json_to_event(data, IMPL_NAME)
+
+    if any("." in key for key in data):
+        data = flattened_to_nested(data)
+    else:
+        data = dict(data)
+    if isinstance(bot_self := data.get("self"), dict):
+        bot_self = data["self"] = BotSelf(**bot_self)
+    model = get_event_model(
+        bot_self.platform if bot_self else "",
+        data["type"],
+        data.get("detail_type", ""),
+        data.get("sub_type", ""),
+    )
+    if isinstance(time := data.get("time"), (int, float)):
+        data["time"] = datetime.fromtimestamp(time, timezone.utc)
+    if "message" in data:
+        if not isinstance(message := data["message"], OneBotMessage):
+            message = data["message"] = OneBotMessage(message)
+        data["original_message"] = deepcopy(message)
+    for name in get_str_fields(model):
+        if (value := data.get(name)) is not None and not isinstance(value, str):
+            data[name] = str(value)
+    return model.model_construct(**data)
 
 
 def supported_action(func):
@@ -17,19 +107,291 @@ def supported_action(func):
     return func
 
 
+def extended_action(name: str, *requires: str):
+    """标记支持的扩展动作，扩展动作名带有前缀，不能直接作为方法名
+
+    参数:
+        name: 动作名，例如 all4one.broadcast_message
+        requires: 依赖的动作，中间件不支持其中任一动作时扩展动作也不支持
+    """
+
+    def decorator(func):
+        func.__supported__ = True
+        func.__action__ = name
+        func.__requires__ = requires
+        return func
+
+    return decorator
+
+
+EventDict = dict[str, Any]
+Converter = Callable[[Any, Any], Awaitable[Union[EventDict, list[EventDict], None]]]
+
+
+def converter(*event_types: type[Event]):
+    """标记事件转换函数
+
+    转换函数返回 OneBot 事件的字段，或多个事件的字段列表；
+    事件按具体类型分发，没有直接注册的类型沿 MRO 使用最近的父类的转换函数
+
+    参数:
+        event_types: 转换函数处理的适配器事件类型
+    """
+
+    def decorator(func: Converter) -> Converter:
+        func.__converts__ = event_types  # type: ignore
+        return func
+
+    return decorator
+
+
+def to_onebot_segment(*types: str):
+    """标记将平台消息段转换为 OneBot 消息段的函数
+
+    转换函数可以是同步函数或需要解析媒体的异步函数，
+    返回消息段、消息段列表或 None；类型为 "*" 时处理其它未注册的类型
+
+    参数:
+        types: 平台消息段类型
+    """
+
+    def decorator(func):
+        func.__to_onebot__ = types
+        return func
+
+    return decorator
+
+
+def from_onebot_segment(*types: str, cache: bool = True):
+    """标记将 OneBot 消息段转换为平台消息段的函数，用法同 to_onebot_segment
+
+    参数:
+        types: OneBot 消息段类型
+        cache: 转换结果能否缓存，转换有副作用（例如调用平台接口）时必须为 False，
+            含有这些类型的消息每次都重新转换
+    """
+
+    def decorator(func):
+        func.__from_onebot__ = types
+        func.__cache__ = cache
+        return func
+
+    return decorator
+
+
+def get_segment_key(segment: Any) -> Optional[tuple]:
+    """消息段内容的可哈希表示，数据中含有不可哈希的值时返回 None"""
+    key = (segment.type, tuple(sorted(segment.data.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class FieldGetter:
+    """从模型中提取一组字段，模型上不存在的字段会被忽略
+
+    每个模型类型只计算一次存在的字段，并编译为 attrgetter
+
+    参数:
+        names: 字段名
+    """
+
+    def __init__(self, *names: str):
+        self.names = names
+        self.getters: dict[type, tuple[tuple[str, ...], Callable[[Any], Any]]] = {}
+
+    def __call__(self, obj: Any) -> dict[str, Any]:
+        if (getter := self.getters.get(type(obj))) is None:
+            fields = type(obj).model_fields
+            names = tuple(name for name in self.names if name in fields)
+            if len(names) == 1:
+                # 单个字段时 attrgetter 不返回元组
+                get = attrgetter(names[0])
+                getter = (names, lambda obj: (get(obj),))
+            else:
+                getter = (names, attrgetter(*names) if names else lambda obj: ())
+            self.getters[type(obj)] = getter
+        names, get = getter
+        return dict(zip(names, get(obj)))
+
+
 class Middleware(ABC):
+    _converters: ClassVar[dict[type, Converter]] = {}
+    _converter_cache: ClassVar[dict[type, Optional[Converter]]] = {}
+    _to_onebot_segments: ClassVar[dict[str, Callable[..., Any]]] = {}
+    _from_onebot_segments: ClassVar[dict[str, Callable[..., Any]]] = {}
+    _uncached_segments: ClassVar[frozenset[str]] = frozenset()
+    # 只有不能缓存的消息段使用的转换参数，不计入缓存键
+    _uncached_kwargs: ClassVar[frozenset[str]] = frozenset()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        converters = {}
+        to_onebot_segments = {}
+        from_onebot_segments = {}
+        for class_ in reversed(cls.__mro__):
+            for attr in class_.__dict__.values():
+                for event_type in getattr(attr, "__converts__", ()):
+                    converters[event_type] = attr
+                for type_ in getattr(attr, "__to_onebot__", ()):
+                    to_onebot_segments[type_] = attr
+                for type_ in getattr(attr, "__from_onebot__", ()):
+                    from_onebot_segments[type_] = attr
+        cls._converters = converters
+        cls._converter_cache = {}
+        cls._to_onebot_segments = to_onebot_segments
+        cls._from_onebot_segments = from_onebot_segments
+        cls._uncached_segments = frozenset(
+            type_
+            for type_, func in from_onebot_segments.items()
+            if not getattr(func, "__cache__", True)
+        )
+
+    @classmethod
+    def get_converter(cls, event_type: type[Event]) -> Optional[Converter]:
+        """获取事件类型对应的转换函数，查找结果按类型缓存"""
+        try:
+            return cls._converter_cache[event_type]
+        except KeyError:
+            pass
+        converter = next(
+            (
+                cls._converters[class_]
+                for class_ in event_type.__mro__
+                if class_ in cls._converters
+            ),
+            None,
+        )
+        cls._converter_cache[event_type] = converter
+        return converter
+
+    async def _convert_segments(
+        self,
+        table: dict[str, Callable[..., Any]],
+        segments: Iterable[Any],
+        kwargs: dict[str, Any],
+    ) -> list[Any]:
+        """按类型表转换消息段
+
+        异步的转换函数（媒体解析）在整条消息内并发执行，结果保持原有顺序；
+        同一条消息中内容相同的消息段只转换一次
+        """
+        results: list[Any] = []
+        pending: dict[int, Awaitable[Any]] = {}
+        seen: dict[tuple, int] = {}
+        duplicates: list[tuple[int, int]] = []
+        for segment in segments:
+            if (func := table.get(segment.type, table.get("*"))) is None:
+                continue
+            index = len(results)
+            if (key := get_segment_key(segment)) is not None:
+                if (source := seen.get(key)) is not None:
+                    results.append(None)
+                    duplicates.append((index, source))
+                    continue
+                seen[key] = index
+            result = func(self, segment, **kwargs)
+            if isawaitable(result):
+                pending[index] = result
+                result = None
+            results.append(result)
+        if pending:
+            for index, result in zip(pending, await gather(*pending.values())):
+                results[index] = result
+        for index, source in duplicates:
+            results[index] = deepcopy(results[source])
+        converted = []
+        for result in results:
+            if isinstance(result, list):
+                converted.extend(result)
+            elif result is not None:
+                converted.append(result)
+        return converted
+
+    async def convert_to_onebot(
+        self, segments: Iterable[Any], **kwargs: Any
+    ) -> OneBotMessage:
+        """使用 to_onebot_segment 注册的函数将平台消息段转换为 OneBot 消息
+
+        参数:
+            segments: 平台消息段
+            kwargs: 传给转换函数的参数
+        """
+        return OneBotMessage(
+            await self._convert_segments(self._to_onebot_segments, segments, kwargs)
+        )
+
+    async def convert_from_onebot(self, message: Any, **kwargs: Any) -> list[Any]:
+        """使用 from_onebot_segment 注册的函数将 OneBot 消息转换为平台消息段
+
+        转换结果（包括已经解析的文件）按消息内容、平台、机器人与参数缓存，
+        重复发送相同的消息时跳过校验与转换；含有不能缓存的消息段的消息不缓存，
+        _uncached_kwargs 中的参数只有这些消息段使用，不计入缓存键
+
+        参数:
+            message: OneBot 消息，可以是未经校验的原始数据
+            kwargs: 传给转换函数的参数
+        """
+        key = (
+            self.get_name(),
+            self.self_id,
+            get_message_digest(message),
+            repr(
+                sorted(
+                    (name, value)
+                    for name, value in kwargs.items()
+                    if name not in self._uncached_kwargs
+                )
+            ),
+        )
+        version = get_file_version()
+        if (cached := message_cache.get(key, version)) is not None:
+            segments, file_ids = cached
+            # 命中时没有经过 get_file，需要单独更新文件的访问时间
+            touch_files(file_ids)
+            return segments
+        if not isinstance(message, OneBotMessage):
+            message = TypeAdapter(OneBotMessage).validate_python(message)
+        segments = await self._convert_segments(
+            self._from_onebot_segments, message, kwargs
+        )
+        if not any(segment.type in self._uncached_segments for segment in message):
+            file_ids = tuple(
+                segment.data["file_id"]
+                for segment in message
+                if "file_id" in segment.data
+            )
+            message_cache.put(key, version, segments, file_ids)
+        return segments
+
+    def _invalidate_converted(self, file_id: str) -> None:
+        """移除消息缓存中引用了指定文件的转换结果"""
+        message_cache.invalidate_file(file_id)
+
     def __init__(self, bot: Bot):
         self.bot = bot
-        self._supported_actions = self._get_supported_actions()
+        self._actions = self._get_supported_actions()
+        self._supported_actions = list(self._actions)
 
-    def _get_supported_actions(self) -> list[str]:
-        """获取支持的动作列表"""
-        supported_actions = set()
+    def _get_supported_actions(self) -> dict[str, str]:
+        """获取支持的动作名到方法名的映射"""
+        supported_actions = {}
         for class_ in self.__class__.__mro__:
             for name, attr in class_.__dict__.items():
                 if not name.startswith("_") and getattr(attr, "__supported__", False):
-                    supported_actions.add(name)
-        return list(supported_actions)
+                    supported_actions.setdefault(
+                        getattr(attr, "__action__", name), name
+                    )
+        return {
+            action: name
+            for action, name in supported_actions.items()
+            if all(
+                required in supported_actions
+                for required in getattr(getattr(self, name), "__requires__", ())
+            )
+        }
 
     @supported_action
     async def get_supported_actions(self, **kwargs: Any) -> list[str]:
@@ -48,7 +410,7 @@ class Middleware(ABC):
                 data={},
                 message=f"不支持动作请求 {api}",
             )
-        return await getattr(self, api)(**kwargs)
+        return await getattr(self, self._actions[api])(**kwargs)
 
     @property
     def self_id(self) -> str:
@@ -74,9 +436,18 @@ class Middleware(ABC):
     def get_platform(self) -> str:
         raise NotImplementedError
 
-    @abstractmethod
     async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
-        raise NotImplementedError
+        """将适配器事件分发给注册的转换函数，没有对应转换函数的事件被忽略"""
+        if (convert := self.get_converter(type(event))) is None:
+            return []
+        data = await convert(self, event)
+        if data is None:
+            return []
+        return [
+            event_out
+            for event_dict in (data if isinstance(data, list) else [data])
+            if (event_out := build_event(event_dict))
+        ]
 
     @supported_action
     async def get_supported_message_segments(self, **kwargs: Any) -> list[str]:
@@ -111,6 +482,57 @@ class Middleware(ABC):
         """
         raise NotImplementedError
 
+    @extended_action("all4one.broadcast_message", "send_message")
+    async def broadcast_message(
+        self,
+        *,
+        targets: list[dict[str, Any]],
+        message: Message,
+        concurrency: Optional[int] = None,
+        **kwargs: Any,
+    ) -> list[dict[str, Any]]:
+        """向多个目标发送同一条消息
+
+        第一个目标单独发送，消息的转换结果与上传的文件随后被其余目标复用；
+        其余目标并发发送，单个目标失败不影响其他目标
+
+        参数:
+            targets: 目标列表，每个目标包含 send_message 的 detail_type 与对应的 ID
+            message: 消息内容
+            concurrency: 同时发送的数量上限，默认为 obimpl_broadcast_concurrency
+            kwargs: 传给 send_message 的扩展字段
+        """
+        if not isinstance(message, OneBotMessage):
+            message = TypeAdapter(OneBotMessage).validate_python(message)
+        semaphore = Semaphore(concurrency or plugin_config.obimpl_broadcast_concurrency)
+
+        async def send(target: dict[str, Any]) -> dict[str, Any]:
+            async with semaphore:
+                try:
+                    data = await self.send_message(
+                        **{**kwargs, **target}, message=message
+                    )
+                except ActionFailedWithRetcode as e:
+                    return {
+                        "status": "failed",
+                        "retcode": e.retcode,
+                        "data": e.data,
+                        "message": e.message,
+                    }
+                except Exception as e:
+                    return {
+                        "status": "failed",
+                        "retcode": 20002,
+                        "data": None,
+                        "message": str(e),
+                    }
+            return {"status": "ok", "retcode": 0, "data": data, "message": ""}
+
+        if not targets:
+            return []
+        first = await send(targets[0])
+        return [first, *await gather(*(send(target) for target in targets[1:]))]
+
     async def delete_message(self, *, message_id: str, **kwargs: Any) -> None:
         """撤回消息
 
@@ -476,13 +898,33 @@ class Middleware(ABC):
             kwargs: 扩展字段
         """
         file = await get_file(file_id=file_id)
+        # 本地保存的文件优先返回由本实现提供的 URL，不暴露平台的 URL 与请求头
         if type == "url":
-            result = {"url": file.url, "headers": file.headers}
+            if url := get_file_url(file):
+                result = {"url": url, "headers": {}}
+            else:
+                result = {"url": file.url, "headers": file.headers}
         elif type == "path":
-            result = {"path": file.path}
-        elif type == "data" and file.path:
-            async with await open_file(file.path, "rb") as f:
-                result = {"data": await f.read()}
+            # 内联保存或已回收的文件按需写入本地存储
+            if (path := await get_local_path(file, create=True)) is None:
+                raise UnsupportedParam(
+                    status="failed",
+                    retcode=10004,
+                    message="storage backend does not support path",
+                    data={},
+                )
+            result = {"path": path}
+        elif type == "data" and (file.path or file.url):
+            # 超过阈值的大文件以 URL 代替数据返回
+            threshold = database_config.obimpl_file_url_threshold
+            if (
+                threshold is not None
+                and (file.size or 0) > threshold
+                and (url := get_file_url(file))
+            ):
+                result = {"url": url, "headers": {}}
+            else:
+                result = {"data": await read_file(file)}
         else:
             raise BadParam(
                 status="failed",
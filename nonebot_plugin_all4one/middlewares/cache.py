@@ -0,0 +1,102 @@
+import json
+from copy import deepcopy
+from hashlib import sha256
+from typing import Any, Optional
+from collections import OrderedDict
+
+from pydantic import BaseModel
+from nonebot.adapters.onebot.v12 import MessageSegment as OneBotMessageSegment
+
+
+def get_message_digest(message: Any) -> str:
+    """OneBot 消息内容的哈希，校验前的原始消息与校验后的 Message 结果相同"""
+    if isinstance(message, list):
+        message = [
+            (
+                {"type": segment.type, "data": segment.data}
+                if isinstance(segment, OneBotMessageSegment)
+                else segment
+            )
+            for segment in message
+        ]
+    return sha256(
+        json.dumps(message, sort_keys=True, default=repr, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def get_payload_size(value: Any) -> int:
+    """消息段中携带的内容的大小
+
+    递归统计嵌套的字典、列表、模型中的 bytes 与 str，
+    包括 base64:// 形式的文件与 Discord 的 File(content=...) 等
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(get_payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(get_payload_size(item) for item in value)
+    if isinstance(value, BaseModel):
+        return sum(get_payload_size(item) for item in value.__dict__.values())
+    # 各适配器的 MessageSegment 将内容保存在 data 中
+    if isinstance(data := getattr(value, "data", None), dict):
+        return get_payload_size(data)
+    return 0
+
+
+class MessageCache:
+    """转换后的平台消息段的 LRU 缓存，按条目数与携带的内容的总大小限制
+
+    条目记录转换开始时的文件版本，文件记录变化后失效；
+    同时记录消息引用的文件 ID，命中时据此更新文件的访问时间
+
+    参数:
+        max_entries: 最大条目数
+        max_bytes: 携带的内容的总大小上限
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items: OrderedDict[Any, tuple[int, list[Any], int, tuple[str, ...]]] = (
+            OrderedDict()
+        )
+
+    def get(
+        self, key: Any, version: int
+    ) -> Optional[tuple[list[Any], tuple[str, ...]]]:
+        """获取缓存的消息段的副本与消息引用的文件 ID"""
+        if (item := self.items.get(key)) is None:
+            return None
+        if item[0] != version:
+            self.pop(key)
+            return None
+        self.items.move_to_end(key)
+        return deepcopy(item[1]), item[3]
+
+    def put(
+        self,
+        key: Any,
+        version: int,
+        segments: list[Any],
+        file_ids: tuple[str, ...] = (),
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        if (size := get_payload_size(segments)) > self.max_bytes:
+            return
+        self.pop(key)
+        self.items[key] = (version, deepcopy(segments), size, file_ids)
+        self.size += size
+        while len(self.items) > self.max_entries or self.size > self.max_bytes:
+            self.size -= self.items.popitem(last=False)[1][2]
+
+    def invalidate_file(self, file_id: str) -> None:
+        """移除引用了指定文件的条目"""
+        for key in [key for key, item in self.items.items() if file_id in item[3]]:
+            self.pop(key)
+
+    def pop(self, key: Any) -> None:
+        if (item := self.items.pop(key, None)) is not None:
+            self.size -= item[2]
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class Config(BaseModel):
+    obimpl_validate_events: bool = False
+    obimpl_message_cache_size: int = 256
+    obimpl_message_cache_bytes: int = 32 * 1024 * 1024
+    obimpl_broadcast_concurrency: int = 4
+
+    class Config:
+        extra = "ignore"
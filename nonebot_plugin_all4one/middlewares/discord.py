@@ -1,14 +1,11 @@
+from asyncio import gather
 from typing import Any, Union, Literal, Optional
 
-from anyio import open_file
-from pydantic import TypeAdapter
-from nonebot.adapters.onebot.v12 import Event as OneBotEvent
-from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
+from nonebot.adapters.discord.api import Attachment
 from nonebot.adapters.onebot.v12 import Message as OneBotMessage
 from nonebot.adapters.onebot.v12 import MessageSegment as OneBotMessageSegment
 from nonebot.adapters.discord import (
     Bot,
-    Event,
     Adapter,
     Message,
     MessageEvent,
@@ -17,9 +14,10 @@ from nonebot.adapters.discord import (
     DirectMessageCreateEvent,
 )
 
-from .base import supported_action
-from ..database import get_file, upload_file
+from .base import EventDict
 from .base import Middleware as BaseMiddleware
+from ..database import get_file, read_file, upload_file
+from .base import converter, supported_action, to_onebot_segment, from_onebot_segment
 
 
 class Middleware(BaseMiddleware):
@@ -32,39 +30,38 @@ class Middleware(BaseMiddleware):
     def get_platform(self):
         return "discord"
 
-    async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
-        event_dict = {}
-        if (type := event.get_type()) not in ["message", "notice", "request"]:
-            return []
-        event_dict["type"] = type
-        event_dict["self"] = (await self.get_bot_self()).model_dump()
-        if isinstance(event, MessageEvent):
-            event_dict["id"] = str(event.id)
-            event_dict["time"] = event.timestamp
-            event_dict["sub_type"] = ""
-            event_dict["message_id"] = str(event.message_id)
-            event_dict["message"] = await self.to_onebot_message(event)
-            event_dict["alt_message"] = str(event.original_message)
-            event_dict["user_id"] = event.get_user_id()
-            if isinstance(event, GuildMessageCreateEvent):
-                event_dict["detail_type"] = "channel"
-                event_dict["guild_id"] = str(event.guild_id)
-                event_dict["channel_id"] = str(event.channel_id)
-            elif isinstance(event, DirectMessageCreateEvent):
-                event_dict["detail_type"] = "private"
-            if event.reply:
-                event_dict["message"].insert(
-                    0,
-                    OneBotMessageSegment.reply(
-                        str(event.reply.id), user_id=str(event.reply.author.id)
-                    ),
-                )
-
-        if event_out := OneBotAdapter.json_to_event(
-            event_dict, "nonebot-plugin-all4one"
-        ):
-            return [event_out]
-        return []
+    async def _message_event(self, event: MessageEvent, detail_type: str) -> EventDict:
+        event_dict = {
+            "id": str(event.id),
+            "type": event.get_type(),
+            "detail_type": detail_type,
+            "sub_type": "",
+            "self": await self.get_bot_self(),
+            "time": event.timestamp,
+            "message_id": str(event.message_id),
+            "message": await self.to_onebot_message(event),
+            "alt_message": str(event.original_message),
+            "user_id": event.get_user_id(),
+        }
+        if event.reply:
+            event_dict["message"].insert(
+                0,
+                OneBotMessageSegment.reply(
+                    str(event.reply.id), user_id=str(event.reply.author.id)
+                ),
+            )
+        return event_dict
+
+    @converter(GuildMessageCreateEvent)
+    async def _guild_message_event(self, event: GuildMessageCreateEvent) -> EventDict:
+        event_dict = await self._message_event(event, "channel")
+        event_dict["guild_id"] = str(event.guild_id)
+        event_dict["channel_id"] = str(event.channel_id)
+        return event_dict
+
+    @converter(DirectMessageCreateEvent)
+    async def _direct_message_event(self, event: DirectMessageCreateEvent) -> EventDict:
+        return await self._message_event(event, "private")
 
     async def get_supported_message_segments(self, **kwargs: Any) -> list[str]:
         return [
@@ -77,26 +74,55 @@ class Middleware(BaseMiddleware):
         ]
 
     async def to_onebot_message(self, event: MessageEvent) -> OneBotMessage:
-        message_list = []
-        for segment in event.original_message:
-            if segment.type == "text":
-                message_list.append(OneBotMessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention_user":
-                message_list.append(
-                    OneBotMessageSegment.mention(segment.data["user_id"])
-                )
-        for attachment in event.attachments:
-            file_id = await upload_file(
-                attachment.filename, self.get_name(), attachment.id, url=attachment.url
-            )
-            if attachment.content_type.startswith("image"):
-                message_list.append(OneBotMessageSegment.image(file_id))
-            else:
-                message_list.append(OneBotMessageSegment.file(file_id))
+        message_list = await self.convert_to_onebot(event.original_message)
+        message_list.extend(
+            await gather(*(self._attachment_to_onebot(a) for a in event.attachments))
+        )
         if event.original_message.count("mention_everyone"):
             message_list.append(OneBotMessageSegment.mention_all())
+        return message_list
+
+    @to_onebot_segment("text")
+    def _text_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        return OneBotMessageSegment.text(segment.data["text"])
+
+    @to_onebot_segment("mention_user")
+    def _mention_user_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        return OneBotMessageSegment.mention(segment.data["user_id"])
+
+    async def _attachment_to_onebot(
+        self, attachment: Attachment
+    ) -> OneBotMessageSegment:
+        file_id = await upload_file(
+            attachment.filename, self.get_name(), attachment.id, url=attachment.url
+        )
+        if attachment.content_type.startswith("image"):
+            return OneBotMessageSegment.image(file_id)
+        return OneBotMessageSegment.file(file_id)
+
+    @from_onebot_segment("text")
+    def _text_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.text(segment.data["text"])
+
+    @from_onebot_segment("mention")
+    def _mention_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.mention_user(int(segment.data["user_id"]))
+
+    @from_onebot_segment("mention_all")
+    def _mention_all_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.mention_everyone()
+
+    @from_onebot_segment("reply")
+    def _reply_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.reference(int(segment.data["message_id"]))
 
-        return OneBotMessage(message_list)
+    @from_onebot_segment("image", "file")
+    async def _file_from_onebot(
+        self, segment: OneBotMessageSegment
+    ) -> Optional[MessageSegment]:
+        file = await get_file(segment.data["file_id"], self.get_name())
+        if file.path or file.url:
+            return MessageSegment.attachment(file.name, content=await read_file(file))
 
     @supported_action
     async def send_message(
@@ -118,29 +144,7 @@ class Middleware(BaseMiddleware):
             chat_id = channel_id
         chat_id = str(chat_id)
 
-        message_list = []
-        message = TypeAdapter(OneBotMessage).validate_python(message)
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(MessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention":
-                message_list.append(
-                    MessageSegment.mention_user(int(segment.data["user_id"]))
-                )
-            elif segment.type == "mention_all":
-                message_list.append(MessageSegment.mention_everyone())
-            elif segment.type == "reply":
-                message_list.append(
-                    MessageSegment.reference(int(segment.data["message_id"]))
-                )
-            elif segment.type in ("image", "file"):
-                file = await get_file(segment.data["file_id"], self.get_name())
-                if file.path:
-                    async with await open_file(file.path, "rb") as f:
-                        data = await f.read()
-                    message_list.append(
-                        MessageSegment.attachment(file.name, content=data)
-                    )
+        message_list = await self.convert_from_onebot(message)
         discord_message = Message(message_list)
         result = await self.bot.send_to(int(chat_id), discord_message)
         return {
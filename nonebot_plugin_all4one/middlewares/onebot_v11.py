@@ -1,18 +1,15 @@
 import uuid
+from asyncio import gather
 from datetime import datetime
 from typing import Any, Union, Literal, Optional
 
-from anyio import open_file
 from pydantic import TypeAdapter
-from nonebot.adapters.onebot.v12 import Event as OneBotEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment
 from nonebot.adapters.onebot.v12 import ActionFailedWithRetcode
-from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
 from nonebot.adapters.onebot.v12 import Message as OneBotMessage
 from nonebot.adapters.onebot.v12 import MessageSegment as OneBotMessageSegment
 from nonebot.adapters.onebot.v11 import Bot, Event, Adapter, Message, ActionFailed
 from nonebot.adapters.onebot.v11.event import (
-    MetaEvent,
     NoticeEvent,
     MessageEvent,
     RequestEvent,
@@ -23,9 +20,18 @@ from nonebot.adapters.onebot.v11.event import (
     GroupIncreaseNoticeEvent,
 )
 
-from .base import supported_action
-from ..database import get_file, upload_file
+from .base import (
+    EventDict,
+)
 from .base import Middleware as BaseMiddleware
+from ..database import get_file, read_file, upload_file
+from .base import (
+    FieldGetter,
+    converter,
+    supported_action,
+    to_onebot_segment,
+    from_onebot_segment,
+)
 
 
 class Middleware(BaseMiddleware):
@@ -49,73 +55,86 @@ class Middleware(BaseMiddleware):
     def get_platform(self):
         return "qq"
 
-    async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
-        should_be_str = (
-            "message_id",
-            "user_id",
-            "operator_id",
-            "group_id",
-            "guild_id",
-            "channel_id",
-        )
-        good_to_be_ob12 = ("time", "sub_type")
-        event_dict = event.model_dump(include=set(good_to_be_ob12))
-        event_dict.update(
-            {k: str(v) for k, v in event.model_dump(include=set(should_be_str)).items()}
-        )
+    _fields = FieldGetter("time", "sub_type")
+    _str_fields = FieldGetter(
+        "message_id",
+        "user_id",
+        "operator_id",
+        "group_id",
+        "guild_id",
+        "channel_id",
+    )
+
+    async def _to_event_dict(self, event: Event, detail_type: str) -> EventDict:
+        event_dict = self._fields(event)
+        event_dict.update({k: str(v) for k, v in self._str_fields(event).items()})
         event_dict["id"] = uuid.uuid4().hex
         event_dict["type"] = event.post_type
-        if isinstance(event, MetaEvent):
-            return []
-        event_dict["self"] = (await self.get_bot_self()).model_dump()
-        if isinstance(event, MessageEvent):
-            event_dict["detail_type"] = event.message_type
-            event_dict["message"] = await self.to_onebot_message(event.original_message)
-            if event.reply:
-                event_dict["message"].insert(
-                    0,
-                    OneBotMessageSegment.reply(
-                        str(event.reply.message_id),
-                        user_id=str(event.reply.sender.user_id),
-                    ),
-                )
-            event_dict["alt_message"] = event.raw_message
-        elif isinstance(event, NoticeEvent):
-            if isinstance(event, FriendRecallNoticeEvent):
-                event_dict["detail_type"] = "private_message_delete"
-            elif isinstance(event, FriendAddNoticeEvent):
-                event_dict["detail_type"] = "friend_increase"
-            elif isinstance(event, GroupIncreaseNoticeEvent):
-                event_dict["detail_type"] = "group_member_increase"
-                if event.sub_type == "approve" or not event.sub_type:
-                    event_dict["sub_type"] = "join"
-                elif event.sub_type == "invite":
-                    event_dict["sub_type"] = "invite"
-                else:
-                    event_dict["sub_type"] = f"{event.sub_type}"
-            elif isinstance(event, GroupDecreaseNoticeEvent):
-                event_dict["detail_type"] = "group_member_decrease"
-                if event.sub_type == "leave":
-                    event_dict["sub_type"] = "leave"
-                elif event.sub_type in ("kick", "kick_me"):
-                    event_dict["sub_type"] = "kick"
-                else:
-                    event_dict["sub_type"] = f"{event.sub_type}"
-            elif isinstance(event, GroupRecallNoticeEvent):
-                event_dict["detail_type"] = "group_message_delete"
-                event_dict["sub_type"] = (
-                    "recall" if event.user_id == event.operator_id else "delete"
-                )
-            else:
-                event_dict["detail_type"] = f"{event.notice_type}"
-        elif isinstance(event, RequestEvent):
-            event_dict["detail_type"] = f"{event.request_type}"
+        event_dict["detail_type"] = detail_type
+        event_dict["self"] = await self.get_bot_self()
         event_dict.setdefault("sub_type", "")
-        if event_out := OneBotAdapter.json_to_event(
-            event_dict, "nonebot-plugin-all4one"
-        ):
-            return [event_out]
-        return []
+        return event_dict
+
+    @converter(MessageEvent)
+    async def _message_event(self, event: MessageEvent) -> EventDict:
+        event_dict = await self._to_event_dict(event, event.message_type)
+        event_dict["message"] = await self.to_onebot_message(event.original_message)
+        if event.reply:
+            event_dict["message"].insert(
+                0,
+                OneBotMessageSegment.reply(
+                    str(event.reply.message_id),
+                    user_id=str(event.reply.sender.user_id),
+                ),
+            )
+        event_dict["alt_message"] = event.raw_message
+        return event_dict
+
+    @converter(NoticeEvent)
+    async def _notice_event(self, event: NoticeEvent) -> EventDict:
+        return await self._to_event_dict(event, event.notice_type)
+
+    @converter(FriendRecallNoticeEvent)
+    async def _friend_recall_event(self, event: FriendRecallNoticeEvent) -> EventDict:
+        return await self._to_event_dict(event, "private_message_delete")
+
+    @converter(FriendAddNoticeEvent)
+    async def _friend_add_event(self, event: FriendAddNoticeEvent) -> EventDict:
+        return await self._to_event_dict(event, "friend_increase")
+
+    @converter(GroupIncreaseNoticeEvent)
+    async def _group_increase_event(self, event: GroupIncreaseNoticeEvent) -> EventDict:
+        event_dict = await self._to_event_dict(event, "group_member_increase")
+        if event.sub_type == "approve" or not event.sub_type:
+            event_dict["sub_type"] = "join"
+        elif event.sub_type == "invite":
+            event_dict["sub_type"] = "invite"
+        else:
+            event_dict["sub_type"] = f"{event.sub_type}"
+        return event_dict
+
+    @converter(GroupDecreaseNoticeEvent)
+    async def _group_decrease_event(self, event: GroupDecreaseNoticeEvent) -> EventDict:
+        event_dict = await self._to_event_dict(event, "group_member_decrease")
+        if event.sub_type == "leave":
+            event_dict["sub_type"] = "leave"
+        elif event.sub_type in ("kick", "kick_me"):
+            event_dict["sub_type"] = "kick"
+        else:
+            event_dict["sub_type"] = f"{event.sub_type}"
+        return event_dict
+
+    @converter(GroupRecallNoticeEvent)
+    async def _group_recall_event(self, event: GroupRecallNoticeEvent) -> EventDict:
+        event_dict = await self._to_event_dict(event, "group_message_delete")
+        event_dict["sub_type"] = (
+            "recall" if event.user_id == event.operator_id else "delete"
+        )
+        return event_dict
+
+    @converter(RequestEvent)
+    async def _request_event(self, event: RequestEvent) -> EventDict:
+        return await self._to_event_dict(event, event.request_type)
 
     async def get_supported_message_segments(self, **kwargs: Any) -> list[str]:
         return [
@@ -129,101 +148,114 @@ class Middleware(BaseMiddleware):
         ]
 
     async def to_onebot_message(self, message: Message) -> OneBotMessage:
-        message_list = []
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(OneBotMessageSegment.text(segment.data["text"]))
-            elif segment.type == "at":
-                qq = segment.data["qq"]
-                if qq == "all":
-                    message_list.append(OneBotMessageSegment.mention_all())
-                    continue
-                message_list.append(OneBotMessageSegment.mention(qq))
-            elif segment.type == "image":
-                file_id = await upload_file(
-                    src=self.get_name(),
-                    src_id=segment.data["file"],
-                    url=segment.data["url"],
-                )
-                message_list.append(OneBotMessageSegment.image(file_id))
-            elif segment.type == "forward":
-                resp = await self.bot.get_forward_msg(id=segment.data["id"])
-                nodes = []
-                for node in resp["message"]:
-                    node_message = (
-                        TypeAdapter(Message)
-                        .validate_python(node["data"]["content"])
-                        .exclude("forward")
-                    )
-                    if not node_message:
-                        continue
-                    nodes.append(
-                        {
-                            "user_id": node["data"]["user_id"],
-                            "user_name": node["data"]["nickname"],
-                            "message": await self.to_onebot_message(
-                                message=node_message
-                            ),
-                        }
-                    )
-                message_list.append(
-                    OneBotMessageSegment("message_nodes", {"nodes": nodes})
-                )
-        return OneBotMessage(message_list)
+        return await self.convert_to_onebot(message)
+
+    @to_onebot_segment("text")
+    def _text_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        return OneBotMessageSegment.text(segment.data["text"])
+
+    @to_onebot_segment("at")
+    def _at_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        if (qq := segment.data["qq"]) == "all":
+            return OneBotMessageSegment.mention_all()
+        return OneBotMessageSegment.mention(qq)
+
+    @to_onebot_segment("image")
+    async def _image_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        file_id = await upload_file(
+            src=self.get_name(),
+            src_id=segment.data["file"],
+            url=segment.data["url"],
+        )
+        return OneBotMessageSegment.image(file_id)
+
+    @to_onebot_segment("forward")
+    async def _forward_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        resp = await self.bot.get_forward_msg(id=segment.data["id"])
+
+        async def to_node(node: dict[str, Any]) -> Optional[dict[str, Any]]:
+            node_message = (
+                TypeAdapter(Message)
+                .validate_python(node["data"]["content"])
+                .exclude("forward")
+            )
+            if not node_message:
+                return None
+            return {
+                "user_id": node["data"]["user_id"],
+                "user_name": node["data"]["nickname"],
+                "message": await self.to_onebot_message(message=node_message),
+            }
+
+        nodes = await gather(*(to_node(node) for node in resp["message"]))
+        return OneBotMessageSegment(
+            "message_nodes", {"nodes": [node for node in nodes if node]}
+        )
 
     async def from_onebot_message(self, message: OneBotMessage) -> Message:
-        message_list = []
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(MessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention":
-                message_list.append(MessageSegment.at(segment.data["user_id"]))
-            elif segment.type == "mention_all":
-                message_list.append(MessageSegment.at("all"))
-            elif segment.type == "image":
-                file = await get_file(segment.data["file_id"], self.get_name())
-                if file.src_id:
-                    message_list.append(MessageSegment.image(file.src_id))
-                elif file.path:
-                    async with await open_file(file.path, "rb") as f:
-                        data = await f.read()
-                    message_list.append(MessageSegment.image(data))
-            elif segment.type == "video":
-                file = await get_file(segment.data["file_id"], self.get_name())
-                if file.src_id:
-                    message_list.append(MessageSegment.video(file.src_id))
-                elif file.url:
-                    message_list.append(MessageSegment.video(file.url))
-            elif segment.type == "voice":
-                file = await get_file(segment.data["file_id"], self.get_name())
-                if file.src_id:
-                    message_list.append(MessageSegment.record(file.src_id))
-                elif file.path:
-                    async with await open_file(file.path, "rb") as f:
-                        data = await f.read()
-                    message_list.append(MessageSegment.record(data))
-            elif segment.type == "reply":
-                message_list.append(MessageSegment.reply(segment.data["message_id"]))
-            elif segment.type == "message_nodes":
-                nodes = []
-                for node in segment.data["nodes"]:
-                    nodes.append(
-                        MessageSegment(
-                            "node",
-                            {
-                                "name": node["user_name"],
-                                "uin": node["user_id"],
-                                "content": await self.from_onebot_message(
-                                    message=TypeAdapter(OneBotMessage).validate_python(
-                                        node["message"]
-                                    )
-                                ),
-                            },
+        return Message(await self.convert_from_onebot(message))
+
+    @from_onebot_segment("text")
+    def _text_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.text(segment.data["text"])
+
+    @from_onebot_segment("mention")
+    def _mention_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.at(segment.data["user_id"])
+
+    @from_onebot_segment("mention_all")
+    def _mention_all_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.at("all")
+
+    @from_onebot_segment("image", "voice")
+    async def _media_from_onebot(
+        self, segment: OneBotMessageSegment
+    ) -> Optional[MessageSegment]:
+        build = (
+            MessageSegment.image if segment.type == "image" else MessageSegment.record
+        )
+        file = await get_file(segment.data["file_id"], self.get_name())
+        if file.src_id:
+            return build(file.src_id)
+        elif file.path or file.url:
+            return build(await read_file(file))
+
+    @from_onebot_segment("video")
+    async def _video_from_onebot(
+        self, segment: OneBotMessageSegment
+    ) -> Optional[MessageSegment]:
+        file = await get_file(segment.data["file_id"], self.get_name())
+        if file.src_id:
+            return MessageSegment.video(file.src_id)
+        elif file.url:
+            return MessageSegment.video(file.url)
+
+    @from_onebot_segment("reply")
+    def _reply_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.reply(segment.data["message_id"])
+
+    # 转换时调用 send_forward_msg，不能缓存
+    @from_onebot_segment("message_nodes", cache=False)
+    async def _message_nodes_from_onebot(
+        self, segment: OneBotMessageSegment
+    ) -> MessageSegment:
+        async def to_node(node: dict[str, Any]) -> MessageSegment:
+            return MessageSegment(
+                "node",
+                {
+                    "name": node["user_name"],
+                    "uin": node["user_id"],
+                    "content": await self.from_onebot_message(
+                        message=TypeAdapter(OneBotMessage).validate_python(
+                            node["message"]
                         )
-                    )
-                resp = await self.bot.send_forward_msg(meesages=nodes)
-                message_list.append(MessageSegment.forward(resp["resid"]))
-        return Message(message_list)
+                    ),
+                },
+            )
+
+        nodes = await gather(*(to_node(node) for node in segment.data["nodes"]))
+        resp = await self.bot.send_forward_msg(meesages=nodes)
+        return MessageSegment.forward(resp["resid"])
 
     @supported_action
     async def send_message(
@@ -237,7 +269,6 @@ class Middleware(BaseMiddleware):
         message: OneBotMessage,
         **kwargs: Any,
     ) -> dict[Union[Literal["message_id", "time"], str], Any]:
-        message = TypeAdapter(OneBotMessage).validate_python(message)
         if group_id:
             result = await self.bot.send_msg(
                 group_id=int(group_id), message=await self.from_onebot_message(message)
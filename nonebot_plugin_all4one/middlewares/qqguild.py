@@ -1,14 +1,11 @@
 from uuid import uuid4
-from pathlib import Path
 from datetime import datetime
-from typing import Any, Union, Literal, Optional
+from typing import Any, Union, Literal, Optional, cast
 
 from nonebot import logger
-from anyio import open_file
 from pydantic import TypeAdapter
 import nonebot.adapters.onebot.v12.exception as ob_exception
 from nonebot.adapters.onebot.v12 import Event as OneBotEvent
-from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
 from nonebot.adapters.onebot.v12 import Message as OneBotMessage
 from nonebot.adapters.qqguild.api import Guild, Member, MessageReference
 from nonebot.adapters.qqguild.exception import ActionFailed, AuditException
@@ -31,9 +28,10 @@ from nonebot.adapters.qqguild import (
     DirectMessageCreateEvent,
 )
 
-from .base import supported_action
-from ..database import get_file, upload_file
+from .base import EventDict
 from .base import Middleware as BaseMiddleware
+from ..database import get_file, read_file, upload_file
+from .base import converter, supported_action, to_onebot_segment, from_onebot_segment
 
 
 class Middleware(BaseMiddleware):
@@ -78,89 +76,109 @@ class Middleware(BaseMiddleware):
     def get_platform(self):
         return "qqguild"
 
-    async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
-        event_dict = {}
-        if (type := event.get_type()) not in ["message", "notice", "request"]:
-            return []
-        event_dict["type"] = type
-        event_dict["self"] = self.get_bot_self().model_dump()
-        event_dict["sub_type"] = ""
-        if isinstance(event, MessageEvent):
-            event_dict["id"] = event.id
-            event_dict["time"] = (
-                event.timestamp.timestamp()
-                if event.timestamp
-                else datetime.now().timestamp()
-            )
-            event_dict["message_id"] = self._to_ob_message_id(
-                message_id=event.id,
-                guild_id=event.guild_id,
-                channel_id=event.channel_id,
-            )
-            event_dict["message"] = await self.to_onebot_message(event)
-            event_dict["alt_message"] = str(event.get_message())
-            # 扩展 author, member 信息
-            event_dict["qqguild.author"] = (
-                event.author.model_dump() if event.author else {}
-            )
-            event_dict["qqguild.member"] = (
-                event.member.model_dump() if event.member else {}
-            )
-            if isinstance(event, DirectMessageCreateEvent):
-                event_dict["detail_type"] = "private"
-                event_dict["user_id"] = event.get_user_id()
-                # 发送私信还需要临时频道 id
-                event_dict["qqguild.guild_id"] = str(event.guild_id)
-                # 原频道 id
-                event_dict["qqguild.src_guild_id"] = event.src_guild_id
-            # MessageCreateEvent, AtMessageCreateEvent
-            else:
-                event_dict["detail_type"] = "channel"
-                event_dict["guild_id"] = event.guild_id
-                event_dict["channel_id"] = event.channel_id
-                event_dict["user_id"] = event.get_user_id()
-        # 频道成员事件
-        # https://bot.q.qq.com/wiki/develop/api/gateway/guild_member.html
-        elif isinstance(event, GuildMemberEvent):
-            # 随机生成一个 id，暂时没啥意义
-            event_dict["id"] = uuid4().hex
-            event_dict["time"] = (
-                event.joined_at.timestamp()
-                if event.joined_at
-                else datetime.now().timestamp()
-            )
-            event_dict["guild_id"] = event.guild_id
-            event_dict["user_id"] = event.get_user_id()
-            event_dict["operator_id"] = event.op_user_id
-            if isinstance(event, GuildMemberAddEvent):
-                event_dict["detail_type"] = "guild_member_increase"
-            elif isinstance(event, GuildMemberRemoveEvent):
-                event_dict["detail_type"] = "guild_member_decrease"
-            elif isinstance(event, GuildMemberUpdateEvent):
-                event_dict["detail_type"] = "guild_member_update"
-        # 子频道事件
-        # https://bot.q.qq.com/wiki/develop/api/gateway/channel.html
-        elif isinstance(event, ChannelEvent):
-            event_dict["id"] = uuid4().hex
-            event_dict["time"] = datetime.now().timestamp()
-            event_dict["guild_id"] = event.guild_id
-            event_dict["channel_id"] = event.id
-            event_dict["operator_id"] = event.op_user_id
-            if isinstance(event, ChannelCreateEvent):
-                event_dict["detail_type"] = "channel_create"
-            elif isinstance(event, ChannelDeleteEvent):
-                event_dict["detail_type"] = "channel_delete"
-            elif isinstance(event, ChannelUpdateEvent):
-                event_dict["detail_type"] = "channel_update"
-        else:
-            logger.warning(f"未转换事件: {event}")
-            return []
+    async def _to_event_dict(
+        self, event: Event, id: str, time: Optional[datetime], detail_type: str
+    ) -> EventDict:
+        return {
+            "id": id,
+            "time": (time or datetime.now()).timestamp(),
+            "type": event.get_type(),
+            "detail_type": detail_type,
+            "sub_type": "",
+            "self": await self.get_bot_self(),
+        }
+
+    @converter(MessageEvent)
+    async def _message_event(self, event: MessageEvent) -> EventDict:
+        # MessageCreateEvent, AtMessageCreateEvent
+        event_dict = await self._to_event_dict(
+            event, cast(str, event.id), event.timestamp, "channel"
+        )
+        event_dict["message_id"] = self._to_ob_message_id(
+            message_id=event.id,
+            guild_id=event.guild_id,
+            channel_id=event.channel_id,
+        )
+        event_dict["message"] = await self.to_onebot_message(event)
+        event_dict["alt_message"] = str(event.get_message())
+        # 扩展 author, member 信息
+        event_dict["qqguild.author"] = event.author.model_dump() if event.author else {}
+        event_dict["qqguild.member"] = event.member.model_dump() if event.member else {}
+        event_dict["guild_id"] = event.guild_id
+        event_dict["channel_id"] = event.channel_id
+        event_dict["user_id"] = event.get_user_id()
+        return event_dict
+
+    @converter(DirectMessageCreateEvent)
+    async def _direct_message_event(self, event: DirectMessageCreateEvent) -> EventDict:
+        event_dict = await self._message_event(event)
+        event_dict["detail_type"] = "private"
+        del event_dict["guild_id"], event_dict["channel_id"]
+        # 发送私信还需要临时频道 id
+        event_dict["qqguild.guild_id"] = str(event.guild_id)
+        # 原频道 id
+        event_dict["qqguild.src_guild_id"] = event.src_guild_id
+        return event_dict
+
+    # 频道成员事件
+    # https://bot.q.qq.com/wiki/develop/api/gateway/guild_member.html
+    async def _guild_member_event(
+        self, event: GuildMemberEvent, detail_type: str
+    ) -> EventDict:
+        # 随机生成一个 id，暂时没啥意义
+        event_dict = await self._to_event_dict(
+            event, uuid4().hex, event.joined_at, detail_type
+        )
+        event_dict["guild_id"] = event.guild_id
+        event_dict["user_id"] = event.get_user_id()
+        event_dict["operator_id"] = event.op_user_id
+        return event_dict
+
+    @converter(GuildMemberAddEvent)
+    async def _guild_member_add_event(self, event: GuildMemberAddEvent) -> EventDict:
+        return await self._guild_member_event(event, "guild_member_increase")
+
+    @converter(GuildMemberRemoveEvent)
+    async def _guild_member_remove_event(
+        self, event: GuildMemberRemoveEvent
+    ) -> EventDict:
+        return await self._guild_member_event(event, "guild_member_decrease")
+
+    @converter(GuildMemberUpdateEvent)
+    async def _guild_member_update_event(
+        self, event: GuildMemberUpdateEvent
+    ) -> EventDict:
+        return await self._guild_member_event(event, "guild_member_update")
+
+    # 子频道事件
+    # https://bot.q.qq.com/wiki/develop/api/gateway/channel.html
+    async def _channel_event(self, event: ChannelEvent, detail_type: str) -> EventDict:
+        event_dict = await self._to_event_dict(event, uuid4().hex, None, detail_type)
+        event_dict["guild_id"] = event.guild_id
+        event_dict["channel_id"] = event.id
+        event_dict["operator_id"] = event.op_user_id
+        return event_dict
+
+    @converter(ChannelCreateEvent)
+    async def _channel_create_event(self, event: ChannelCreateEvent) -> EventDict:
+        return await self._channel_event(event, "channel_create")
+
+    @converter(ChannelDeleteEvent)
+    async def _channel_delete_event(self, event: ChannelDeleteEvent) -> EventDict:
+        return await self._channel_event(event, "channel_delete")
+
+    @converter(ChannelUpdateEvent)
+    async def _channel_update_event(self, event: ChannelUpdateEvent) -> EventDict:
+        return await self._channel_event(event, "channel_update")
 
-        if event_out := OneBotAdapter.json_to_event(
-            event_dict, "nonebot-plugin-all4one"
+    async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
+        if self.get_converter(type(event)) is None and event.get_type() in (
+            "message",
+            "notice",
+            "request",
         ):
-            return [event_out]
-        return []
+            logger.warning(f"未转换事件: {event}")
+        return await super().to_onebot_event(event)
 
     async def to_onebot_message(self, event: MessageEvent) -> OneBotMessage:
         message = event.get_message()
@@ -181,27 +199,50 @@ class Middleware(BaseMiddleware):
         # 如果是私聊默认是 to_me 的，不需要再次 @ 机器人
         if event.to_me and not isinstance(event, DirectMessageCreateEvent):
             message_list.append(OneBotMessageSegment.mention(self.self_id))
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(OneBotMessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention_user":
-                message_list.append(
-                    OneBotMessageSegment.mention(segment.data["user_id"])
-                )
-            elif segment.type == "attachment":
-                url = segment.data["url"]
-                http_url = f"https://{url}" if not url.startswith("https") else url
-                file_id = await upload_file(
-                    name=url,
-                    url=http_url,
-                    src=self.get_platform(),
-                    src_id=url,
-                )
-                message_list.append(OneBotMessageSegment.image(file_id))
-            elif segment.type == "mention_everyone":
-                message_list.append(OneBotMessageSegment.mention_all())
+        message_list.extend(await self.convert_to_onebot(message))
         return OneBotMessage(message_list)
 
+    @to_onebot_segment("text")
+    def _text_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        return OneBotMessageSegment.text(segment.data["text"])
+
+    @to_onebot_segment("mention_user")
+    def _mention_user_to_onebot(self, segment: MessageSegment) -> OneBotMessageSegment:
+        return OneBotMessageSegment.mention(segment.data["user_id"])
+
+    @to_onebot_segment("attachment")
+    async def _attachment_to_onebot(
+        self, segment: MessageSegment
+    ) -> OneBotMessageSegment:
+        url = segment.data["url"]
+        http_url = f"https://{url}" if not url.startswith("https") else url
+        file_id = await upload_file(
+            name=url,
+            url=http_url,
+            src=self.get_platform(),
+            src_id=url,
+        )
+        return OneBotMessageSegment.image(file_id)
+
+    @to_onebot_segment("mention_everyone")
+    def _mention_everyone_to_onebot(
+        self, segment: MessageSegment
+    ) -> OneBotMessageSegment:
+        return OneBotMessageSegment.mention_all()
+
+    # 图片与回复作为发送消息的参数单独处理
+    @from_onebot_segment("text")
+    def _text_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.text(segment.data["text"])
+
+    @from_onebot_segment("mention")
+    def _mention_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.mention_user(int(segment.data["user_id"]))
+
+    @from_onebot_segment("mention_all")
+    def _mention_all_from_onebot(self, segment: OneBotMessageSegment) -> MessageSegment:
+        return MessageSegment.mention_everyone()
+
     @supported_action
     async def send_message(
         self,
@@ -217,26 +258,16 @@ class Middleware(BaseMiddleware):
         if detail_type not in ["private", "channel"]:
             raise ob_exception.UnsupportedParam("failed", 10004, "不支持的类型", None)
 
-        message_list = []
         message = TypeAdapter(OneBotMessage).validate_python(message)
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(MessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention":
-                message_list.append(
-                    MessageSegment.mention_user(int(segment.data["user_id"]))
-                )
-            elif segment.type == "mention_all":
-                message_list.append(MessageSegment.mention_everyone())
+        message_list = await self.convert_from_onebot(message)
         qqguild_message = Message(message_list)
         content = qqguild_message.extract_content() or None
 
         if file_image := (message["image"] or None):
             file_id = file_image[-1].data["file_id"]
             file = await get_file(file_id=file_id, src=self.get_platform())
-            if file.path:
-                async with await open_file(Path(file.path), "rb") as f:
-                    file_image = await f.read()
+            if file.path or file.url:
+                file_image = await read_file(file)
         message_reference = None
         if reply := (message["reply"] or None):
             message_id = reply[-1].data["message_id"]
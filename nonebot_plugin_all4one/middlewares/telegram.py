@@ -1,16 +1,12 @@
 from pathlib import Path
 from typing import Any, Union, Literal, Optional
 
-from pydantic import TypeAdapter
 from nonebot.adapters.onebot.v12 import UnsupportedSegment
-from nonebot.adapters.onebot.v12 import Event as OneBotEvent
-from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
 from nonebot.adapters.onebot.v12 import Message as OneBotMessage
 from nonebot.adapters.telegram.message import File, Reply, Entity
 from nonebot.adapters.telegram import Bot, Event, Adapter, Message
 from nonebot.adapters.onebot.v12 import MessageSegment as OneBotMessageSegment
 from nonebot.adapters.telegram.event import (
-    NoticeEvent,
     MessageEvent,
     ChannelPostEvent,
     GroupMessageEvent,
@@ -20,13 +16,24 @@ from nonebot.adapters.telegram.event import (
     ForumTopicMessageEvent,
 )
 
-from .base import supported_action
-from ..database import get_file, upload_file
+from .base import EventDict
 from .base import Middleware as BaseMiddleware
+from ..database import get_file, read_file, upload_file, get_local_path
+from .base import converter, supported_action, to_onebot_segment, from_onebot_segment
+
+# 记录的待上传文件数上限，超过时丢弃最早的记录
+MAX_PENDING_UPLOADS = 256
 
 
 class Middleware(BaseMiddleware):
     bot: Bot
+    # file_id 可以跨会话使用，转换结果不随会话变化，广播时可以共用缓存
+    _uncached_kwargs = frozenset({"chat_id"})
+
+    def __init__(self, bot: Bot):
+        super().__init__(bot)
+        # 需要上传的文件内容（本地路径或数据）到文件 ID 的映射
+        self._uploads: dict[Union[str, bytes], str] = {}
 
     @staticmethod
     def get_name():
@@ -35,69 +42,87 @@ class Middleware(BaseMiddleware):
     def get_platform(self):
         return "telegram"
 
-    async def to_onebot_event(self, event: Event) -> list[OneBotEvent]:
-        event_dict = {}
-        event_dict["id"] = str(event.telegram_model.update_id)
-        if (type := event.get_type()) not in ["message", "notice", "request"]:
-            return []
-        event_dict["type"] = type
-        event_dict["self"] = (await self.get_bot_self()).model_dump()
-        if isinstance(event, MessageEvent):
-            event_dict["time"] = event.date
-            event_dict["detail_type"] = event.get_event_name().split(".")[1]
-            event_dict["sub_type"] = ""
-            event_dict["message_id"] = f"{event.chat.id}/{event.message_id}"
-            event_dict["message"] = await self.to_onebot_message(event.original_message)
-            event_dict["alt_message"] = str(event.original_message)
-            if isinstance(event, PrivateMessageEvent):
-                event_dict["user_id"] = event.get_user_id()
-            elif isinstance(event, ForumTopicMessageEvent):
-                event_dict["detail_type"] = "channel"
-                event_dict["guild_id"] = str(event.chat.id)
-                event_dict["channel_id"] = str(event.message_thread_id)
-                event_dict["user_id"] = event.get_user_id()
-            elif isinstance(event, GroupMessageEvent):
-                event_dict["group_id"] = str(event.chat.id)
-                event_dict["user_id"] = event.get_user_id()
-            if isinstance(event.reply_to_message, MessageEvent):
-                event_dict["message"].insert(
-                    0,
-                    OneBotMessageSegment.reply(
-                        f"{event.reply_to_message.chat.id}/{event.reply_to_message.message_id}",
-                        user_id=(
-                            event.reply_to_message.get_user_id()
-                            if not isinstance(event.reply_to_message, ChannelPostEvent)
-                            else ""
-                        ),
+    async def _to_event_dict(
+        self,
+        event: Event,
+        detail_type: str,
+        sub_type: str = "",
+    ) -> EventDict:
+        return {
+            "id": str(event.telegram_model.update_id),
+            "type": event.get_type(),
+            "detail_type": detail_type,
+            "sub_type": sub_type,
+            "self": await self.get_bot_self(),
+        }
+
+    @converter(MessageEvent)
+    async def _message_event(self, event: MessageEvent) -> EventDict:
+        event_dict = await self._to_event_dict(
+            event, event.get_event_name().split(".")[1]
+        )
+        event_dict["time"] = event.date
+        event_dict["message_id"] = f"{event.chat.id}/{event.message_id}"
+        event_dict["message"] = await self.to_onebot_message(event.original_message)
+        event_dict["alt_message"] = str(event.original_message)
+        if isinstance(event.reply_to_message, MessageEvent):
+            event_dict["message"].insert(
+                0,
+                OneBotMessageSegment.reply(
+                    f"{event.reply_to_message.chat.id}/{event.reply_to_message.message_id}",
+                    user_id=(
+                        event.reply_to_message.get_user_id()
+                        if not isinstance(event.reply_to_message, ChannelPostEvent)
+                        else ""
                     ),
-                )
-        elif isinstance(event, NoticeEvent):
-            if isinstance(event, NewChatMemberEvent):
-                event_dict["time"] = event.date
-                event_dict["detail_type"] = "group_member_increase"
-                event_dict["sub_type"] = "join"
-                event_dict["group_id"] = str(event.chat.id)
-                event_dict["operator_id"] = str(event.from_.id) if event.from_ else ""
-                event_list = []
-                for user in event.new_chat_members:
-                    event_dict["user_id"] = user.id
-                    if event_out := OneBotAdapter.json_to_event(
-                        event_dict, "nonebot-plugin-all4one"
-                    ):
-                        event_list.append(event_out)
-                return event_list
-            if isinstance(event, LeftChatMemberEvent):
-                event_dict["time"] = event.date
-                event_dict["detail_type"] = "group_member_decrease"
-                event_dict["sub_type"] = "leave"
-                event_dict["group_id"] = str(event.chat.id)
-                event_dict["user_id"] = event.left_chat_member.id
-                event_dict["operator_id"] = str(event.from_.id) if event.from_ else ""
-        if event_out := OneBotAdapter.json_to_event(
-            event_dict, "nonebot-plugin-all4one"
-        ):
-            return [event_out]
-        return []
+                ),
+            )
+        return event_dict
+
+    @converter(PrivateMessageEvent)
+    async def _private_message_event(self, event: PrivateMessageEvent) -> EventDict:
+        event_dict = await self._message_event(event)
+        event_dict["user_id"] = event.get_user_id()
+        return event_dict
+
+    @converter(GroupMessageEvent)
+    async def _group_message_event(self, event: GroupMessageEvent) -> EventDict:
+        event_dict = await self._message_event(event)
+        event_dict["group_id"] = str(event.chat.id)
+        event_dict["user_id"] = event.get_user_id()
+        return event_dict
+
+    @converter(ForumTopicMessageEvent)
+    async def _forum_topic_message_event(
+        self, event: ForumTopicMessageEvent
+    ) -> EventDict:
+        event_dict = await self._message_event(event)
+        event_dict["detail_type"] = "channel"
+        event_dict["guild_id"] = str(event.chat.id)
+        event_dict["channel_id"] = str(event.message_thread_id)
+        event_dict["user_id"] = event.get_user_id()
+        return event_dict
+
+    @converter(NewChatMemberEvent)
+    async def _new_chat_member_event(
+        self, event: NewChatMemberEvent
+    ) -> list[EventDict]:
+        event_dict = await self._to_event_dict(event, "group_member_increase", "join")
+        event_dict["time"] = event.date
+        event_dict["group_id"] = str(event.chat.id)
+        event_dict["operator_id"] = str(event.from_.id) if event.from_ else ""
+        return [
+            {**event_dict, "user_id": str(user.id)} for user in event.new_chat_members
+        ]
+
+    @converter(LeftChatMemberEvent)
+    async def _left_chat_member_event(self, event: LeftChatMemberEvent) -> EventDict:
+        event_dict = await self._to_event_dict(event, "group_member_decrease", "leave")
+        event_dict["time"] = event.date
+        event_dict["group_id"] = str(event.chat.id)
+        event_dict["user_id"] = str(event.left_chat_member.id)
+        event_dict["operator_id"] = str(event.from_.id) if event.from_ else ""
+        return event_dict
 
     async def get_supported_message_segments(self, **kwargs: Any) -> list[str]:
         return [
@@ -113,43 +138,102 @@ class Middleware(BaseMiddleware):
         ]
 
     async def to_onebot_message(self, message: Message) -> OneBotMessage:
-        message_list = []
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(OneBotMessageSegment.text(segment.data["text"]))
-            elif segment.type == "mention":
-                if (user_name := segment.data["text"][1:]) == self.bot.username:
-                    message_list.append(OneBotMessageSegment.mention(self.bot.self_id))
-                else:
-                    message_list.append(OneBotMessageSegment.mention(user_name))
-            elif segment.type == "text_mention":
-                message_list.append(
-                    OneBotMessageSegment.mention(str(segment.data["user"].id))
-                )
-            elif isinstance(segment, Entity):
-                message_list.append(OneBotMessageSegment.text(str(segment)))
-            elif segment.type == "photo":
-                message_list.append(OneBotMessageSegment.image(segment.data["file"]))
-            elif segment.type in ("voice", "audio", "video"):
-                message_list.append(
-                    OneBotMessageSegment(
-                        segment.type, {"file_id": segment.data["file"]}
-                    )
-                )
-            elif segment.type == "document":
-                message_list.append(OneBotMessageSegment.file(segment.data["file"]))
-        for segment in message_list:
-            if segment.type in ("image", "voice", "audio", "video", "file"):
-                file = await self.bot.get_file(segment.data["file_id"])
-                if file.file_path is None:
-                    continue
-                segment.data["file_id"] = await upload_file(
-                    Path(file.file_path).name,
-                    self.get_platform(),
-                    file.file_id,
-                    url=f"https://api.telegram.org/file/bot{self.bot.bot_config.token}/{file.file_path}",
-                )
-        return OneBotMessage(message_list)
+        return await self.convert_to_onebot(message)
+
+    @to_onebot_segment("text")
+    def _text_to_onebot(self, segment: Entity) -> OneBotMessageSegment:
+        return OneBotMessageSegment.text(segment.data["text"])
+
+    @to_onebot_segment("mention")
+    def _mention_to_onebot(self, segment: Entity) -> OneBotMessageSegment:
+        if (user_name := segment.data["text"][1:]) == self.bot.username:
+            return OneBotMessageSegment.mention(self.bot.self_id)
+        return OneBotMessageSegment.mention(user_name)
+
+    @to_onebot_segment("text_mention")
+    def _text_mention_to_onebot(self, segment: Entity) -> OneBotMessageSegment:
+        return OneBotMessageSegment.mention(str(segment.data["user"].id))
+
+    @to_onebot_segment("*")
+    def _entity_to_onebot(self, segment: Any) -> Optional[OneBotMessageSegment]:
+        if isinstance(segment, Entity):
+            return OneBotMessageSegment.text(str(segment))
+
+    @to_onebot_segment("photo", "voice", "audio", "video", "document")
+    async def _file_to_onebot(self, segment: File) -> OneBotMessageSegment:
+        type = {"photo": "image", "document": "file"}.get(segment.type, segment.type)
+        file_id = segment.data["file"]
+        file = await self.bot.get_file(file_id)
+        if file.file_path is not None:
+            file_id = await upload_file(
+                Path(file.file_path).name,
+                self.get_platform(),
+                file.file_id,
+                url=f"https://api.telegram.org/file/bot{self.bot.bot_config.token}/{file.file_path}",
+            )
+        return OneBotMessageSegment(type, {"file_id": file_id})
+
+    @from_onebot_segment("text")
+    def _text_from_onebot(self, segment: OneBotMessageSegment, **kwargs: Any) -> Entity:
+        return Entity.text(segment.data["text"])
+
+    @from_onebot_segment("mention", cache=False)
+    async def _mention_from_onebot(
+        self, segment: OneBotMessageSegment, chat_id: str, **kwargs: Any
+    ) -> Entity:
+        user = await self.bot.get_chat_member(chat_id, segment.data["user_id"])
+        user_name = user.user.username or user.user.first_name
+        return Entity.text_mention(f"@{user_name}", user.user)
+
+    @from_onebot_segment("mention_all")
+    def _mention_all_from_onebot(
+        self, segment: OneBotMessageSegment, **kwargs: Any
+    ) -> None:
+        raise UnsupportedSegment("failed", 10005, "不支持的消息段类型", {})
+
+    @from_onebot_segment("image", "voice", "audio", "video", "file")
+    async def _file_from_onebot(
+        self, segment: OneBotMessageSegment, **kwargs: Any
+    ) -> File:
+        type = {"image": "photo", "file": "document"}.get(segment.type, segment.type)
+        file = await get_file(segment.data["file_id"], self.get_platform())
+        if file.src_id:
+            return File(type, {"file": file.src_id})
+        content = await get_local_path(file) or await read_file(file)
+        # 记录需要上传的文件，发送后保存 Telegram 返回的 file_id
+        self._uploads[content] = segment.data["file_id"]
+        while len(self._uploads) > MAX_PENDING_UPLOADS:
+            self._uploads.pop(next(iter(self._uploads)))
+        return File(type, {"file": content})
+
+    @from_onebot_segment("reply")
+    def _reply_from_onebot(self, segment: OneBotMessageSegment, **kwargs: Any) -> Reply:
+        return Reply.reply(int(segment.data["message_id"].split("/")[1]))
+
+    async def _save_uploaded_file(self, segments: list[Any], result: Any) -> None:
+        """记录随消息上传的文件在 Telegram 中的 file_id，之后发送同一文件时直接引用
+
+        只处理含有一个上传文件的消息，多个文件无法与返回的消息一一对应
+        """
+        uploads = [
+            segment
+            for segment in segments
+            if isinstance(segment, File) and segment.data["file"] in self._uploads
+        ]
+        if len(uploads) != 1 or isinstance(result, list):
+            return
+        media = getattr(result, uploads[0].type, None)
+        if isinstance(media, list):
+            media = media[-1] if media else None
+        if media is None:
+            return
+        file_id = self._uploads.pop(uploads[0].data["file"])
+        file = await get_file(file_id)
+        await upload_file(
+            file.name, self.get_platform(), media.file_id, sha256=file.sha256
+        )
+        # 缓存中引用该文件的消息仍携带文件内容，需要重新转换
+        self._invalidate_converted(file_id)
 
     @supported_action
     async def send_message(
@@ -171,36 +255,7 @@ class Middleware(BaseMiddleware):
             chat_id = guild_id
         chat_id = str(chat_id)
 
-        message_list = []
-        message = TypeAdapter(OneBotMessage).validate_python(message)
-        for segment in message:
-            if segment.type == "text":
-                message_list.append(Entity.text(segment.data["text"]))
-            elif segment.type == "mention":
-                user = await self.bot.get_chat_member(chat_id, segment.data["user_id"])
-                user_name = user.user.username or user.user.first_name
-                message_list.append(Entity.text_mention(f"@{user_name}", user.user))
-            elif segment.type == "mention_all":
-                raise UnsupportedSegment("failed", 10005, "不支持的消息段类型", {})
-            elif segment.type == "image":
-                message_list.append(File.photo(segment.data["file_id"]))
-            elif segment.type in ("voice", "audio", "video"):
-                message_list.append(
-                    File(segment.type, {"file": segment.data["file_id"]})
-                )
-            elif segment.type == "file":
-                message_list.append(File.document(segment.data["file_id"]))
-            elif segment.type == "reply":
-                message_list.append(
-                    Reply.reply(int(segment.data["message_id"].split("/")[1]))
-                )
-        for segment in message_list:
-            if isinstance(segment, File):
-                file = await get_file(segment.data["file"], self.get_platform())
-                if file.src_id:
-                    segment.data["file"] = file.src_id
-                else:
-                    segment.data["file"] = file.path
+        message_list = await self.convert_from_onebot(message, chat_id=chat_id)
         telegram_message = Message(message_list)
 
         result = await self.bot.send_to(
@@ -209,6 +264,7 @@ class Middleware(BaseMiddleware):
             message_thread_id=int(channel_id) if channel_id else None,
             **kwargs,
         )
+        await self._save_uploaded_file(message_list, result)
         if isinstance(result, list):
             result = result[0]
         return {"message_id": f"{chat_id}/{result.message_id}", "time": result.date}
@@ -229,7 +285,9 @@ class Middleware(BaseMiddleware):
         }
 
     @supported_action
-    async def get_user_info(self, *, user_id: str, **kwargs: Any) -> dict[
+    async def get_user_info(
+        self, *, user_id: str, **kwargs: Any
+    ) -> dict[
         Union[Literal["user_id", "user_name", "user_displayname", "user_remark"], str],
         str,
     ]:
@@ -0,0 +1,28 @@
+"""add file size and atime
+
+Revision ID: 5c2e8f1a7b3d
+Revises: d0a1d19f3408
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c2e8f1a7b3d"
+down_revision = "d0a1d19f3408"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("nonebot_plugin_all4one_file", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("size", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("atime", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("nonebot_plugin_all4one_file", schema=None) as batch_op:
+        batch_op.drop_column("atime")
+        batch_op.drop_column("size")
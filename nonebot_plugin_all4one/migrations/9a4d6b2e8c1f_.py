@@ -0,0 +1,29 @@
+"""add inline blob table
+
+Revision ID: 9a4d6b2e8c1f
+Revises: 5c2e8f1a7b3d
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9a4d6b2e8c1f"
+down_revision = "5c2e8f1a7b3d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "nonebot_plugin_all4one_blob",
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("nonebot_plugin_all4one_blob")
@@ -0,0 +1,87 @@
+from binascii import Error
+from base64 import b64decode
+from functools import partial
+from asyncio import get_running_loop
+from collections.abc import Callable
+from typing import Any, TypeVar, Optional
+from multiprocessing import get_context, get_all_start_methods
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from pydantic import BaseModel
+from nonebot import get_plugin_config
+
+T = TypeVar("T")
+
+# 分块解码 base64 的块大小，必须是 4 的倍数
+B64_CHUNK_SIZE = 1024 * 1024
+
+
+class Config(BaseModel):
+    obimpl_offload_threshold: int = 256 * 1024
+    obimpl_offload_workers: int = 4
+    obimpl_offload_process_threshold: int = 4 * 1024 * 1024
+    obimpl_offload_processes: int = 2
+
+    class Config:
+        extra = "ignore"
+
+
+plugin_config = get_plugin_config(Config)
+executor = ThreadPoolExecutor(
+    plugin_config.obimpl_offload_workers, thread_name_prefix="all4one-offload"
+)
+
+
+process_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_executor() -> Optional[ProcessPoolExecutor]:
+    """获取进程池，第一次使用时创建
+
+    子进程以 fork 方式创建，不需要重新导入插件；不支持 fork 的平台返回 None
+    """
+    global process_executor
+    if process_executor is None and "fork" in get_all_start_methods():
+        process_executor = ProcessPoolExecutor(
+            plugin_config.obimpl_offload_processes, mp_context=get_context("fork")
+        )
+    return process_executor
+
+
+async def offload(
+    func: Callable[..., T], size: int, *args: Any, process: bool = False
+) -> T:
+    """执行 CPU 密集的操作，数据大小超过 obimpl_offload_threshold 时放到线程池中执行
+
+    JSON、MessagePack 解码等操作全程持有 GIL，放到线程池中仍会阻塞事件循环，
+    process 为 True 且数据大小超过 obimpl_offload_process_threshold 时放到进程池中执行
+
+    参数:
+        func: 要执行的同步函数，放到进程池中时函数与参数必须可以被 pickle
+        size: 待处理数据的大小，单位：字节
+        process: 是否可以放到进程池中执行
+    """
+    if size < plugin_config.obimpl_offload_threshold:
+        return func(*args)
+    loop = get_running_loop()
+    if (
+        process
+        and size >= plugin_config.obimpl_offload_process_threshold
+        and (pool := get_process_executor()) is not None
+    ):
+        return await loop.run_in_executor(pool, partial(func, *args))
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+
+def decode_base64(data: str) -> bytes:
+    """分块解码 base64，块之间可以释放 GIL，避免长时间占用解释器
+
+    数据中含有换行等非标准字符时退回一次性解码
+    """
+    try:
+        return b"".join(
+            b64decode(data[i : i + B64_CHUNK_SIZE], validate=True)
+            for i in range(0, len(data), B64_CHUNK_SIZE)
+        )
+    except Error:
+        return b64decode(data)
@@ -1,29 +1,40 @@
 import json
 import uuid
+import mimetypes
+from pathlib import Path
+from time import monotonic
 from datetime import datetime
 from functools import partial
-from collections.abc import AsyncGenerator
+from urllib.parse import quote
 from contextlib import asynccontextmanager
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import sleep, gather, wait_for, create_task
+from collections.abc import Callable, Awaitable, AsyncGenerator
 from typing import Any, Union, Literal, ClassVar, Optional, cast
-from asyncio import Task, Queue, sleep, gather, wait_for, create_task
+from asyncio import Task, Server, Semaphore, StreamReader, StreamWriter
 
 import msgpack
 from nonebot.adapters import Bot
 from nonebot.utils import escape_tag
+from nonebot.adapters.onebot.v12 import Event
 from nonebot.exception import WebSocketClosed
 from nonebot.adapters.onebot.utils import get_auth_bearer
-from nonebot.adapters.onebot.v12 import Event, StatusUpdateMetaEvent
-from nonebot.adapters.onebot.v12.exception import (
-    WhoAmI,
-    UnknownSelf,
-    ActionFailedWithRetcode,
-)
+from nonebot_plugin_localstore import get_plugin_data_dir
+from nonebot.adapters.onebot.v12 import StatusUpdateMetaEvent
+from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
 from nonebot.adapters.onebot.v12.event import (
     Status,
     BotStatus,
     ImplVersion,
     ConnectMetaEvent,
 )
+from nonebot.adapters.onebot.v12.exception import (
+    WhoAmI,
+    UnknownSelf,
+    DatabaseError,
+    UnsupportedAction,
+    ActionFailedWithRetcode,
+)
 from nonebot.drivers import (
     URL,
     Driver,
@@ -37,31 +48,80 @@ from nonebot.drivers import (
     WebSocketServerSetup,
 )
 
+from .. import database
 from ..logger import log
-from .utils import encode_data
+from .journal import Journal
+from ..offload import offload
 from ..__version__ import __version__
+from .shard import ShardBot, ShardLink
+from ..database.url import verify, parse_range
+from .unix import UnixSocket, remove_stale_socket
+from .group import ConsumerGroup, get_partition_key
 from ..middlewares import MIDDLEWARE_MAP, Middleware
+from .replay import SEQ_FIELD, EventQueue, ReplayBuffer, get_seq
+from ..database import (
+    FILE_ROUTE,
+    get_file,
+    read_file,
+    migrate_layout,
+    collect_garbage,
+    file_url_secret,
+    enable_shared_access,
+)
 from .config import (
     Config,
+    SSEConfig,
     HTTPConfig,
     WebsocketConfig,
+    UnixSocketConfig,
     HTTPWebhookConfig,
     WebsocketReverseConfig,
 )
+from .utils import (
+    PayloadTooLarge,
+    decode_body,
+    decode_data,
+    encode_data,
+    encode_event,
+    parse_accept,
+    compress_data,
+    encode_events,
+    get_encodings,
+    choose_encoding,
+)
 
 
 class OneBotImplementation:
     USER_AGENT: ClassVar[str] = f"OneBot4All NoneBot-Plugin-All4One/{__version__}"
     ONEBOT_VERSION: ClassVar[str] = "A"
     IMPL_NAME: ClassVar[str] = "nonebot-plugin-all4one"
+    IMPL_ACTIONS: ClassVar[dict[str, str]] = {
+        "get_latest_events": "get_latest_events",
+        "get_status": "get_status",
+        "get_version": "get_version",
+        "all4one.resume": "resume",
+    }
 
     def __init__(self, driver: Driver):
         self.driver = driver
         self.config = Config(**self.driver.config.model_dump())
         self.tasks: list[Task] = []
-        self.queues: list[Queue[Event]] = []
+        self.queues: list[EventQueue] = []
+        self.groups: dict[str, ConsumerGroup] = {}
+        self.replay = ReplayBuffer(self.config.obimpl_replay_buffer_size)
+        self.journal: Optional[Journal] = None
+        self.servers: list[Server] = []
         self._middlewares: dict[str, type[Middleware]] = {}
-        self.middlewares: dict[str, Middleware] = {}
+        self.middlewares: dict[str, Union[Middleware, ShardBot]] = {}
+        # 文件 URL 由工作进程签发、前端进程校验，需要共享签名密钥
+        if (
+            self.config.obimpl_shard
+            and database.plugin_config.obimpl_file_url_base is not None
+            and not database.plugin_config.obimpl_file_url_secret
+        ):
+            raise ValueError(
+                "obimpl_file_url_secret must be set when obimpl_shard is enabled"
+            )
         self.setup()
 
     def setup_http_server(self, setup: HTTPServerSetup):
@@ -99,14 +159,140 @@ class OneBotImplementation:
         self._middlewares[name] = middleware
         log("INFO", f'Succeeded to load middleware "<y>{escape_tag(name)}</y>"')
 
-    async def _call_api(self, data: dict[str, Any]) -> Any:
-        try:
-            if (api := data["action"]) in (
-                "get_latest_events",
-                "get_status",
-                "get_version",
+    async def _backfill(self, seq: int, until: Optional[int] = None) -> list[Event]:
+        """获取序号在 (seq, until] 之间的事件，超出重放缓冲区的部分从日志中读取"""
+        events = []
+        if self.journal and seq + 1 < (first := self.replay.first):
+            events = await self.journal.read(
+                seq, first - 1 if until is None else min(until, first - 1)
+            )
+            if events:
+                seq = cast(int, get_seq(events[-1]))
+        return events + self.replay.since(seq, until)
+
+    async def subscribe(
+        self,
+        seq: Optional[int] = None,
+        maxsize: int = 0,
+        linger: float = 0,
+        group: Optional[str] = None,
+        member: Optional[str] = None,
+    ) -> EventQueue:
+        """注册一个事件队列
+
+        参数:
+            seq: 客户端最后确认的事件序号，给出时先补发之后的事件
+            maxsize: 队列长度上限，0 表示不限制
+            linger: 长轮询被唤醒后继续收集事件的秒数
+            group: 加入的消费组，组内的每个事件只投递给一个成员
+            member: 消费组内的成员 ID，默认随机生成
+        """
+        events = [] if seq is None else await self._backfill(seq)
+        queue = EventQueue(maxsize, self.replay.seq, linger)
+        if group is None:
+            for event in events:
+                queue.put_latest(event)
+            self.queues.append(queue)
+            return queue
+        if (consumer_group := self.groups.get(group)) is None:
+            consumer_group = self.groups[group] = ConsumerGroup(group)
+        consumer_group.join(member or uuid.uuid4().hex, queue)
+        # 只补发按当前成员分配属于自己的事件
+        for event in events:
+            if (key := get_partition_key(event)) is None or (
+                consumer_group.owner(key) is queue
             ):
-                resp = await getattr(self, api)(**data)
+                queue.put_latest(event)
+        return queue
+
+    def unsubscribe(self, queue: EventQueue) -> None:
+        """注销一个事件队列"""
+        if queue in self.queues:
+            self.queues.remove(queue)
+            return
+        for name, group in list(self.groups.items()):
+            if group.leave(queue) and not group.members:
+                del self.groups[name]
+
+    async def dispatch(self, event: Event) -> None:
+        """为事件分配序号，并推送到所有事件队列与消费组"""
+        self.replay.append(event)
+        if self.journal:
+            self.journal.append(event)
+        for queue in self.queues:
+            queue.put_latest(event)
+        for group in self.groups.values():
+            group.put_latest(event)
+
+    async def events(
+        self,
+        *,
+        seq: Optional[int] = None,
+        maxsize: int = 0,
+        self_id: Optional[str] = None,
+        types: Optional[set[str]] = None,
+        detail_types: Optional[set[str]] = None,
+        predicate: Optional[Callable[[Event], bool]] = None,
+    ) -> AsyncGenerator[Event, None]:
+        """在进程内订阅转换后的 OneBot 12 事件，不经过任何编解码
+
+        事件对象在所有连接之间共享，使用时不要修改。
+        订阅在开始迭代时生效，需要补发之前的事件时传入 seq
+
+        参数:
+            seq: 最后确认的事件序号，给出时先补发之后的事件
+            maxsize: 队列长度上限，0 表示不限制
+            self_id: 只接收该机器人的事件
+            types: 只接收这些类型的事件
+            detail_types: 只接收这些详细类型的事件
+            predicate: 自定义过滤函数
+        """
+        queue = await self.subscribe(seq, maxsize)
+        try:
+            while True:
+                event = await queue.get()
+                if self_id is not None and (
+                    getattr(getattr(event, "self", None), "user_id", None) != self_id
+                ):
+                    continue
+                if types is not None and event.type not in types:
+                    continue
+                if detail_types is not None and event.detail_type not in detail_types:
+                    continue
+                if predicate is not None and not predicate(event):
+                    continue
+                yield event
+        finally:
+            self.unsubscribe(queue)
+
+    async def call_action(
+        self, self_id: Optional[str], action: str, **params: Any
+    ) -> Any:
+        """在进程内调用动作，参数与返回值不经过任何编解码
+
+        参数:
+            self_id: 执行动作的机器人，实现自身的动作可以为 None
+            action: 动作名称
+            params: 动作参数
+        """
+        data: dict[str, Any] = {"action": action, "params": params}
+        if self_id is not None:
+            data["self"] = {"user_id": self_id}
+        resp = await self._call_api(data)
+        if resp["status"] != "ok":
+            raise ActionFailedWithRetcode(
+                resp["status"], resp["retcode"], resp["message"], resp["data"]
+            )
+        return resp["data"]
+
+    async def _call_api(
+        self, data: dict[str, Any], queue: Optional[EventQueue] = None
+    ) -> Any:
+        try:
+            if (api := data["action"]) in self.IMPL_ACTIONS:
+                resp = await getattr(self, self.IMPL_ACTIONS[api])(
+                    queue, **data.get("params", {})
+                )
             else:
                 if bot_self := data.pop("self", None):
                     if middleware := self.middlewares.get(
@@ -128,10 +314,10 @@ class OneBotImplementation:
 
     async def get_latest_events(
         self,
-        queue: Queue[Event],
+        queue: Optional[EventQueue],
         *,
         limit: int = 0,
-        timeout: int = 0,
+        timeout: float = 0,
         **kwargs: Any,
     ) -> list[Event]:
         """获取最新事件列表
@@ -141,20 +327,18 @@ class OneBotImplementation:
             timeout: 没有事件时要等待的秒数，0 表示使用短轮询，不等待
             kwargs: 扩展字段
         """
+        if queue is None:
+            raise UnsupportedAction("failed", 10002, "不支持动作请求", {})
         event_list = []
-        if queue.empty():
-            if timeout > 0:
-                event_list.append(
-                    await wait_for(queue.get(), timeout),
-                )
-        else:
-            if limit > 0:
-                for _ in range(limit):
-                    if not queue.empty():
-                        event_list.append(await queue.get())
-            else:
-                while not queue.empty():
-                    event_list.append(await queue.get())
+        if queue.empty() and timeout > 0:
+            try:
+                event_list.append(await wait_for(queue.get(), timeout))
+            except AsyncTimeoutError:
+                return event_list
+            # 被唤醒后在短暂的窗口内继续收集事件，减少客户端的轮询次数
+            await queue.collect(event_list, limit, queue.linger)
+        while not queue.empty() and (limit <= 0 or len(event_list) < limit):
+            event_list.append(queue.get_nowait())
         return event_list
 
     async def get_supported_actions(
@@ -167,7 +351,9 @@ class OneBotImplementation:
         """
         return await middleware.get_supported_actions()
 
-    async def get_status(self, **kwargs: Any) -> Status:
+    async def get_status(
+        self, queue: Optional[EventQueue] = None, **kwargs: Any
+    ) -> Status:
         """获取运行状态
 
         参数:
@@ -183,6 +369,7 @@ class OneBotImplementation:
 
     async def get_version(
         self,
+        queue: Optional[EventQueue] = None,
         **kwargs: Any,
     ) -> dict[Union[Literal["impl", "version", "onebot_version"], str], str]:
         """获取版本信息
@@ -196,6 +383,23 @@ class OneBotImplementation:
             "onebot_version": self.ONEBOT_VERSION,
         }
 
+    async def resume(
+        self, queue: Optional[EventQueue], *, seq: int, **kwargs: Any
+    ) -> None:
+        """补发断线期间的事件
+
+        补发序号在 seq 之后、本次连接建立之前的事件，
+        补发的事件排在已积压的实时事件之前，之后恢复暂缓的推送
+
+        参数:
+            seq: 客户端最后确认的事件序号
+            kwargs: 扩展字段
+        """
+        if queue is None:
+            raise UnsupportedAction("failed", 10002, "不支持动作请求", {})
+        queue.prepend(await self._backfill(seq, queue.seq))
+        queue.release()
+
     def _check_access_token(
         self, request: Request, access_token: str
     ) -> Optional[Response]:
@@ -211,17 +415,130 @@ class OneBotImplementation:
             )
             return Response(401, content=msg)
 
+    def _get_protocol(self, request: Request) -> Optional[str]:
+        """从 Sec-WebSocket-Protocol 请求头中选择以编码格式结尾的子协议"""
+        protocols = request.headers.get("Sec-WebSocket-Protocol", "")
+        for protocol in protocols.split(","):
+            if protocol.strip().rpartition(".")[2].lower() in ("msgpack", "json"):
+                return protocol.strip()
+
+    async def _accept_websocket(self, websocket: WebSocket) -> Optional[str]:
+        """接受 WebSocket 连接并回应选择的子协议
+
+        驱动器不支持回应子协议时不使用子协议，返回 None
+        """
+        protocol = self._get_protocol(websocket.request)
+        # FastAPI 与 Quart 驱动器的原生 WebSocket 支持回应子协议
+        native = getattr(websocket, "websocket", None)
+        if protocol is not None and native is not None:
+            try:
+                await native.accept(subprotocol=protocol)
+                return protocol
+            except TypeError:
+                pass
+        await websocket.accept()
+
+    def _get_codec(
+        self, request: Request, protocol: Optional[str] = None
+    ) -> Optional[bool]:
+        """从已回应的子协议、查询参数或 Accept 请求头中协商编码格式，
+        返回是否使用 MessagePack
+        """
+        if protocol is not None:
+            return protocol.rpartition(".")[2].lower() == "msgpack"
+        if (codec := request.url.query.get("codec", "").lower()) in (
+            "msgpack",
+            "json",
+        ):
+            return codec == "msgpack"
+        accept = parse_accept(request.headers.get("Accept"))
+        msgpack_quality = accept.get("application/msgpack", 0)
+        json_quality = accept.get("application/json", 0)
+        # q=0 表示不接受该格式
+        if msgpack_quality > 0 and msgpack_quality >= json_quality:
+            return True
+        if json_quality > 0:
+            return False
+
+    def _get_group(self, request: Request) -> tuple[Optional[str], Optional[str]]:
+        """获取连接声明的消费组与组内成员 ID"""
+        group = request.headers.get("X-All4One-Group")
+        if group is None:
+            group = request.url.query.get("group")
+        member = request.headers.get("X-All4One-Client-Id")
+        if member is None:
+            member = request.url.query.get("client_id")
+        return group, member
+
+    def _get_event_batch(self, request: Request) -> bool:
+        return request.url.query.get("event_batch", "").lower() in ("1", "true")
+
+    def _get_last_seq(self, request: Request) -> Optional[int]:
+        seq = request.headers.get("Last-Event-ID")
+        if seq is None:
+            seq = request.headers.get("X-All4One-Last-Seq")
+        if seq is None:
+            seq = request.url.query.get("last_seq")
+        try:
+            return int(seq) if seq is not None else None
+        except ValueError:
+            return None
+
+    async def _send_meta_events(
+        self, websocket: Union[WebSocket, UnixSocket], use_msgpack: bool
+    ) -> None:
+        """连接建立后发送 connect 与 status_update 元事件"""
+        await websocket.send(
+            encode_data(
+                ConnectMetaEvent(
+                    id=uuid.uuid4().hex,
+                    time=datetime.now(),
+                    type="meta",
+                    detail_type="connect",
+                    sub_type="",
+                    version=ImplVersion(**await self.get_version()),
+                ).model_dump(),
+                use_msgpack,
+            )
+        )
+        await websocket.send(
+            encode_data(
+                StatusUpdateMetaEvent(
+                    id=uuid.uuid4().hex,
+                    time=datetime.now(),
+                    type="meta",
+                    detail_type="status_update",
+                    sub_type="",
+                    status=await self.get_status(),
+                ).model_dump(),
+                use_msgpack,
+            )
+        )
+
     async def _ws_send(
         self,
-        websocket: WebSocket,
-        conn: Union[WebsocketConfig, WebsocketReverseConfig],
+        websocket: Union[WebSocket, UnixSocket],
+        conn: Union[WebsocketConfig, WebsocketReverseConfig, UnixSocketConfig],
+        queue: EventQueue,
+        batch: bool = False,
+        use_msgpack: Optional[bool] = None,
     ) -> None:
-        queue = Queue[Event]()
-        self.queues.append(queue)
+        if use_msgpack is None:
+            use_msgpack = conn.use_msgpack
         try:
+            # 等待客户端补发断线期间的事件，避免实时事件先于更早的事件送达
+            await queue.wait_released(conn.resume_wait_ms / 1000)
             while True:
-                event = await queue.get()
-                await websocket.send(encode_data(event.model_dump(), conn.use_msgpack))
+                # 取出队列中已积压的全部事件，一次编码后连续发送
+                events = [await queue.get()]
+                while not queue.empty() and len(events) < conn.max_batch_size:
+                    events.append(queue.get_nowait())
+                if batch:
+                    frames = [encode_events(events, use_msgpack)]
+                else:
+                    frames = [encode_event(event, use_msgpack) for event in events]
+                for frame in frames:
+                    await websocket.send(frame)
         except WebSocketClosed:
             log("WARNING", "<y>WebSocket Closed</y>")
         except Exception as e:
@@ -232,41 +549,99 @@ class OneBotImplementation:
                 e,
             )
         finally:
-            self.queues.remove(queue)
+            self.unsubscribe(queue)
+
+    async def _handle_action(
+        self, data: Any, queue: Optional[EventQueue]
+    ) -> dict[str, Any]:
+        echo = None
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Invalid action request")
+            echo = data.get("echo")
+            resp = await self._call_api(data, queue)
+        # 必要字段缺失或类型错误
+        except ValueError:
+            resp = {
+                "status": "failed",
+                "retcode": 10001,
+                "data": None,
+                "message": "Invalid data format",
+            }
+        # OneBot 实现内部发生了未捕获的意料之外的异常
+        except Exception as e:
+            resp = {
+                "status": "failed",
+                "retcode": 20002,
+                "data": None,
+                "message": str(e),
+            }
+        if echo is not None:
+            resp["echo"] = echo
+        return resp
+
+    async def _handle_actions(
+        self, data: Any, queue: Optional[EventQueue]
+    ) -> Union[dict[str, Any], list[dict[str, Any]]]:
+        """处理动作请求，数组形式的批量请求并发执行，按原顺序返回响应数组"""
+        if not isinstance(data, list):
+            return await self._handle_action(data, queue)
+        semaphore = Semaphore(self.config.obimpl_batch_concurrency)
+
+        async def handle(action: Any) -> dict[str, Any]:
+            async with semaphore:
+                return await self._handle_action(action, queue)
+
+        return list(await gather(*(handle(action) for action in data)))
 
-    async def _ws_recv(self, websocket: WebSocket) -> None:
+    async def _ws_recv(
+        self,
+        websocket: Union[WebSocket, UnixSocket],
+        queue: EventQueue,
+        use_msgpack: Optional[bool] = None,
+    ) -> None:
+        """处理动作请求
+
+        未协商编码格式时，响应使用与请求帧相同的格式
+        """
         try:
             while True:
-                echo = None
                 raw_data = await websocket.receive()
                 try:
-                    data = (
-                        json.loads(raw_data)
-                        if isinstance(raw_data, str)
-                        else msgpack.unpackb(raw_data)
+                    data = await offload(
+                        decode_data, len(raw_data), raw_data, process=True
                     )
-                    if "echo" in data:
-                        echo = data["echo"]
-                    resp = await self._call_api(data)
-                # 格式错误（包括实现不支持 MessagePack 的情况）、必要字段缺失或类型错误
-                except (json.JSONDecodeError, msgpack.UnpackException):
+                    resp = await self._handle_actions(data, queue)
+                # 格式错误（包括实现不支持 MessagePack 的情况）、嵌套过深、
+                # 必要字段缺失或类型错误
+                except (
+                    ValueError,
+                    TypeError,
+                    RecursionError,
+                    msgpack.UnpackException,
+                ) as e:
                     resp = {
                         "status": "failed",
                         "retcode": 10001,
                         "data": None,
                         "message": "Invalid data format",
                     }
-                # OneBot 实现内部发生了未捕获的意料之外的异常
-                except Exception as e:
-                    resp = {
-                        "status": "failed",
-                        "retcode": 20002,
-                        "data": None,
-                        "message": str(e),
-                    }
-                if echo is not None:
-                    resp["echo"] = echo
-                await websocket.send(encode_data(resp, isinstance(raw_data, bytes)))
+                    # 帧尾部有多余数据时，已解码的部分中可能含有 echo
+                    if isinstance(e, msgpack.ExtraData) and isinstance(
+                        e.unpacked, dict
+                    ):
+                        if (echo := e.unpacked.get("echo")) is not None:
+                            resp["echo"] = echo
+                await websocket.send(
+                    encode_data(
+                        resp,
+                        (
+                            isinstance(raw_data, bytes)
+                            if use_msgpack is None
+                            else use_msgpack
+                        ),
+                    )
+                )
         except WebSocketClosed:
             log("WARNING", "WebSocket closed by peer")
         # 与 WebSocket 服务器的连接发生了意料之外的错误
@@ -277,9 +652,38 @@ class OneBotImplementation:
                 e,
             )
 
+    def _get_client_id(self, request: Request) -> str:
+        client_id = request.headers.get("X-All4One-Client-Id")
+        if client_id is None:
+            client_id = request.url.query.get("client_id")
+        if client_id is None:
+            client_id = get_auth_bearer(request.headers.get("Authorization"))
+        if client_id is None:
+            client_id = request.url.query.get("access_token", "")
+        return client_id
+
+    async def _get_client_queue(
+        self, queues: dict[str, EventQueue], conn: HTTPConfig, request: Request
+    ) -> EventQueue:
+        """获取 HTTP 客户端的事件队列，每个客户端独立消费事件"""
+        now = monotonic()
+        for client_id, queue in list(queues.items()):
+            if (
+                client_id != conn.access_token
+                and now - queue.atime > conn.client_expire
+            ):
+                self.unsubscribe(queues.pop(client_id))
+        client_id = self._get_client_id(request)
+        if (queue := queues.get(client_id)) is None:
+            queue = queues[client_id] = await self.subscribe(
+                maxsize=conn.event_buffer_size, linger=conn.event_linger_ms / 1000
+            )
+        queue.atime = now
+        return queue
+
     async def _handle_http(
         self,
-        queue: Optional[Queue[Event]],
+        queues: Optional[dict[str, EventQueue]],
         conn: HTTPConfig,
         request: Request,
     ) -> Response:
@@ -290,77 +694,411 @@ class OneBotImplementation:
         content_type = request.headers.get("Content-Type")
         if content_type not in ("application/json", "application/msgpack"):
             return Response(415, content="Invalid Content-Type")
+        content_encoding = request.headers.get("Content-Encoding")
+        if content_encoding not in (None, "identity", *get_encodings()):
+            return Response(415, content="Invalid Content-Encoding")
 
-        echo = None
         try:
             if request.content is None:
                 raise ValueError("Empty request body")
-            if content_type == "application/msgpack":
-                data = msgpack.unpackb(request.content)
-            else:
-                data = json.loads(request.content)
-            if "echo" in data:
-                echo = data["echo"]
-            data["params"]["queue"] = queue
-            resp = await self._call_api(data)
-        except (json.JSONDecodeError, msgpack.UnpackException, ValueError):
+            content = request.content
+            if isinstance(content, str):
+                content = content.encode()
+
+            try:
+                data = await offload(
+                    decode_body,
+                    len(content),
+                    content,
+                    content_encoding,
+                    conn.max_body_size,
+                    content_type == "application/msgpack",
+                    process=True,
+                )
+            # 请求体（解压后）超过大小限制时返回 HTTP 状态码 413
+            except PayloadTooLarge:
+                return Response(413, content="Payload Too Large")
+            # 只为通过校验且请求了事件的客户端分配事件队列
+            queue = None
+            if queues is not None and any(
+                isinstance(action, dict) and action.get("action") == "get_latest_events"
+                for action in (data if isinstance(data, list) else [data])
+            ):
+                queue = await self._get_client_queue(queues, conn, request)
+            resp = await self._handle_actions(data, queue)
+        except (
+            json.JSONDecodeError,
+            msgpack.UnpackException,
+            ValueError,
+            RecursionError,
+        ):
             resp = {
                 "status": "failed",
                 "retcode": 10001,
                 "data": None,
                 "message": "Invalid data format",
             }
-        except Exception as e:
-            resp = {
-                "status": "failed",
-                "retcode": 20002,
-                "data": None,
-                "message": str(e),
-            }
-        if echo is not None:
-            resp["echo"] = echo
-        return Response(
-            200,
-            headers={"Content-Type": content_type},
-            content=encode_data(resp, content_type != "application/json"),
-        )
+        # 客户端可以通过 Accept 请求头指定响应的编码格式
+        if (codec := self._get_codec(request)) is not None:
+            content_type = "application/msgpack" if codec else "application/json"
+        headers = {"Content-Type": content_type}
+        content = encode_data(resp, content_type != "application/json")
+        if len(content) >= self.config.obimpl_compression_threshold and (
+            encoding := choose_encoding(request.headers.get("Accept-Encoding"))
+        ):
+            content = compress_data(content, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Vary"] = "Accept-Encoding"
+        return Response(200, headers=headers, content=content)
 
     async def _handle_ws(self, conn: WebsocketConfig, websocket: WebSocket) -> None:
         if response := self._check_access_token(websocket.request, conn.access_token):
             content = cast(str, response.content)
             await websocket.close(1008, content)
             return
-        await websocket.accept()
-        await websocket.send(
-            encode_data(
-                ConnectMetaEvent(
-                    id=uuid.uuid4().hex,
-                    time=datetime.now(),
-                    type="meta",
-                    detail_type="connect",
-                    sub_type="",
-                    version=ImplVersion(**await self.get_version()),
-                ).model_dump(),
-                conn.use_msgpack,
+        protocol = await self._accept_websocket(websocket)
+        codec = self._get_codec(websocket.request, protocol)
+        use_msgpack = conn.use_msgpack if codec is None else codec
+        await self._send_meta_events(websocket, use_msgpack)
+        group, member = self._get_group(websocket.request)
+        last_seq = self._get_last_seq(websocket.request)
+        queue = await self.subscribe(last_seq, group=group or conn.group, member=member)
+        if last_seq is None:
+            queue.hold()
+        batch = conn.event_batch or self._get_event_batch(websocket.request)
+        t1 = create_task(self._ws_send(websocket, conn, queue, batch, use_msgpack))
+        t2 = create_task(self._ws_recv(websocket, queue, codec))
+        await t2
+        t1.cancel()
+
+    def _format_sse(self, events: list[Event]) -> str:
+        return "".join(
+            f"id: {get_seq(event)}\ndata: {encode_event(event, False)}\n\n"
+            for event in events
+        )
+
+    async def _stream_sse(
+        self, conn: SSEConfig, queue: EventQueue
+    ) -> AsyncGenerator[str, None]:
+        """持续推送事件，没有事件时每隔 heartbeat_interval 秒发送一条注释作为心跳"""
+        try:
+            # 先更新客户端的 Last-Event-ID，避免连接在第一个事件前断开时漏收事件
+            yield f"retry: {conn.retry_ms}\nid: {queue.seq}\n\n"
+            while True:
+                if events := await self.get_latest_events(
+                    queue, limit=conn.max_batch_size, timeout=conn.heartbeat_interval
+                ):
+                    yield self._format_sse(events)
+                else:
+                    yield ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    def _setup_sse_stream(self, conn: SSEConfig) -> bool:
+        """在驱动器的 ASGI 应用上注册流式的 SSE 路由
+
+        目前只有 FastAPI 驱动器支持流式响应，注册失败时返回 False
+        """
+        try:
+            from nonebot.drivers.fastapi import Driver as FastAPIDriver
+        except ImportError:
+            return False
+        if not isinstance(self.driver, FastAPIDriver):
+            return False
+        from starlette.responses import StreamingResponse
+        from starlette.requests import Request as StarletteRequest
+        from starlette.responses import Response as StarletteResponse
+
+        async def endpoint(request: StarletteRequest) -> StarletteResponse:
+            setup = Request("GET", str(request.url), headers=request.headers.items())
+            if response := self._check_access_token(setup, conn.access_token):
+                return StarletteResponse(response.content, response.status_code)
+            queue = await self.subscribe(
+                self._get_last_seq(setup), linger=conn.event_linger_ms / 1000
             )
+            return StreamingResponse(
+                self._stream_sse(conn, queue),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        self.driver.server_app.add_api_route(
+            "/all4one/events", endpoint, name="All4One SSE", methods=["GET"]
         )
-        await websocket.send(
-            encode_data(
-                StatusUpdateMetaEvent(
-                    id=uuid.uuid4().hex,
-                    time=datetime.now(),
-                    type="meta",
-                    detail_type="status_update",
-                    sub_type="",
-                    status=await self.get_status(),
-                ).model_dump(),
-                conn.use_msgpack,
+        return True
+
+    async def _handle_sse(self, conn: SSEConfig, request: Request) -> Response:
+        """以长轮询的形式推送 Server-Sent Events，用于不支持流式响应的驱动器
+
+        没有事件时挂起请求直到超时，推送一批事件后结束响应，
+        客户端按 retry 间隔带上 Last-Event-ID 重连，从下一个序号继续接收
+        """
+        if response := self._check_access_token(request, conn.access_token):
+            return response
+        queue = await self.subscribe(
+            self._get_last_seq(request), linger=conn.event_linger_ms / 1000
+        )
+        try:
+            events = await self.get_latest_events(
+                queue, limit=conn.max_batch_size, timeout=conn.timeout
             )
+        finally:
+            self.unsubscribe(queue)
+        content = f"retry: {conn.retry_ms}\n\n" + self._format_sse(events)
+        if not events:
+            # 没有事件时只更新客户端的 Last-Event-ID，避免重连期间漏收事件
+            content += f"id: {queue.seq}\n\n"
+        return Response(
+            200,
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+            },
+            content=content,
         )
-        t1 = create_task(self._ws_send(websocket, conn))
-        t2 = create_task(self._ws_recv(websocket))
-        await t2
-        t1.cancel()
+
+    async def _handle_unix(
+        self, conn: UnixSocketConfig, reader: StreamReader, writer: StreamWriter
+    ) -> None:
+        """处理 Unix 域套接字连接
+
+        每帧为 4 字节大端序长度前缀加负载，负载按 use_msgpack 编码。
+        客户端的首帧为握手对象，可包含 access_token 与 last_seq 字段，
+        之后的收发与正向 WebSocket 相同
+        """
+        socket = UnixSocket(reader, writer, conn.use_msgpack, conn.max_frame_size)
+        try:
+            raw_data = await socket.receive()
+            hello = (
+                json.loads(raw_data)
+                if isinstance(raw_data, str)
+                else msgpack.unpackb(raw_data)
+            )
+            if not isinstance(hello, dict):
+                raise ValueError("Invalid handshake")
+            if conn.access_token and hello.get("access_token") != conn.access_token:
+                log("WARNING", "<y>Unix socket authorization failed</y>")
+                return
+            await self._send_meta_events(socket, conn.use_msgpack)
+            last_seq = hello.get("last_seq")
+            if not isinstance(last_seq, int):
+                last_seq = None
+            queue = await self.subscribe(last_seq)
+            if last_seq is None:
+                queue.hold()
+            t1 = create_task(self._ws_send(socket, conn, queue, conn.event_batch))
+            t2 = create_task(self._ws_recv(socket, queue))
+            await t2
+            t1.cancel()
+        except WebSocketClosed:
+            log("WARNING", "Unix socket closed by peer")
+        except Exception as e:
+            log("ERROR", "<r>Error while process data from unix socket</r>", e)
+        finally:
+            await socket.close()
+
+    async def _start_unix_server(
+        self,
+        path: Path,
+        handler: Callable[[StreamReader, StreamWriter], Awaitable[None]],
+    ) -> None:
+        try:
+            from asyncio import start_unix_server
+        except ImportError:
+            log("ERROR", "Current platform does not support unix socket")
+            return
+        try:
+            await remove_stale_socket(path)
+        except OSError as e:
+            log("ERROR", f"<r>Failed to listen on unix socket {path}</r>", e)
+            return
+        self.servers.append(await start_unix_server(handler, path=str(path)))
+
+    async def _close_servers(self) -> None:
+        """关闭 Unix 域套接字服务器并删除套接字文件"""
+        for server in self.servers:
+            paths = [Path(socket.getsockname()) for socket in server.sockets]
+            server.close()
+            if close_clients := getattr(server, "close_clients", None):
+                close_clients()
+            try:
+                await wait_for(server.wait_closed(), 5)
+            except AsyncTimeoutError:
+                pass
+            for path in paths:
+                path.unlink(missing_ok=True)
+        self.servers.clear()
+
+    async def _open_unix_server(self, conn: UnixSocketConfig) -> None:
+        await self._start_unix_server(conn.path, partial(self._handle_unix, conn))
+
+    def _get_shard_path(self) -> Path:
+        return self.config.obimpl_shard_path or get_plugin_data_dir() / "shard.sock"
+
+    def _update_shard_bots(self, link: ShardLink, bots: list[BotStatus]) -> None:
+        """根据工作进程推送的机器人状态，注册或注销对应的代理中间件"""
+        for bot in bots:
+            user_id = bot.self.user_id
+            if bot.online:
+                link.bots[user_id] = bot.self
+                self.middlewares[user_id] = ShardBot(link, bot.self)
+            elif link.bots.pop(user_id, None) is not None:
+                self.middlewares.pop(user_id, None)
+
+    async def _handle_shard(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """前端进程：接收工作进程推送的事件与动作响应
+
+        工作进程的事件重新分配序号后推送给前端进程的所有连接，
+        发往工作进程上机器人的动作请求经由 ShardBot 转发
+        """
+        socket = UnixSocket(
+            reader, writer, True, self.config.obimpl_shard_max_frame_size
+        )
+        link = ShardLink(socket)
+        try:
+            while True:
+                data = msgpack.unpackb(await socket.receive())
+                if "retcode" in data:
+                    link.resolve(data)
+                    continue
+                data.pop(SEQ_FIELD, None)
+                if (event := OneBotAdapter.json_to_event(data, self.IMPL_NAME)) is None:
+                    continue
+                if isinstance(event, StatusUpdateMetaEvent):
+                    self._update_shard_bots(link, event.status.bots)
+                if event.detail_type != "connect":
+                    await self.dispatch(event)
+        except WebSocketClosed:
+            log("WARNING", "<y>Shard worker disconnected</y>")
+        except Exception as e:
+            log("ERROR", "<r>Error while process data from shard worker</r>", e)
+        finally:
+            link.close()
+            bots = [
+                BotStatus(self=bot_self, online=False)
+                for bot_self in link.bots.values()
+            ]
+            self._update_shard_bots(link, bots)
+            if bots:
+                await self.dispatch(
+                    StatusUpdateMetaEvent(
+                        id=uuid.uuid4().hex,
+                        time=datetime.now(),
+                        type="meta",
+                        detail_type="status_update",
+                        sub_type="",
+                        status=Status(good=True, bots=bots),
+                    )
+                )
+            await socket.close()
+
+    async def _shard_send(self, socket: UnixSocket, queue: EventQueue) -> None:
+        try:
+            while True:
+                await socket.send(encode_event(await queue.get(), True))
+        finally:
+            self.unsubscribe(queue)
+
+    async def _shard_recv(self, socket: UnixSocket) -> None:
+        """并发执行前端进程转发来的动作请求"""
+        tasks: set[Task] = set()
+
+        async def reply(data: Any) -> None:
+            try:
+                await socket.send(
+                    encode_data(await self._handle_action(data, None), True)
+                )
+            except WebSocketClosed:
+                pass
+
+        while True:
+            task = create_task(reply(msgpack.unpackb(await socket.receive())))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _shard_worker(self) -> None:
+        """工作进程：连接前端进程，推送事件并执行转发来的动作请求"""
+        try:
+            from asyncio import open_unix_connection
+        except ImportError:
+            log("ERROR", "Current platform does not support unix socket")
+            return
+        path = self._get_shard_path()
+        while True:
+            try:
+                reader, writer = await open_unix_connection(str(path))
+            except OSError:
+                log(
+                    "WARNING",
+                    "<y>Error while connect to shard front "
+                    f"{escape_tag(str(path))}. Trying to reconnect...</y>",
+                )
+                await sleep(self.config.obimpl_shard_reconnect_interval)
+                continue
+            socket = UnixSocket(
+                reader, writer, True, self.config.obimpl_shard_max_frame_size
+            )
+            try:
+                await self._send_meta_events(socket, True)
+                queue = await self.subscribe()
+                t1 = create_task(self._shard_send(socket, queue))
+                t2 = create_task(self._shard_recv(socket))
+                try:
+                    await t2
+                finally:
+                    t1.cancel()
+            except WebSocketClosed:
+                log("WARNING", "<y>Shard front disconnected</y>")
+            except Exception as e:
+                log("ERROR", "<r>Error while process data from shard front</r>", e)
+            finally:
+                await socket.close()
+            await sleep(self.config.obimpl_shard_reconnect_interval)
+
+    async def _handle_file(self, request: Request) -> Response:
+        """提供本地保存的文件，URL 由 get_file 签发，支持单个范围的 Range 请求"""
+        query = request.url.query
+        file_id = query.get("file_id", "")
+        if not verify(
+            file_url_secret, file_id, query.get("expires", ""), query.get("sig", "")
+        ):
+            return Response(403, content="Invalid or expired signature")
+        try:
+            file = await get_file(file_id)
+            etag = f'"{file.sha256}"'
+            if request.headers.get("If-None-Match") == etag:
+                return Response(304, headers={"ETag": etag})
+            data = None
+            if (size := file.size) is None:
+                data = await read_file(file)
+                size = len(data)
+            headers = {
+                "Content-Type": mimetypes.guess_type(file.name)[0]
+                or "application/octet-stream",
+                "Content-Disposition": f"inline; filename*=UTF-8''{quote(file.name)}",
+                "Accept-Ranges": "bytes",
+                "Cache-Control": "private",
+                "ETag": etag,
+            }
+            try:
+                range_ = parse_range(request.headers.get("Range"), size)
+            except ValueError:
+                return Response(416, headers={"Content-Range": f"bytes */{size}"})
+            if range_ is None:
+                content = data if data is not None else await read_file(file)
+                return Response(200, headers=headers, content=content)
+            start, end = range_
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+            content = data[start:end] if data is not None else None
+            if content is None:
+                content = await read_file(file, start, end)
+            return Response(206, headers=headers, content=content)
+        except (DatabaseError, ValueError):
+            return Response(404, content="File not found")
+
+    async def _call_webhook_actions(self, actions: list[dict[str, Any]]) -> None:
+        for action in actions:
+            await self._call_api(action)
 
     async def _http_webhook(self, conn: HTTPWebhookConfig):
         headers = {
@@ -373,8 +1111,11 @@ class OneBotImplementation:
         }
         if conn.access_token:
             headers["Authorization"] = f"Bearer {conn.access_token}"
-        queue = Queue[Event]()
-        self.queues.append(queue)
+        compression = conn.compression
+        if compression and compression not in get_encodings():
+            log("WARNING", f"<y>Compression {compression} is not available</y>")
+            compression = None
+        queue = await self.subscribe()
         await queue.put(
             StatusUpdateMetaEvent(
                 id=uuid.uuid4().hex,
@@ -387,29 +1128,61 @@ class OneBotImplementation:
         )
         while True:
             try:
-                event = await queue.get()
+                events = [await queue.get()]
+                if conn.event_batch:
+                    # 在 max_linger_ms 内合并事件，以数组的形式一次推送
+                    await queue.collect(
+                        events, conn.max_batch_size, conn.max_linger_ms / 1000
+                    )
+                    content = encode_events(events, conn.use_msgpack)
+                else:
+                    content = encode_event(events[0], conn.use_msgpack)
+                request_headers = headers
+                if (
+                    compression
+                    and len(content) >= self.config.obimpl_compression_threshold
+                ):
+                    content = compress_data(content, compression)
+                    request_headers = {**headers, "Content-Encoding": compression}
                 request = Request(
                     "POST",
                     str(conn.url),
-                    headers=headers,
-                    content=encode_data(event.model_dump(), conn.use_msgpack),
+                    headers=request_headers,
+                    content=content,
                 )
                 resp = await self.request(request)
                 if resp.status_code == 200:
                     try:
                         if resp.content is None:
                             raise ValueError("Empty response body")
-                        if (
-                            content_type := resp.headers.get("Content-Type")
-                        ) == "application/msgpack":
-                            data = msgpack.unpackb(resp.content)
-                        elif content_type == "application/json":
-                            data = json.loads(resp.content)
-                        else:
+                        content_type = resp.headers.get("Content-Type")
+                        if content_type not in (
+                            "application/msgpack",
+                            "application/json",
+                        ):
                             log("ERROR", "Invalid Content-Type")
                             continue
-                        for action in data:
-                            await self._call_api(action)
+                        data = await offload(
+                            decode_data,
+                            len(resp.content),
+                            resp.content,
+                            content_type == "application/msgpack",
+                            process=True,
+                        )
+                        # 批量推送时，响应数组按下标对应每个事件的动作列表
+                        if conn.event_batch and all(
+                            isinstance(actions, list) or actions is None
+                            for actions in data
+                        ):
+                            await gather(
+                                *(
+                                    self._call_webhook_actions(actions)
+                                    for actions in data
+                                    if actions
+                                )
+                            )
+                        else:
+                            await self._call_webhook_actions(data)
                     # 动作请求执行出错
                     except Exception as e:
                         log("ERROR", "HTTP Webhook Response action failed", e)
@@ -424,7 +1197,7 @@ class OneBotImplementation:
                     "ERROR",
                     f"Current driver {self.driver.type} does not support http client",
                 )
-                self.queues.remove(queue)
+                self.unsubscribe(queue)
                 break
             except Exception as e:
                 log("ERROR", "HTTP Webhook event push failed", e)
@@ -446,34 +1219,14 @@ class OneBotImplementation:
             try:
                 async with self.websocket(req) as ws:
                     try:
-                        await ws.send(
-                            encode_data(
-                                ConnectMetaEvent(
-                                    id=uuid.uuid4().hex,
-                                    time=datetime.now(),
-                                    type="meta",
-                                    detail_type="connect",
-                                    sub_type="",
-                                    version=ImplVersion(**await self.get_version()),
-                                ).model_dump(),
-                                conn.use_msgpack,
-                            )
-                        )
-                        await ws.send(
-                            encode_data(
-                                StatusUpdateMetaEvent(
-                                    id=uuid.uuid4().hex,
-                                    time=datetime.now(),
-                                    type="meta",
-                                    detail_type="status_update",
-                                    sub_type="",
-                                    status=await self.get_status(),
-                                ).model_dump(),
-                                conn.use_msgpack,
-                            )
+                        await self._send_meta_events(ws, conn.use_msgpack)
+                        queue = await self.subscribe(group=conn.group)
+                        # 反向 WebSocket 只能通过 all4one.resume 补发事件
+                        queue.hold()
+                        t1 = create_task(
+                            self._ws_send(ws, conn, queue, conn.event_batch)
                         )
-                        t1 = create_task(self._ws_send(ws, conn))
-                        t2 = create_task(self._ws_recv(ws))
+                        t2 = create_task(self._ws_recv(ws, queue))
                         await t2
                         t1.cancel()
                     except WebSocketClosed:
@@ -500,13 +1253,52 @@ class OneBotImplementation:
                 )
             await sleep(conn.reconnect_interval)
 
+    async def _journal_flush(self) -> None:
+        assert self.journal
+        while True:
+            await sleep(self.config.obimpl_journal_flush_interval)
+            try:
+                await self.journal.flush()
+            except Exception as e:
+                log("ERROR", "<r>Failed to write event journal</r>", e)
+
+    async def _migrate_layout(self) -> None:
+        try:
+            if count := await migrate_layout():
+                log("INFO", f"Migrated {count} files to the sharded layout")
+        except Exception as e:
+            log("ERROR", "<r>Failed to migrate file layout</r>", e)
+
+    async def _collect_garbage(self) -> None:
+        while True:
+            try:
+                if freed := await collect_garbage(
+                    database.plugin_config.obimpl_storage_quota,
+                    database.plugin_config.obimpl_storage_max_age,
+                ):
+                    log("INFO", f"Freed {freed} bytes of stored files")
+            except Exception as e:
+                log("ERROR", "<r>Failed to collect stored files</r>", e)
+            await sleep(database.plugin_config.obimpl_storage_gc_interval)
+
+    def _open_journal(self) -> None:
+        self.journal = Journal(
+            get_plugin_data_dir() / "journal",
+            self.config.obimpl_journal_segment_size,
+            self.config.obimpl_journal_max_segments,
+            self.config.obimpl_journal_fsync,
+        )
+        # 重启后从日志中的最大序号继续分配
+        self.replay.seq = self.journal.open()
+        self.tasks.append(create_task(self._journal_flush()))
+
     async def bot_connect(self, bot: Bot) -> None:
         if (middleware := self._middlewares.get(bot.type, None)) is None:
             return
         middleware = middleware(bot)
         self.middlewares[bot.self_id] = middleware
-        for queue in self.queues:
-            event = StatusUpdateMetaEvent(
+        await self.dispatch(
+            StatusUpdateMetaEvent(
                 id=uuid.uuid4().hex,
                 time=datetime.now(),
                 type="meta",
@@ -517,13 +1309,13 @@ class OneBotImplementation:
                     bots=[BotStatus(self=await middleware.get_bot_self(), online=True)],
                 ),
             )
-            await queue.put(event)
+        )
 
     async def bot_disconnect(self, bot: Bot) -> None:
         if (middleware := self.middlewares.pop(bot.self_id, None)) is None:
             return
-        for queue in self.queues:
-            event = StatusUpdateMetaEvent(
+        await self.dispatch(
+            StatusUpdateMetaEvent(
                 id=uuid.uuid4().hex,
                 time=datetime.now(),
                 type="meta",
@@ -536,7 +1328,7 @@ class OneBotImplementation:
                     ],
                 ),
             )
-            await queue.put(event)
+        )
 
     def _register_middlewares(self, middlewares: Optional[set[str]] = None):
         if middlewares is None:
@@ -550,18 +1342,47 @@ class OneBotImplementation:
     def setup(self):
         @self.driver.on_startup
         async def _():
+            if self.config.obimpl_shard:
+                enable_shared_access()
             self._register_middlewares(self.config.middlewares)
+            if self.config.obimpl_journal:
+                self._open_journal()
+            if database.plugin_config.obimpl_file_url_base is not None:
+                self.setup_http_server(
+                    HTTPServerSetup(
+                        URL(FILE_ROUTE), "GET", "All4One File", self._handle_file
+                    )
+                )
+            if database.plugin_config.obimpl_storage_migrate:
+                self.tasks.append(create_task(self._migrate_layout()))
+            if (
+                database.plugin_config.obimpl_storage_quota is not None
+                or database.plugin_config.obimpl_storage_max_age is not None
+            ):
+                self.tasks.append(create_task(self._collect_garbage()))
+            if self.config.obimpl_shard == "front":
+                await self._start_unix_server(
+                    self._get_shard_path(), self._handle_shard
+                )
+            elif self.config.obimpl_shard == "worker":
+                self.tasks.append(create_task(self._shard_worker()))
             for conn in self.config.obimpl_connections:
                 if isinstance(conn, HTTPConfig):
-                    queue = None
+                    queues = None
                     if conn.event_enabled:
-                        queue = Queue[Event](conn.event_buffer_size)
+                        # 未指定客户端 ID 的请求共用默认队列
+                        queues = {
+                            conn.access_token: await self.subscribe(
+                                maxsize=conn.event_buffer_size,
+                                linger=conn.event_linger_ms / 1000,
+                            )
+                        }
                     self.setup_http_server(
                         HTTPServerSetup(
                             URL("/all4one/"),
                             "POST",
                             "All4One",
-                            partial(self._handle_http, queue, conn),
+                            partial(self._handle_http, queues, conn),
                         )
                     )
                 elif isinstance(conn, HTTPWebhookConfig):
@@ -576,6 +1397,24 @@ class OneBotImplementation:
                     )
                 elif isinstance(conn, WebsocketReverseConfig):
                     self.tasks.append(create_task(self._websocket_rev(conn)))
+                elif isinstance(conn, UnixSocketConfig):
+                    await self._open_unix_server(conn)
+                elif isinstance(conn, SSEConfig):
+                    if self._setup_sse_stream(conn):
+                        continue
+                    log(
+                        "WARNING",
+                        f"<y>Current driver {self.driver.type} does not support "
+                        "streaming responses, falling back to long polling SSE</y>",
+                    )
+                    self.setup_http_server(
+                        HTTPServerSetup(
+                            URL("/all4one/events"),
+                            "GET",
+                            "All4One SSE",
+                            partial(self._handle_sse, conn),
+                        )
+                    )
 
         @self.driver.on_shutdown
         async def _():
@@ -583,6 +1422,9 @@ class OneBotImplementation:
                 if not task.done():
                     task.cancel()
             await gather(*self.tasks, return_exceptions=True)
+            await self._close_servers()
+            if self.journal:
+                self.journal.close()
 
         @self.driver.on_bot_connect
         async def _(bot: Bot):
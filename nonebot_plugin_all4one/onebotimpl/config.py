@@ -1,4 +1,5 @@
 from enum import Enum
+from pathlib import Path
 from typing import Union, Literal, Optional
 
 from pydantic import AnyUrl, BaseModel
@@ -10,6 +11,8 @@ class ConnectionType(str, Enum):
     HTTP_WEBHOOK = "http_webhook"
     WEBSOCKET = "websocket"
     WEBSOCKET_REV = "websocket_rev"
+    SSE = "sse"
+    UNIX = "unix"
 
 
 class BaseConnectionConfig(BaseModel):
@@ -24,6 +27,9 @@ class HTTPConfig(BaseConnectionConfig):
     type: Literal[ConnectionType.HTTP]
     event_enabled: bool = False
     event_buffer_size: int = 16
+    event_linger_ms: int = 20
+    client_expire: int = 300
+    max_body_size: int = 64 * 1024 * 1024
 
 
 class HTTPWebhookConfig(BaseConnectionConfig):
@@ -31,11 +37,19 @@ class HTTPWebhookConfig(BaseConnectionConfig):
     url: AnyUrl
     timeout: int = 4
     use_msgpack: bool = False
+    event_batch: bool = False
+    max_batch_size: int = 64
+    max_linger_ms: int = 20
+    compression: Optional[Literal["gzip", "zstd"]] = None
 
 
 class WebsocketConfig(BaseConnectionConfig):
     type: Literal[ConnectionType.WEBSOCKET]
     use_msgpack: bool = False
+    event_batch: bool = False
+    max_batch_size: int = 64
+    resume_wait_ms: int = 500
+    group: Optional[str] = None
 
 
 class WebsocketReverseConfig(BaseConnectionConfig):
@@ -43,13 +57,55 @@ class WebsocketReverseConfig(BaseConnectionConfig):
     url: WSUrl
     reconnect_interval: int = 4
     use_msgpack: bool = False
+    event_batch: bool = False
+    max_batch_size: int = 64
+    resume_wait_ms: int = 500
+    group: Optional[str] = None
+
+
+class SSEConfig(BaseConnectionConfig):
+    type: Literal[ConnectionType.SSE]
+    timeout: int = 30
+    max_batch_size: int = 64
+    event_linger_ms: int = 20
+    retry_ms: int = 0
+    heartbeat_interval: float = 15
+
+
+class UnixSocketConfig(BaseConnectionConfig):
+    type: Literal[ConnectionType.UNIX]
+    path: Path
+    use_msgpack: bool = False
+    event_batch: bool = False
+    max_batch_size: int = 64
+    resume_wait_ms: int = 500
+    max_frame_size: int = 64 * 1024 * 1024
 
 
 class Config(BaseModel):
     obimpl_connections: list[
-        Union[HTTPConfig, HTTPWebhookConfig, WebsocketConfig, WebsocketReverseConfig]
+        Union[
+            HTTPConfig,
+            HTTPWebhookConfig,
+            WebsocketConfig,
+            WebsocketReverseConfig,
+            SSEConfig,
+            UnixSocketConfig,
+        ]
     ] = []
     middlewares: Optional[set[str]] = None
+    obimpl_replay_buffer_size: int = 1024
+    obimpl_batch_concurrency: int = 16
+    obimpl_compression_threshold: int = 1024
+    obimpl_journal: bool = False
+    obimpl_journal_segment_size: int = 16 * 1024 * 1024
+    obimpl_journal_max_segments: int = 16
+    obimpl_journal_flush_interval: float = 0.2
+    obimpl_journal_fsync: bool = False
+    obimpl_shard: Optional[Literal["front", "worker"]] = None
+    obimpl_shard_path: Optional[Path] = None
+    obimpl_shard_reconnect_interval: int = 4
+    obimpl_shard_max_frame_size: int = 64 * 1024 * 1024
 
     class Config:
         extra = "ignore"
@@ -0,0 +1,65 @@
+from hashlib import blake2b
+from typing import Optional
+
+from nonebot.adapters.onebot.v12 import Event
+
+from .replay import EventQueue
+
+
+def get_partition_key(event: Event) -> Optional[str]:
+    """获取事件的分区键，同一会话的事件分区键相同
+
+    元事件没有分区键，会投递给组内的每个成员
+    """
+    if (group_id := getattr(event, "group_id", None)) is not None:
+        return f"group:{group_id}"
+    if (guild_id := getattr(event, "guild_id", None)) is not None:
+        return f"guild:{guild_id}"
+    if (user_id := getattr(event, "user_id", None)) is not None:
+        return f"user:{user_id}"
+    if event.type == "meta":
+        return None
+    return f"event:{event.id}"
+
+
+class ConsumerGroup:
+    """消费组，组内的每个事件只投递给一个成员
+
+    使用最高随机权重（rendezvous）哈希按分区键选择成员，同一会话的事件
+    始终由同一个成员按顺序处理；成员变动时只有离开成员的分区会被重新分配
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.members: dict[str, EventQueue] = {}
+
+    def _weight(self, key: str, member: str) -> int:
+        digest = blake2b(f"{self.name}:{key}:{member}".encode(), digest_size=8)
+        return int.from_bytes(digest.digest(), "big")
+
+    def owner(self, key: str) -> Optional[EventQueue]:
+        """获取分区键所属成员的事件队列"""
+        if not self.members:
+            return None
+        return self.members[max(self.members, key=lambda m: self._weight(key, m))]
+
+    def put_latest(self, event: Event) -> None:
+        if (key := get_partition_key(event)) is None:
+            for queue in self.members.values():
+                queue.put_latest(event)
+        elif queue := self.owner(key):
+            queue.put_latest(event)
+
+    def join(self, member: str, queue: EventQueue) -> None:
+        self.members[member] = queue
+
+    def leave(self, queue: EventQueue) -> bool:
+        """移除成员，并将其尚未消费的事件重新分配给其他成员"""
+        members = [member for member, q in self.members.items() if q is queue]
+        for member in members:
+            del self.members[member]
+        while members and not queue.empty():
+            event = queue.get_nowait()
+            if get_partition_key(event) is not None:
+                self.put_latest(event)
+        return bool(members)
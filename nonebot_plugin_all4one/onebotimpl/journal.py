@@ -0,0 +1,165 @@
+import os
+import mmap
+import struct
+from asyncio import Lock
+from pathlib import Path
+from typing import Optional, cast
+from collections.abc import Iterator
+
+import msgpack
+from anyio import to_thread
+from nonebot.adapters.onebot.v12 import Event
+from nonebot.adapters.onebot.v12 import Adapter as OneBotAdapter
+
+from ..logger import log
+from .utils import encode_event
+from .replay import SEQ_FIELD, get_seq
+
+# 帧头：负载长度、事件序号
+FRAME_HEADER = struct.Struct(">IQ")
+SEGMENT_SUFFIX = ".journal"
+
+
+def iter_segment(path: Path) -> Iterator[tuple[int, int, bytes]]:
+    """遍历分段文件中完整的帧，返回 (帧结束位置, 事件序号, 负载)"""
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset + FRAME_HEADER.size <= len(mm):
+                length, seq = FRAME_HEADER.unpack_from(mm, offset)
+                end = offset + FRAME_HEADER.size + length
+                # 写入中断导致的不完整帧
+                if end > len(mm):
+                    return
+                yield end, seq, mm[offset + FRAME_HEADER.size : end]
+                offset = end
+
+
+def decode_frame(seq: int, payload: bytes) -> Optional[Event]:
+    """将帧负载还原为事件"""
+    data = msgpack.unpackb(payload)
+    data.pop(SEQ_FIELD, None)
+    if event := OneBotAdapter.json_to_event(data, "nonebot-plugin-all4one"):
+        setattr(event, SEQ_FIELD, seq)
+    return event
+
+
+class Journal:
+    """只追加的事件日志
+
+    事件以 MessagePack 编码后加上长度前缀写入滚动的分段文件，分段文件以其第一个
+    事件的序号命名；写入先进入内存中的批次，由 flush 统一落盘
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_size: int,
+        max_segments: int,
+        fsync: bool = False,
+    ):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.fsync = fsync
+        self.seq = 0
+        self._pending: list[bytes] = []
+        self._pending_seq = 0
+        self._file = None
+        self._size = 0
+        self._lock = Lock()
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.path.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def open(self) -> int:
+        """打开日志，截断末尾不完整的帧，返回已写入的最大序号"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        if segments := self._segments():
+            # 最新的分段为空时，已写入的最大序号为该分段起始序号的前一个
+            self.seq = max(int(segments[-1].stem) - 1, 0)
+            end = 0
+            for end, seq, _ in iter_segment(segments[-1]):
+                self.seq = seq
+            if end < segments[-1].stat().st_size:
+                log(
+                    "WARNING", f"<y>Truncating torn journal frame in {segments[-1]}</y>"
+                )
+                os.truncate(segments[-1], end)
+            self._file = segments[-1].open("ab")
+            self._size = end
+        return self.seq
+
+    def append(self, event: Event) -> None:
+        """将事件加入待写入的批次"""
+        if (seq := get_seq(event)) is None:
+            return
+        payload = cast(bytes, encode_event(event, True))
+        self._pending.append(FRAME_HEADER.pack(len(payload), seq) + payload)
+        self._pending_seq = seq
+
+    def _write(self, frames: list[bytes], last_seq: int) -> None:
+        for frame in frames:
+            if self._file is None or self._size >= self.segment_size:
+                self._roll(FRAME_HEADER.unpack_from(frame)[1])
+            assert self._file
+            self._file.write(frame)
+            self._size += len(frame)
+        self._sync()
+        self.seq = last_seq
+
+    def _sync(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _roll(self, first_seq: int) -> None:
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._file = (self.path / f"{first_seq:020d}{SEGMENT_SUFFIX}").open("ab")
+        self._size = 0
+        for segment in self._segments()[: -self.max_segments]:
+            segment.unlink(missing_ok=True)
+
+    async def flush(self) -> None:
+        """将待写入的批次写入分段文件"""
+        async with self._lock:
+            if not self._pending:
+                return
+            frames, self._pending = self._pending, []
+            await to_thread.run_sync(self._write, frames, self._pending_seq)
+
+    def close(self) -> None:
+        if self._pending:
+            frames, self._pending = self._pending, []
+            self._write(frames, self._pending_seq)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read(self, seq: int, until: Optional[int]) -> list[Event]:
+        segments = self._segments()
+        events = []
+        for i, segment in enumerate(segments):
+            # 下一个分段的起始序号不大于 seq + 1 时，本分段中没有需要的事件
+            if i + 1 < len(segments) and int(segments[i + 1].stem) <= seq + 1:
+                continue
+            for _, frame_seq, payload in iter_segment(segment):
+                if frame_seq <= seq:
+                    continue
+                if until is not None and frame_seq > until:
+                    return events
+                if event := decode_frame(frame_seq, payload):
+                    events.append(event)
+        return events
+
+    async def read(self, seq: int, until: Optional[int] = None) -> list[Event]:
+        """读取序号在 (seq, until] 之间的事件"""
+        await self.flush()
+        async with self._lock:
+            return await to_thread.run_sync(self._read, seq, until)
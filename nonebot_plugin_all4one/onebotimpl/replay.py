@@ -0,0 +1,116 @@
+from asyncio import Queue
+from time import monotonic
+from typing import Optional
+from itertools import islice
+from collections import deque
+from asyncio import Event as AsyncEvent
+from asyncio import wait_for, get_running_loop
+from asyncio import TimeoutError as AsyncTimeoutError
+
+from nonebot.adapters.onebot.v12 import Event
+
+from ..logger import log
+
+# 事件序号扩展字段
+# https://12.onebot.dev/interface/rules/#_2
+SEQ_FIELD = "all4one.seq"
+
+
+def get_seq(event: Event) -> Optional[int]:
+    """获取事件的序号"""
+    return getattr(event, SEQ_FIELD, None)
+
+
+class EventQueue(Queue[Event]):
+    """连接的事件队列
+
+    seq 为队列注册时已分配的最大事件序号，之后的事件都会实时推送到队列中；
+    linger 为长轮询被唤醒后继续收集事件的秒数；atime 为最近一次被轮询的时间；
+    released 未设置时推送方应暂缓推送，等待客户端补发断线期间的事件
+    """
+
+    def __init__(self, maxsize: int = 0, seq: int = 0, linger: float = 0):
+        super().__init__(maxsize)
+        self.seq = seq
+        self.linger = linger
+        self.atime = monotonic()
+        self.released = AsyncEvent()
+        self.released.set()
+
+    def hold(self) -> None:
+        """暂缓推送，直到 release 被调用"""
+        self.released.clear()
+
+    def release(self) -> None:
+        """恢复推送"""
+        self.released.set()
+
+    async def wait_released(self, timeout: float) -> None:
+        """等待恢复推送，超过 timeout 秒后自动恢复"""
+        if self.released.is_set():
+            return
+        try:
+            await wait_for(self.released.wait(), timeout)
+        except AsyncTimeoutError:
+            self.release()
+
+    async def collect(self, events: list[Event], limit: int, linger: float) -> None:
+        """在 linger 秒内继续收集事件，直到数量达到 limit（0 表示不限制）"""
+        loop = get_running_loop()
+        deadline = loop.time() + linger
+        while limit <= 0 or len(events) < limit:
+            if not self.empty():
+                events.append(self.get_nowait())
+                continue
+            if (remaining := deadline - loop.time()) <= 0:
+                break
+            try:
+                events.append(await wait_for(self.get(), remaining))
+            except AsyncTimeoutError:
+                break
+
+    def put_latest(self, event: Event) -> None:
+        """放入事件，队列已满时丢弃最旧的事件"""
+        if self.full():
+            self.get_nowait()
+        self.put_nowait(event)
+
+    def prepend(self, events: list[Event]) -> None:
+        """将更早的事件放到已积压的事件之前，队列已满时丢弃最旧的事件"""
+        pending = [self.get_nowait() for _ in range(self.qsize())]
+        for event in events + pending:
+            self.put_latest(event)
+
+
+class ReplayBuffer:
+    """事件重放缓冲区
+
+    为每个事件分配递增的序号，并保留最近的 size 个事件，用于断线重连后补发
+    """
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.events: deque[Event] = deque(maxlen=size)
+
+    @property
+    def first(self) -> int:
+        """缓冲区内最旧事件的序号"""
+        return self.seq - len(self.events) + 1
+
+    def append(self, event: Event) -> int:
+        self.seq += 1
+        setattr(event, SEQ_FIELD, self.seq)
+        self.events.append(event)
+        return self.seq
+
+    def since(self, seq: int, until: Optional[int] = None) -> list[Event]:
+        """获取序号在 (seq, until] 之间的事件"""
+        first = self.first
+        if seq + 1 < first:
+            log(
+                "WARNING",
+                f"<y>Events {seq + 1}..{first - 1} have left the replay buffer</y>",
+            )
+        start = max(seq + 1 - first, 0)
+        stop = len(self.events) if until is None else max(until + 1 - first, 0)
+        return list(islice(self.events, start, stop))
@@ -0,0 +1,73 @@
+from typing import Any
+from itertools import count
+from asyncio import Future, get_running_loop
+
+from nonebot.exception import WebSocketClosed
+from nonebot.adapters.onebot.v12.event import BotSelf
+from nonebot.adapters.onebot.v12.exception import ActionFailedWithRetcode
+
+from .unix import UnixSocket
+from .utils import encode_data
+
+
+class ShardLink:
+    """前端进程与一个工作进程之间的连接
+
+    工作进程推送事件与动作响应，前端进程按 echo 将动作请求的响应对应回调用方
+    """
+
+    def __init__(self, socket: UnixSocket):
+        self.socket = socket
+        self.echo = count()
+        self.pending: dict[int, Future[dict[str, Any]]] = {}
+        self.bots: dict[str, BotSelf] = {}
+
+    async def call(self, data: dict[str, Any]) -> dict[str, Any]:
+        """向工作进程发送动作请求并等待响应"""
+        echo = next(self.echo)
+        future = self.pending[echo] = get_running_loop().create_future()
+        try:
+            await self.socket.send(encode_data({**data, "echo": echo}, True))
+            return await future
+        finally:
+            self.pending.pop(echo, None)
+
+    def resolve(self, resp: dict[str, Any]) -> None:
+        if (future := self.pending.get(resp.get("echo", -1))) and not future.done():
+            future.set_result(resp)
+
+    def close(self) -> None:
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(WebSocketClosed(1006))
+
+
+class ShardBot:
+    """前端进程中代表工作进程上一个机器人的中间件，动作请求转发给所属的工作进程"""
+
+    def __init__(self, link: ShardLink, bot_self: BotSelf):
+        self.link = link
+        self.bot_self = bot_self
+
+    @property
+    def self_id(self) -> str:
+        return self.bot_self.user_id
+
+    async def get_bot_self(self) -> BotSelf:
+        return self.bot_self
+
+    async def get_supported_actions(self, **kwargs: Any) -> list[str]:
+        return await self._call_api("get_supported_actions", **kwargs)
+
+    async def _call_api(self, api: str, **kwargs: Any) -> Any:
+        resp = await self.link.call(
+            {"action": api, "params": kwargs, "self": {"user_id": self.self_id}}
+        )
+        if resp.get("status") != "ok":
+            raise ActionFailedWithRetcode(
+                resp.get("status", "failed"),
+                resp.get("retcode", 20002),
+                resp.get("message", ""),
+                resp.get("data"),
+            )
+        return resp.get("data")
@@ -0,0 +1,88 @@
+import errno
+import struct
+from pathlib import Path
+from typing import Union
+from asyncio import (
+    Lock,
+    StreamReader,
+    StreamWriter,
+    IncompleteReadError,
+    open_unix_connection,
+)
+
+from anyio import Path as AsyncPath
+from nonebot.exception import WebSocketClosed
+
+# 帧头：负载长度
+FRAME_HEADER = struct.Struct(">I")
+
+
+async def remove_stale_socket(path: Path) -> None:
+    """清理上次运行遗留的套接字文件
+
+    只删除没有进程监听的套接字文件，仍在使用时抛出 OSError
+    """
+    if not await AsyncPath(path).is_socket():
+        return
+    try:
+        _, writer = await open_unix_connection(str(path))
+    except ConnectionRefusedError:
+        await AsyncPath(path).unlink(missing_ok=True)
+        return
+    except FileNotFoundError:
+        return
+    writer.close()
+    raise OSError(errno.EADDRINUSE, "Unix socket is in use", str(path))
+
+
+class UnixSocket:
+    """Unix 域套接字上的长度前缀帧连接
+
+    接口与 WebSocket 的 send/receive 保持一致，以便复用 WebSocket 的收发逻辑；
+    连接断开时抛出 WebSocketClosed
+    """
+
+    def __init__(
+        self,
+        reader: StreamReader,
+        writer: StreamWriter,
+        use_msgpack: bool,
+        max_frame_size: int,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.use_msgpack = use_msgpack
+        self.max_frame_size = max_frame_size
+        # 事件推送与动作响应可能同时写入，需要保证帧不交错
+        self.write_lock = Lock()
+
+    async def receive(self) -> Union[str, bytes]:
+        """接收一帧，MessagePack 编码时返回 bytes，否则返回 str"""
+        try:
+            (length,) = FRAME_HEADER.unpack(
+                await self.reader.readexactly(FRAME_HEADER.size)
+            )
+            if length > self.max_frame_size:
+                raise WebSocketClosed(1009, "Frame too large")
+            data = await self.reader.readexactly(length)
+        except (IncompleteReadError, ConnectionError):
+            raise WebSocketClosed(1006)
+        return data if self.use_msgpack else data.decode()
+
+    async def send(self, data: Union[str, bytes]) -> None:
+        """发送一帧"""
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            async with self.write_lock:
+                self.writer.write(FRAME_HEADER.pack(len(data)) + data)
+                await self.writer.drain()
+        except ConnectionError:
+            raise WebSocketClosed(1006)
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
@@ -1,12 +1,20 @@
+import gzip
 import json
+import zlib
 import datetime
-from typing import Union
 from base64 import b64encode
 from functools import partial
+from typing import Any, Union, Optional, cast
 
 import msgpack
+from pydantic import BaseModel
 from pydantic.json import custom_pydantic_encoder
 
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
 
 def timestamp(obj: datetime.datetime):
     return obj.timestamp()
@@ -25,13 +33,146 @@ json_type_encoders = {
     bytes: encode_bytes,
 }
 
+ENCODED_CACHE = "_all4one_encoded"
+
 msgpack_encoder = partial(custom_pydantic_encoder, msgpack_type_encoders)
 json_encoder = partial(custom_pydantic_encoder, json_type_encoders)
 
 
-def encode_data(data: dict, use_msgpack: bool) -> Union[str, bytes]:
+def encode_data(data: Union[dict, list], use_msgpack: bool) -> Union[str, bytes]:
     """编码数据"""
     if use_msgpack:
         return msgpack.packb(data, default=msgpack_encoder)  # type: ignore
     else:
         return json.dumps(data, default=json_encoder)
+
+
+def decode_data(data: Union[str, bytes], use_msgpack: Optional[bool] = None) -> Any:
+    """解码数据，未指定编码格式时 bytes 按 MessagePack、str 按 JSON 解码"""
+    if use_msgpack is None:
+        use_msgpack = isinstance(data, bytes)
+    return msgpack.unpackb(data) if use_msgpack else json.loads(data)
+
+
+def encode_event(event: BaseModel, use_msgpack: bool) -> Union[str, bytes]:
+    """编码事件
+
+    编码结果按格式缓存在事件对象上，同一事件推送给多个连接时每种格式只编码一次
+    """
+    if (cache := event.__dict__.get(ENCODED_CACHE)) is None:
+        cache = {}
+        # 绕过 pydantic 的属性检查，缓存不会出现在 model_dump 的结果中
+        object.__setattr__(event, ENCODED_CACHE, cache)
+    if (data := cache.get(use_msgpack)) is None:
+        data = cache[use_msgpack] = encode_data(event.model_dump(), use_msgpack)
+    return data
+
+
+def encode_events(events: list[BaseModel], use_msgpack: bool) -> Union[str, bytes]:
+    """将多个事件编码为一个数组，复用每个事件已缓存的编码结果"""
+    if use_msgpack:
+        return msgpack.Packer().pack_array_header(len(events)) + b"".join(
+            cast(bytes, encode_event(event, True)) for event in events
+        )
+    else:
+        return (
+            f"[{','.join(cast(str, encode_event(event, False)) for event in events)}]"
+        )
+
+
+def get_encodings() -> list[str]:
+    """支持的压缩编码，按优先级排序"""
+    return ["zstd", "gzip"] if zstandard else ["gzip"]
+
+
+def parse_accept(header: Optional[str]) -> dict[str, float]:
+    """解析 Accept、Accept-Encoding 等请求头，返回各项（小写）的权重 q"""
+    qualities = {}
+    for item in (header or "").split(","):
+        value, *params = item.split(";")
+        if not (value := value.strip().lower()):
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, q = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0
+        qualities[value] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据 Accept-Encoding 请求头选择压缩编码"""
+    accepted = {
+        coding
+        for coding, quality in parse_accept(accept_encoding).items()
+        if quality > 0
+    }
+    for encoding in get_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+
+
+def compress_data(data: Union[str, bytes], encoding: str) -> bytes:
+    """压缩数据"""
+    if isinstance(data, str):
+        data = data.encode()
+    if encoding == "zstd" and zstandard:
+        return zstandard.ZstdCompressor().compress(data)
+    elif encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+class PayloadTooLarge(ValueError):
+    """数据超过大小限制"""
+
+
+def _gunzip(data: bytes, max_size: int) -> bytes:
+    out = bytearray()
+    # gzip 数据可以由多个成员拼接而成
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out += decompressor.decompress(data, max_size + 1 - len(out))
+        if len(out) > max_size:
+            raise PayloadTooLarge
+        if not decompressor.eof:
+            raise ValueError("Truncated gzip data")
+        data = decompressor.unused_data
+    return bytes(out)
+
+
+def decompress_data(data: bytes, encoding: Optional[str], max_size: int) -> bytes:
+    """解压数据，流式解压，解压后超过 max_size 时抛出 PayloadTooLarge"""
+    if not encoding or encoding == "identity":
+        if len(data) > max_size:
+            raise PayloadTooLarge
+        return data
+    try:
+        if encoding == "zstd" and zstandard:
+            out = bytearray()
+            with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+                while len(out) <= max_size and (
+                    chunk := reader.read(max_size + 1 - len(out))
+                ):
+                    out += chunk
+            if len(out) > max_size:
+                raise PayloadTooLarge
+            return bytes(out)
+        elif encoding == "gzip":
+            return _gunzip(data, max_size)
+    except PayloadTooLarge:
+        raise
+    except Exception as e:
+        raise ValueError("Invalid compressed data") from e
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def decode_body(
+    data: bytes, encoding: Optional[str], max_size: int, use_msgpack: bool
+) -> Any:
+    """解压并解码 HTTP 请求体"""
+    return decode_data(decompress_data(data, encoding, max_size), use_msgpack)
@@ -1,10 +1,14 @@
 from pathlib import Path
+from typing import Optional
+from datetime import datetime
 
 import pytest
 import nonebot
 from sqlalchemy import delete
 from pytest_mock import MockerFixture
 from nonebug import NONEBOT_INIT_KWARGS, App
+from nonebot.adapters.onebot.v12 import Event
+from nonebot.adapters.onebot.v12 import GroupMessageEvent
 from nonebot.adapters.telegram import Adapter as TelegramAdapter
 from nonebot.adapters.onebot.v11 import Adapter as OnebotV11Adapter
 from nonebot.adapters.onebot.v12 import Adapter as OnebotV12Adapter
@@ -18,6 +22,35 @@ def pytest_configure(config: pytest.Config) -> None:
     }
 
 
+def make_event(
+    id: str, detail_type: str = "test", group_id: Optional[str] = None
+) -> Event:
+    """创建测试用的事件，传入 group_id 时创建群消息事件"""
+    if group_id is None:
+        return Event(
+            id=id,
+            time=datetime.now(),
+            type="meta",
+            detail_type=detail_type,
+            sub_type="",
+        )
+    return GroupMessageEvent.model_validate(
+        {
+            "id": id,
+            "time": datetime.now(),
+            "type": "message",
+            "detail_type": "group",
+            "sub_type": "",
+            "message_id": id,
+            "self": {"platform": "test", "user_id": "0"},
+            "message": [],
+            "alt_message": "",
+            "user_id": "0",
+            "group_id": group_id,
+        }
+    )
+
+
 @pytest.fixture(scope="session", autouse=True)
 def _load_adapters(nonebug_init: None):
     driver = nonebot.get_driver()
@@ -62,14 +95,24 @@ async def app(
 
     with monkeypatch.context() as m:
         m.setattr(nonebot_plugin_all4one.database, "FILE_PATH", tmp_path)
+        m.setattr(
+            nonebot_plugin_all4one.database,
+            "storage",
+            nonebot_plugin_all4one.database.LocalStorage(tmp_path, 2),
+        )
 
         yield App()
 
     # 清空数据库
-    from nonebot_plugin_all4one.database import File
+    from nonebot_plugin_all4one.database import Blob, File, UrlCache, blob_cache
 
     async with get_session() as session:
         await session.execute(delete(File))
+        await session.execute(delete(Blob))
+        await session.execute(delete(UrlCache))
+        await session.commit()
+    blob_cache.items.clear()
+    blob_cache.size = 0
 
 
 @pytest.fixture
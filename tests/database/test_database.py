@@ -1,13 +1,30 @@
+from pathlib import Path
+
+import pytest
 from nonebug import App
 from anyio import open_file
-from sqlalchemy import select
+from pytest_mock import MockerFixture
+from sqlalchemy import select, update
 
 
-async def test_database(app: App):
+async def test_database(app: App, mocker: MockerFixture):
     from nonebot_plugin_orm import get_session
 
-    from nonebot_plugin_all4one.database import File, get_file, upload_file
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import (
+        File,
+        get_file,
+        read_file,
+        upload_file,
+        get_local_path,
+    )
 
+    # 关闭内联保存，确认文件写入磁盘
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        0,
+    )
     file_sha256 = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
     file_id = await upload_file("test.txt", data=b"test")
     assert file_id
@@ -28,5 +45,394 @@ async def test_database(app: App):
 
     # 确认文件存在
     assert file.path
-    async with await open_file(file.path, "rb") as f:
+    local_path = await get_local_path(file)
+    assert local_path
+    async with await open_file(local_path, "rb") as f:
         assert (await f.read()) == b"test"
+    assert await read_file(file) == b"test"
+
+
+async def test_deduplicate(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import upload_file
+
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        0,
+    )
+    put = mocker.spy(nonebot_plugin_all4one.database.storage, "put")
+    assert await upload_file("a.txt", data=b"test") != await upload_file(
+        "b.txt", data=b"test"
+    )
+    # 内容相同的文件只写入一次
+    assert put.call_count == 1
+
+
+async def test_upload_inline_twice(app: App):
+    from asyncio import gather
+
+    from nonebot_plugin_all4one.database import (
+        get_file,
+        read_file,
+        get_sha256,
+        upload_file,
+    )
+
+    # 并发上传相同的小文件
+    first, second = await gather(
+        upload_file("a.txt", data=b"tiny"), upload_file("b.txt", data=b"tiny")
+    )
+    # 按 SHA256 复用已有内容的记录同样可以读取
+    third = await upload_file("c.txt", sha256=get_sha256(b"tiny"))
+    for file_id in (first, second, third):
+        file = await get_file(file_id)
+        assert file.size == 4
+        assert await read_file(file) == b"tiny"
+
+
+async def test_migrate_layout(app: App, tmp_path: Path):
+    from nonebot_plugin_orm import get_session
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import (
+        File,
+        read_file,
+        get_sha256,
+        migrate_layout,
+    )
+
+    storage = nonebot_plugin_all4one.database.storage
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    contents = [b"a", b"b", b"b"]
+    async with get_session() as session:
+        for i, data in enumerate(contents):
+            sha256 = get_sha256(data)
+            # 旧记录可能保存绝对路径，也可能保存平铺布局的文件名
+            if i:
+                path = legacy / f"{sha256}.txt"
+                path.write_bytes(data)
+                path = str(path)
+            else:
+                (tmp_path / f"{sha256}.txt").write_bytes(data)
+                path = f"{sha256}.txt"
+            session.add(File(name=f"{i}.txt", path=path, sha256=sha256))
+        await session.commit()
+
+    assert await migrate_layout(batch_size=1) == 3
+    assert await migrate_layout() == 0
+    assert not list(legacy.iterdir())
+
+    async with get_session() as session:
+        files = (await session.scalars(select(File))).all()
+        for file in files:
+            assert file.path == file.sha256
+            assert storage.local_path(file.path).parent.parent.parent == tmp_path
+            assert await read_file(file) in contents
+
+
+async def test_collect_garbage(app: App, mocker: MockerFixture):
+    from httpx import Response, AsyncClient
+    from nonebot_plugin_orm import get_session
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import (
+        File,
+        get_file,
+        read_file,
+        upload_file,
+        collect_garbage,
+    )
+
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config, "obimpl_storage_quota", 0
+    )
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        0,
+    )
+    storage = nonebot_plugin_all4one.database.storage
+    local_id = await upload_file("local.txt", data=b"local")
+    # 只有 src_id 的文件无法重新下载，不会被回收
+    src_id = await upload_file("src.txt", "telegram", "AgAD", data=b"src")
+    file_ids = []
+    for i in range(3):
+        mocker.patch.object(
+            AsyncClient, "get", return_value=Response(200, content=b"remote%d" % i)
+        )
+        file_ids.append(await upload_file(f"{i}.txt", url=f"http://localhost/{i}.txt"))
+    # 访问过的文件最后回收
+    await get_file(file_ids[0])
+
+    # 只回收可以重新下载的文件，直到总大小不超过配额
+    assert await collect_garbage(quota=len(b"localsrcremote0")) == 14
+    async with get_session() as session:
+        files = {
+            file.id.hex: file for file in (await session.scalars(select(File))).all()
+        }
+    assert files[local_id].path
+    assert files[src_id].path
+    assert files[file_ids[0]].path
+    assert files[file_ids[0]].atime
+    for file_id in file_ids[1:]:
+        assert files[file_id].path is None
+        assert files[file_id].size == 7
+    assert len(list(storage.root.glob("??/??/*"))) == 3
+
+    # 回收的文件在读取时重新下载
+    get = mocker.patch.object(
+        AsyncClient, "get", return_value=Response(200, content=b"remote1")
+    )
+    assert await read_file(files[file_ids[1]]) == b"remote1"
+    get.assert_called_once()
+    assert (await get_file(file_ids[1])).path == files[file_ids[1]].sha256
+
+
+async def test_collect_garbage_race(app: App, mocker: MockerFixture):
+    from contextlib import asynccontextmanager
+
+    from httpx import Response, AsyncClient
+    from nonebot_plugin_orm import get_session
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import (
+        File,
+        get_file,
+        read_file,
+        upload_file,
+        collect_garbage,
+    )
+
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        0,
+    )
+    mocker.patch.object(AsyncClient, "get", return_value=Response(200, content=b"a"))
+    remote = await get_file(await upload_file("a.txt", url="http://localhost/a.txt"))
+
+    # 选出回收候选之后，新的本地记录引用了同一内容
+    sessions = []
+
+    @asynccontextmanager
+    async def hooked_session():
+        async with get_session() as session:
+            if len(sessions) == 1:
+                session.add(
+                    File(name="b.txt", path=remote.path, sha256=remote.sha256, size=1)
+                )
+                await session.commit()
+            sessions.append(session)
+            yield session
+
+    mocker.patch.object(nonebot_plugin_all4one.database, "get_session", hooked_session)
+    assert await collect_garbage(quota=0) == 0
+    mocker.stopall()
+    assert await read_file(await get_file(remote.id.hex)) == b"a"
+
+
+async def test_read_file_redownload(app: App, mocker: MockerFixture):
+    from httpx import Response, AsyncClient
+    from nonebot_plugin_orm import get_session
+    from nonebot.adapters.onebot.v12.exception import DatabaseError
+
+    from nonebot_plugin_all4one.database import (
+        File,
+        get_file,
+        read_file,
+        upload_file,
+    )
+
+    mocker.patch.object(AsyncClient, "get", return_value=Response(200, content=b"a"))
+    file = await get_file(await upload_file("a.txt", url="http://localhost/a.txt"))
+    async with get_session() as session:
+        await session.execute(update(File).values(path=None))
+        await session.commit()
+    file.path = None
+
+    # 下载失败或内容变化时不覆盖记录
+    for response in (Response(404, content=b"not found"), Response(200, content=b"b")):
+        mocker.patch.object(AsyncClient, "get", return_value=response)
+        with pytest.raises(DatabaseError):
+            await read_file(file)
+    async with get_session() as session:
+        record = (await session.scalars(select(File))).one()
+        assert record.path is None
+        assert record.sha256 == file.sha256
+
+
+async def test_inline_blob(app: App, mocker: MockerFixture):
+    from nonebot_plugin_orm import get_session
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import (
+        Blob,
+        File,
+        read_file,
+        blob_cache,
+        upload_file,
+        get_local_path,
+    )
+
+    put = mocker.spy(nonebot_plugin_all4one.database.storage, "put")
+    await upload_file("small.txt", data=b"small")
+    await upload_file("large.bin", data=b"0" * (64 * 1024))
+
+    # 小文件保存在数据库中，不写入磁盘
+    assert put.call_count == 1
+    async with get_session() as session:
+        small, large = sorted(
+            (await session.scalars(select(File))).all(), key=lambda file: file.size
+        )
+        assert (await session.scalars(select(Blob))).one().data == b"small"
+    assert await get_local_path(small) is None
+    assert await get_local_path(large)
+
+    # 读取时优先使用内存缓存，其次是数据库
+    assert await read_file(small) == b"small"
+    blob_cache.pop(small.sha256)  # type: ignore
+    assert await read_file(small) == b"small"
+    assert blob_cache.get(small.sha256) == b"small"  # type: ignore
+
+    # 调整内联阈值后仍然可以从另一层中读取
+    blob_cache.pop(small.sha256)  # type: ignore
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        0,
+    )
+    assert await read_file(small) == b"small"
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config,
+        "obimpl_storage_inline_threshold",
+        128 * 1024,
+    )
+    assert await read_file(large) == b"0" * (64 * 1024)
+
+    # 需要路径时将内联保存的内容写入本地存储
+    local_path = await get_local_path(small, create=True)
+    assert local_path
+    async with await open_file(local_path, "rb") as f:
+        assert (await f.read()) == b"small"
+
+
+async def test_url_cache(app: App, mocker: MockerFixture):
+    from threading import Thread
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import get_file, read_file, upload_file
+
+    requests: list[int] = []
+    content = [b"banner"]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag = f'"{len(content[0])}"'
+            if self.headers.get("If-None-Match") == etag:
+                requests.append(304)
+                self.send_response(304)
+                self.end_headers()
+                return
+            requests.append(200)
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(content[0])))
+            self.end_headers()
+            self.wfile.write(content[0])
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/banner.png"
+    try:
+        first = await upload_file(url=url)
+
+        # 新鲜期内不发出请求
+        second = await upload_file("banner.png", url=url)
+        assert first != second
+        assert requests == [200]
+        assert (await get_file(second)).name == "banner.png"
+
+        # 超过新鲜期后发出条件请求，未修改时不重新下载
+        mocker.patch.object(
+            nonebot_plugin_all4one.database.plugin_config, "obimpl_url_cache_ttl", 0
+        )
+        third = await upload_file(url=url)
+        assert requests == [200, 304]
+        assert (await get_file(third)).sha256 == (await get_file(first)).sha256
+
+        # 内容修改后重新下载
+        content[0] = b"new banner"
+        fourth = await get_file(await upload_file(url=url))
+        assert requests == [200, 304, 200]
+        assert await read_file(fourth) == b"new banner"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+async def test_url_cache_concurrent(app: App, mocker: MockerFixture):
+    from asyncio import gather
+
+    from httpx import Response, AsyncClient
+
+    from nonebot_plugin_all4one.database import get_file, read_file, upload_file
+
+    mocker.patch.object(
+        AsyncClient, "get", return_value=Response(200, content=b"banner")
+    )
+    # 并发下载未缓存的 URL
+    file_ids = await gather(
+        *(upload_file(url="http://localhost/banner.png") for _ in range(2))
+    )
+    for file_id in file_ids:
+        assert await read_file(await get_file(file_id)) == b"banner"
+
+
+async def test_decode_base64(app: App, mocker: MockerFixture):
+    from hashlib import sha256
+    from base64 import b64encode
+
+    import nonebot_plugin_all4one.offload
+    from nonebot_plugin_all4one.database import get_file, read_file, upload_file
+
+    data = bytes(range(256)) * 8192
+    mocker.patch.object(
+        nonebot_plugin_all4one.offload.plugin_config, "obimpl_offload_threshold", 0
+    )
+
+    # 超过阈值的 base64 在线程池中分块解码，结果与一次性解码一致
+    file = await get_file(await upload_file("large.bin", data=b64encode(data).decode()))
+    assert file.sha256 == sha256(data).hexdigest()
+    assert await read_file(file) == data
+
+    # 含有换行的 base64 退回一次性解码
+    encoded = b64encode(data).decode()
+    encoded = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+    file = await get_file(await upload_file("wrapped.bin", data=encoded))
+    assert file.sha256 == sha256(data).hexdigest()
+
+
+async def test_enable_shared_access(app: App, mocker: MockerFixture, tmp_path: Path):
+    from sqlalchemy import text, create_engine
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import enable_shared_access
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'all4one.db'}")
+    other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    session = mocker.patch.object(nonebot_plugin_all4one.database, "get_session")
+    session.return_value.get_bind.return_value = engine
+    enable_shared_access()
+
+    # 只有本插件使用的引擎启用 WAL，其他引擎不受影响
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    with other.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() != "wal"
@@ -0,0 +1,105 @@
+from pathlib import Path
+from collections.abc import AsyncIterator
+
+import pytest
+from httpx import Request, Response, AsyncClient, MockTransport
+
+
+async def stream(data: bytes, size: int) -> AsyncIterator[bytes]:
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+class FakeS3:
+    """以本地目录模拟的 S3 服务"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.uploads: dict[str, dict[int, bytes]] = {}
+
+    def __call__(self, request: Request) -> Response:
+        assert request.headers["Authorization"].startswith("AWS4-HMAC-SHA256 ")
+        path = self.root / request.url.path.lstrip("/").replace("/", "_")
+        params = request.url.params
+        if request.method == "POST" and "uploads" in params:
+            upload_id = str(len(self.uploads))
+            self.uploads[upload_id] = {}
+            return Response(
+                200,
+                content=(
+                    '<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/'
+                    f'doc/2006-03-01/"><UploadId>{upload_id}</UploadId>'
+                    "</InitiateMultipartUploadResult>"
+                ),
+            )
+        if request.method == "PUT" and "uploadId" in params:
+            parts = self.uploads[params["uploadId"]]
+            parts[int(params["partNumber"])] = request.content
+            return Response(200, headers={"ETag": f'"{params["partNumber"]}"'})
+        if request.method == "POST" and "uploadId" in params:
+            parts = self.uploads.pop(params["uploadId"])
+            path.write_bytes(b"".join(parts[i] for i in sorted(parts)))
+            return Response(200)
+        if request.method == "PUT":
+            path.write_bytes(request.content)
+            return Response(200)
+        if not path.exists():
+            return Response(404)
+        if request.method == "DELETE":
+            path.unlink()
+            return Response(204)
+        data = path.read_bytes()
+        if request.method == "HEAD":
+            return Response(200, headers={"Content-Length": str(len(data))})
+        if range_ := request.headers.get("Range"):
+            start, _, end = range_.removeprefix("bytes=").partition("-")
+            data = data[int(start) : int(end) + 1 if end else None]
+            return Response(206, content=data)
+        return Response(200, content=data)
+
+
+async def test_local_storage(tmp_path: Path):
+    from nonebot_plugin_all4one.database.storage import LocalStorage
+
+    storage = LocalStorage(tmp_path, depth=2)
+    await storage.put("abcdef", stream(b"0123456789", 3))
+    assert storage.local_path("abcdef") == tmp_path / "ab" / "cd" / "abcdef"
+    assert await storage.read("abcdef") == b"0123456789"
+    assert await storage.read("abcdef", 2, 5) == b"234"
+    assert await storage.size("abcdef") == 10
+
+    await storage.delete("abcdef")
+    assert not await storage.exists("abcdef")
+    with pytest.raises(FileNotFoundError):
+        await storage.read("abcdef")
+
+
+async def test_s3_storage(tmp_path: Path):
+    from nonebot_plugin_all4one.database.storage import S3Storage
+
+    fake = FakeS3(tmp_path)
+    storage = S3Storage(
+        "http://localhost:9000",
+        "bucket",
+        "us-east-1",
+        "access",
+        "secret",
+        prefix="all4one/",
+        client=AsyncClient(transport=MockTransport(fake)),
+        part_size=4,
+    )
+    # 超过分段大小的数据流使用分段上传
+    await storage.put("key", stream(b"0123456789", 3))
+    assert (tmp_path / "bucket_all4one_key").read_bytes() == b"0123456789"
+    assert not fake.uploads
+    assert await storage.read("key", 2, 5) == b"234"
+    assert await storage.size("key") == 10
+
+    await storage.put("small", b"abc")
+    assert await storage.read("small") == b"abc"
+    assert storage.local_path("small") is None
+
+    await storage.delete("key")
+    assert not await storage.exists("key")
+    with pytest.raises(FileNotFoundError):
+        await storage.read("key")
@@ -2,6 +2,7 @@ import json
 from pathlib import Path
 
 from nonebug import App
+from pytest_mock import MockerFixture
 from nonebot.adapters.onebot.v11 import Bot, Adapter
 from nonebot.adapters.onebot.v12 import GroupMessageEvent, PrivateMessageEvent
 
@@ -35,3 +36,49 @@ async def test_to_onebot_event(app: App):
         assert event[0].message[0].type == "reply"
         assert event[0].message[0].data.get("message_id") == "2"
         assert event[0].message[0].data.get("user_id") == "1"
+
+
+async def test_build_event(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.middlewares.base
+    from nonebot_plugin_all4one.middlewares.onebot_v11 import Middleware
+
+    with (Path(__file__).parent / "events.json").open("r", encoding="utf8") as f:
+        test_events = json.load(f)
+
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        config = nonebot_plugin_all4one.middlewares.base.plugin_config
+
+        # 跳过校验创建的事件与完整校验的结果一致
+        for data in test_events:
+            event = Adapter.json_to_event(data)
+            assert event
+            mocker.patch.object(config, "obimpl_validate_events", False)
+            (fast,) = await middleware.to_onebot_event(event)
+            mocker.patch.object(config, "obimpl_validate_events", True)
+            (validated,) = await middleware.to_onebot_event(event)
+            assert type(fast) is type(validated)
+            assert fast.model_dump(exclude={"id"}) == validated.model_dump(
+                exclude={"id"}
+            )
+
+
+async def test_message_cache_payload(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.middlewares.onebot_v11
+    from nonebot_plugin_all4one.database import upload_file
+    from nonebot_plugin_all4one.middlewares.base import message_cache
+    from nonebot_plugin_all4one.middlewares.onebot_v11 import Middleware
+
+    file_id = await upload_file("image.png", data=b"0" * 1024)
+    message = [{"type": "image", "data": {"file_id": file_id}}]
+    read_file = mocker.spy(nonebot_plugin_all4one.middlewares.onebot_v11, "read_file")
+    mocker.patch.object(message_cache, "max_bytes", 1024)
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        # 图片以 base64:// 字符串携带，编码后超过缓存上限，不缓存
+        for _ in range(2):
+            segments = await middleware.convert_from_onebot(message)
+    assert segments[0].data["file"].startswith("base64://")
+    assert read_file.call_count == 2
@@ -1,7 +1,9 @@
 import json
 from pathlib import Path
 
+import pytest
 from nonebug import App
+from pytest_mock import MockerFixture
 from nonebot.adapters.telegram import Bot, Event
 from nonebot.adapters.telegram.model import Chat
 from nonebot.adapters.telegram.model import Message
@@ -112,6 +114,93 @@ async def test_send_message(app: App):
         )
 
 
+@pytest.mark.parametrize("inline", [True, False])
+async def test_broadcast_message(app: App, mocker: MockerFixture, inline: bool):
+    from nonebot.adapters.telegram.model import PhotoSize
+
+    import nonebot_plugin_all4one.database
+    import nonebot_plugin_all4one.middlewares.telegram
+    from nonebot_plugin_all4one.middlewares.telegram import Middleware
+    from nonebot_plugin_all4one.database import (
+        get_file,
+        upload_file,
+        get_local_path,
+        get_file_version,
+    )
+
+    get = mocker.spy(nonebot_plugin_all4one.middlewares.telegram, "get_file")
+    if not inline:
+        mocker.patch.object(
+            nonebot_plugin_all4one.database.plugin_config,
+            "obimpl_storage_inline_threshold",
+            0,
+        )
+
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(
+            base=Bot,
+            self_id=Bot.get_bot_id_by_token(bot_config.token),
+            config=bot_config,
+        )
+        middleware = Middleware(bot)
+
+        file_id = await upload_file(name="test", data=b"test")
+        # 小文件以数据上传，保存在磁盘上的文件以路径上传
+        content = b"test" if inline else await get_local_path(await get_file(file_id))
+        assert content
+        params = {
+            "message_thread_id": None,
+            "caption": None,
+            "caption_entities": None,
+            "reply_parameters": None,
+            "disable_notification": None,
+            "protect_content": None,
+            "reply_to_message_id": None,
+            "allow_sending_without_reply": None,
+            "parse_mode": None,
+            "has_spoiler": None,
+            "reply_markup": None,
+        }
+        # 第一次发送时上传文件，之后的目标引用返回的 file_id
+        ctx.should_call_api(
+            "send_photo",
+            {"chat_id": 1111, "photo": content, **params},
+            Message(
+                message_id=1,
+                date=1,
+                chat=Chat(type="private", id=1111),
+                photo=[
+                    PhotoSize(file_id="uploaded", file_unique_id="", width=1, height=1)
+                ],
+            ),
+        )
+        for chat_id in (2222, 3333):
+            ctx.should_call_api(
+                "send_photo",
+                {"chat_id": chat_id, "photo": "uploaded", **params},
+                Message(message_id=2, date=1, chat=Chat(type="private", id=chat_id)),
+            )
+        version = get_file_version()
+        results = await middleware._call_api(
+            "all4one.broadcast_message",
+            targets=[
+                {"detail_type": "private", "user_id": "1111"},
+                {"detail_type": "private", "user_id": "2222"},
+                {"detail_type": "private", "user_id": "3333"},
+            ],
+            message=[{"type": "image", "data": {"file_id": file_id}}],
+            concurrency=1,
+        )
+        assert [result["data"]["message_id"] for result in results] == [
+            "1111/1",
+            "2222/2",
+            "3333/2",
+        ]
+        # 上传后只重新转换引用该文件的消息，之后的目标共用转换结果
+        assert get.call_count == 3
+        assert get_file_version() == version
+
+
 async def test_delete_message(app: App):
     from nonebot_plugin_all4one.middlewares.telegram import Middleware
 
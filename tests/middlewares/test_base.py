@@ -0,0 +1,365 @@
+from nonebug import App
+from pydantic import TypeAdapter
+from pytest_mock import MockerFixture
+from nonebot.adapters.onebot.v11 import Bot
+from nonebot.adapters.onebot.v12 import PrivateMessageEvent
+from nonebot.adapters.onebot.v11.event import (
+    PrivateMessageEvent as V11PrivateMessageEvent,
+)
+from nonebot.adapters.onebot.v11.event import (
+    Sender,
+    NoticeEvent,
+    HeartbeatMetaEvent,
+)
+
+
+async def test_converter(app: App):
+    from nonebot_plugin_all4one.middlewares.base import FieldGetter, converter
+    from nonebot_plugin_all4one.middlewares.base import Middleware as BaseMiddleware
+
+    class Middleware(BaseMiddleware):
+        @classmethod
+        def get_name(cls):
+            return "fake"
+
+        def get_platform(self):
+            return "fake"
+
+        fields = FieldGetter("user_id", "group_id", "time")
+
+        @converter(NoticeEvent)
+        async def _notice_event(self, event):
+            return []
+
+        @converter(V11PrivateMessageEvent)
+        async def _private_message_event(self, event):
+            return {
+                "id": "1",
+                "type": "message",
+                "detail_type": "private",
+                "sub_type": "",
+                "self": await self.get_bot_self(),
+                "message_id": "1",
+                "message": [],
+                "alt_message": "",
+                **{k: str(v) for k, v in self.fields(event).items()},
+            }
+
+    class SubMiddleware(Middleware):
+        pass
+
+    # 只有存在的字段被提取
+    event = V11PrivateMessageEvent(
+        time=0,
+        self_id=0,
+        post_type="message",
+        message_type="private",
+        sub_type="friend",
+        message_id=1,
+        user_id=2,
+        message=[],  # type: ignore
+        original_message=[],  # type: ignore
+        raw_message="",
+        font=0,
+        sender=Sender(),
+    )
+    assert Middleware.fields(event) == {"user_id": 2, "time": 0}
+
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = SubMiddleware(bot)
+        (event_out,) = await middleware.to_onebot_event(event)
+        assert isinstance(event_out, PrivateMessageEvent)
+        assert event_out.user_id == "2"
+
+    # 子类继承父类注册的转换函数，未注册的类型沿 MRO 查找并缓存
+    assert SubMiddleware.get_converter(V11PrivateMessageEvent) is (
+        Middleware._private_message_event
+    )
+    assert SubMiddleware.get_converter(HeartbeatMetaEvent) is None
+    assert HeartbeatMetaEvent in SubMiddleware._converter_cache
+
+
+async def test_segment_table(app: App):
+    from asyncio import sleep
+
+    from nonebot.adapters.onebot.v11 import Message, MessageSegment
+    from nonebot.adapters.onebot.v12 import MessageSegment as OneBotMessageSegment
+
+    from nonebot_plugin_all4one.middlewares.base import Middleware as BaseMiddleware
+    from nonebot_plugin_all4one.middlewares.base import (
+        to_onebot_segment,
+        from_onebot_segment,
+    )
+
+    calls = []
+    active = []
+    peak = []
+
+    class Middleware(BaseMiddleware):
+        @classmethod
+        def get_name(cls):
+            return "fake"
+
+        def get_platform(self):
+            return "fake"
+
+        @to_onebot_segment("text")
+        def _text(self, segment):
+            return OneBotMessageSegment.text(segment.data["text"])
+
+        @to_onebot_segment("image")
+        async def _image(self, segment):
+            calls.append(segment.data["file"])
+            active.append(segment)
+            peak.append(len(active))
+            await sleep(0.01)
+            active.remove(segment)
+            return OneBotMessageSegment.image(segment.data["file"])
+
+        @to_onebot_segment("*")
+        def _unknown(self, segment):
+            return [OneBotMessageSegment.text("["), OneBotMessageSegment.text("]")]
+
+        @from_onebot_segment("mention")
+        def _mention(self, segment, prefix):
+            return MessageSegment.text(prefix + segment.data["user_id"])
+
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+
+        message = await middleware.convert_to_onebot(
+            Message(
+                [
+                    MessageSegment.image("a"),
+                    MessageSegment.text("b"),
+                    MessageSegment.image("c"),
+                    MessageSegment.face(1),
+                    MessageSegment.image("a"),
+                ]
+            )
+        )
+        # 媒体并发解析，结果保持原有顺序，相同的消息段只转换一次
+        assert [segment.data for segment in message] == [
+            {"file_id": "a"},
+            {"text": "b"},
+            {"file_id": "c"},
+            {"text": "["},
+            {"text": "]"},
+            {"file_id": "a"},
+        ]
+        assert message[0] is not message[5]
+        assert calls == ["a", "c"]
+        assert max(peak) == 2
+
+        # 没有注册的消息段被忽略，参数传给转换函数
+        assert await middleware.convert_from_onebot(
+            [
+                OneBotMessageSegment.mention("1"),
+                OneBotMessageSegment.text("2"),
+            ],
+            prefix="@",
+        ) == [MessageSegment.text("@1")]
+
+
+async def test_message_cache(app: App, mocker: MockerFixture):
+    from uuid import UUID, uuid4
+
+    from nonebot.adapters.onebot.v11 import MessageSegment
+    from nonebot.adapters.onebot.v12 import Message as OneBotMessage
+
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.database import touched, invalidate_files
+    from nonebot_plugin_all4one.middlewares.base import from_onebot_segment
+    from nonebot_plugin_all4one.middlewares.base import Middleware as BaseMiddleware
+
+    calls = []
+
+    class Middleware(BaseMiddleware):
+        @classmethod
+        def get_name(cls):
+            return "cache"
+
+        def get_platform(self):
+            return "cache"
+
+        @from_onebot_segment("image")
+        async def _image(self, segment, **kwargs):
+            calls.append(segment.data["file_id"])
+            return MessageSegment.image(b"content")
+
+        @from_onebot_segment("forward", cache=False)
+        async def _forward(self, segment, **kwargs):
+            calls.append(segment.data["id"])
+            return MessageSegment.forward(segment.data["id"])
+
+    message = [{"type": "image", "data": {"file_id": "1"}}]
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+
+        first = await middleware.convert_from_onebot(message)
+        # 原始消息与校验后的消息命中同一缓存，返回的是副本
+        second = await middleware.convert_from_onebot(
+            TypeAdapter(OneBotMessage).validate_python(message)
+        )
+        assert calls == ["1"]
+        assert first == second
+        assert first[0] is not second[0]
+
+        # 参数不同时分别缓存
+        await middleware.convert_from_onebot(message, chat_id="1")
+        assert calls == ["1", "1"]
+
+        # 文件记录变化后缓存失效
+        invalidate_files()
+        await middleware.convert_from_onebot(message)
+        assert calls == ["1", "1", "1"]
+
+    # 有副作用的消息段每次都转换
+    forward = [*message, {"type": "forward", "data": {"id": "f"}}]
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        for _ in range(2):
+            await middleware.convert_from_onebot(forward)
+    assert calls[-4:] == ["1", "f", "1", "f"]
+
+    # 命中缓存时同样更新消息引用的文件的访问时间
+    mocker.patch.object(
+        nonebot_plugin_all4one.database.plugin_config, "obimpl_storage_quota", 0
+    )
+    file_id = uuid4().hex
+    message = [{"type": "image", "data": {"file_id": file_id}}]
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        await middleware.convert_from_onebot(message)
+        touched.clear()
+        await middleware.convert_from_onebot(message)
+        assert calls[-1] == file_id
+        assert len(calls) == 8
+        assert UUID(file_id) in touched
+
+
+async def test_message_cache_payload(app: App):
+    from pydantic import BaseModel
+    from nonebot.adapters import MessageSegment
+
+    from nonebot_plugin_all4one.middlewares.cache import MessageCache
+
+    # 与 Discord 适配器的附件相同，文件内容保存在嵌套的模型中
+    class File(BaseModel):
+        filename: str
+        content: bytes
+
+    class AttachmentSegment(MessageSegment):
+        @classmethod
+        def get_message_class(cls):
+            raise NotImplementedError
+
+        def __str__(self):
+            return ""
+
+        def is_text(self):
+            return False
+
+    cache = MessageCache(8, 1024)
+    small = AttachmentSegment("attachment", {"file": File(filename="a", content=b"0")})
+    large = AttachmentSegment(
+        "attachment", {"file": File(filename="b", content=b"0" * 2048)}
+    )
+    cache.put("small", 0, [small])
+    cache.put("large", 0, [large])
+    assert cache.get("small", 0)
+    # 超过上限的内容不缓存
+    assert cache.get("large", 0) is None
+    assert cache.size < 1024
+
+
+async def test_broadcast_message(app: App):
+    from asyncio import sleep
+
+    from nonebot.adapters.onebot.v11 import MessageSegment
+    from nonebot.adapters.onebot.v12.exception import PlatformError
+
+    from nonebot_plugin_all4one.middlewares.base import Middleware as BaseMiddleware
+    from nonebot_plugin_all4one.middlewares.base import (
+        supported_action,
+        from_onebot_segment,
+    )
+
+    calls = []
+    sending = []
+    max_sending = []
+
+    class Middleware(BaseMiddleware):
+        @classmethod
+        def get_name(cls):
+            return "broadcast"
+
+        def get_platform(self):
+            return "broadcast"
+
+        @from_onebot_segment("image")
+        async def _image(self, segment, **kwargs):
+            calls.append(segment.data["file_id"])
+            return MessageSegment.image(b"content")
+
+        @supported_action
+        async def send_message(self, *, detail_type, group_id, message, **kwargs):
+            await self.convert_from_onebot(message)
+            sending.append(group_id)
+            max_sending.append(len(sending))
+            await sleep(0.01)
+            sending.remove(group_id)
+            if group_id == "2":
+                raise PlatformError("failed", 34001, "blocked", None)
+            return {"message_id": group_id, "time": 0}
+
+    message = [{"type": "image", "data": {"file_id": "1"}}]
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        assert "all4one.broadcast_message" in await middleware.get_supported_actions()
+
+        targets = [{"detail_type": "group", "group_id": str(i)} for i in range(6)]
+        results = await middleware._call_api(
+            "all4one.broadcast_message", targets=targets, message=message, concurrency=2
+        )
+
+    # 消息只转换一次，发送数量不超过并发上限，失败的目标单独报告
+    assert calls == ["1"]
+    assert max(max_sending) == 2
+    assert [result["status"] for result in results] == ["ok"] * 2 + ["failed"] + [
+        "ok"
+    ] * 3
+    assert results[0]["data"] == {"message_id": "0", "time": 0}
+    assert results[2]["retcode"] == 34001
+    assert results[2]["message"] == "blocked"
+
+
+async def test_get_file_path(app: App):
+    from anyio import open_file
+
+    from nonebot_plugin_all4one.database import upload_file
+    from nonebot_plugin_all4one.middlewares.base import Middleware as BaseMiddleware
+
+    class Middleware(BaseMiddleware):
+        @classmethod
+        def get_name(cls):
+            return "file"
+
+        def get_platform(self):
+            return "file"
+
+    file_id = await upload_file("small.txt", data=b"small")
+    async with app.test_api() as ctx:
+        bot = ctx.create_bot(base=Bot, self_id="0")
+        middleware = Middleware(bot)
+        result = await middleware._call_api("get_file", type="path", file_id=file_id)
+
+    # 内联保存的小文件按需写入本地存储后返回路径
+    async with await open_file(result["path"], "rb") as f:
+        assert (await f.read()) == b"small"
@@ -1,4 +1,9 @@
+import gzip
+import json
+from typing import Optional
+
 from nonebug import App
+from nonebot.drivers import Request
 
 
 async def test_get_supported_action(app: App, FakeMiddleware):
@@ -14,3 +19,104 @@ async def test_get_supported_action(app: App, FakeMiddleware):
             "get_supported_actions",
             "get_supported_message_segments",
         }
+
+
+async def test_batch_actions(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(type="http")  # type: ignore
+    request = Request(
+        "POST",
+        "http://localhost/all4one/",
+        headers={"Content-Type": "application/json"},
+        content=json.dumps(
+            [
+                {"action": "get_version", "params": {}, "echo": "1"},
+                {"action": "unknown", "params": {}, "echo": "2"},
+                "invalid",
+            ]
+        ),
+    )
+    response = await obimpl._handle_http(None, conn, request)
+    resp = json.loads(response.content)  # type: ignore
+    # 按请求顺序返回，并带上各自的 echo
+    assert [item.get("echo") for item in resp] == ["1", "2", None]
+    assert resp[0]["data"]["impl"] == "nonebot-plugin-all4one"
+    assert resp[1]["retcode"] == 10101
+    assert resp[2]["retcode"] == 10001
+
+
+async def test_compression(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(type="http")  # type: ignore
+    actions = [{"action": "get_version", "params": {}}] * 64
+    request = Request(
+        "POST",
+        "http://localhost/all4one/",
+        headers={
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Accept-Encoding": "br;q=1, gzip;q=0.5",
+        },
+        content=gzip.compress(json.dumps(actions).encode()),
+    )
+    response = await obimpl._handle_http(None, conn, request)
+    assert response.headers["Content-Encoding"] == "gzip"
+    resp = json.loads(gzip.decompress(response.content))  # type: ignore
+    assert len(resp) == 64
+    assert all(item["status"] == "ok" for item in resp)
+
+    # 小于阈值的响应不压缩
+    request = Request(
+        "POST",
+        "http://localhost/all4one/",
+        headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"},
+        content=json.dumps(actions[0]),
+    )
+    response = await obimpl._handle_http(None, conn, request)
+    assert "Content-Encoding" not in response.headers
+
+
+async def test_payload_too_large(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(type="http", max_body_size=1024)  # type: ignore
+    body = json.dumps({"action": "get_version", "params": {}, "x": " " * 4096})
+
+    def request(content: bytes, encoding: Optional[str] = None) -> Request:
+        headers = {"Content-Type": "application/json"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Request(
+            "POST", "http://localhost/all4one/", headers=headers, content=content
+        )
+
+    # 压缩后很小的请求体解压后超过限制时拒绝，不完整解压
+    compressed = gzip.compress(body.encode())
+    assert len(compressed) < 1024
+    response = await obimpl._handle_http(None, conn, request(compressed, "gzip"))
+    assert response.status_code == 413
+    response = await obimpl._handle_http(None, conn, request(body.encode()))
+    assert response.status_code == 413
+
+    # 嵌套过深的请求体返回 10001
+    response = await obimpl._handle_http(None, conn, request(b"[" * 1000))
+    assert response.status_code == 200
+    assert json.loads(response.content)["retcode"] == 10001  # type: ignore
+
+    # 多个 gzip 成员拼接的请求体正常解压
+    half = len(body) // 2
+    conn.max_body_size = 8192
+    response = await obimpl._handle_http(
+        None,
+        conn,
+        request(
+            gzip.compress(body[:half].encode()) + gzip.compress(body[half:].encode()),
+            "gzip",
+        ),
+    )
+    assert json.loads(response.content)["status"] == "ok"  # type: ignore
@@ -0,0 +1,45 @@
+from asyncio import sleep, create_task
+
+import pytest
+from nonebug import App
+from nonebot.adapters.onebot.v12 import Event
+from nonebot.adapters.onebot.v12.exception import ActionFailedWithRetcode
+
+from tests.conftest import make_event
+
+
+async def test_events(app: App):
+    from nonebot_plugin_all4one import obimpl
+
+    received: list[Event] = []
+
+    async def consume():
+        async for event in obimpl.events(
+            detail_types={"test"}, predicate=lambda event: event.id != "1"
+        ):
+            received.append(event)
+
+    task = create_task(consume())
+    await sleep(0)
+    events = [make_event("0", "test"), make_event("1", "test"), make_event("2", "x")]
+    for event in events:
+        await obimpl.dispatch(event)
+    await sleep(0)
+    task.cancel()
+    await sleep(0)
+
+    # 进程内消费者拿到的就是原始的事件对象
+    assert received == [events[0]]
+    assert received[0] is events[0]
+    assert not obimpl.queues
+
+
+async def test_call_action(app: App):
+    from nonebot_plugin_all4one import obimpl
+
+    version = await obimpl.call_action(None, "get_version")
+    assert version["impl"] == "nonebot-plugin-all4one"
+
+    with pytest.raises(ActionFailedWithRetcode) as e:
+        await obimpl.call_action("unknown", "get_self_info")
+    assert e.value.retcode == 10102
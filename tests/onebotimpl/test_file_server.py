@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+import nonebot
+from nonebug import App
+from nonebot.drivers import Request
+from pytest_mock import MockerFixture
+
+
+async def test_file_server(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.database import get_file, upload_file, get_file_url
+
+    config = nonebot_plugin_all4one.database.plugin_config
+    mocker.patch.object(config, "obimpl_file_url_base", "http://localhost/")
+    file = await get_file(await upload_file("test.txt", data=b"0123456789"))
+    url = get_file_url(file)
+    assert url
+    assert url.startswith("http://localhost/all4one/file?")
+
+    response = await obimpl._handle_file(Request("GET", url))
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+    assert response.headers["Content-Type"] == "text/plain"
+
+    response = await obimpl._handle_file(
+        Request("GET", url, headers={"Range": "bytes=2-4"})
+    )
+    assert response.status_code == 206
+    assert response.content == b"234"
+    assert response.headers["Content-Range"] == "bytes 2-4/10"
+
+    response = await obimpl._handle_file(
+        Request("GET", url, headers={"Range": "bytes=-3"})
+    )
+    assert response.content == b"789"
+
+    response = await obimpl._handle_file(
+        Request("GET", url, headers={"Range": "bytes=10-"})
+    )
+    assert response.status_code == 416
+
+    # 签名不匹配或已过期
+    response = await obimpl._handle_file(Request("GET", url.replace("sig=", "sig=0")))
+    assert response.status_code == 403
+    mocker.patch.object(config, "obimpl_file_url_expire", -1)
+    response = await obimpl._handle_file(Request("GET", get_file_url(file)))  # type: ignore
+    assert response.status_code == 403
+
+
+async def test_shard_requires_secret(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.database
+    from nonebot_plugin_all4one.onebotimpl import OneBotImplementation
+
+    config = nonebot_plugin_all4one.database.plugin_config
+    mocker.patch.object(config, "obimpl_file_url_base", "http://localhost/")
+    driver = SimpleNamespace(
+        config=nonebot.get_driver().config.model_copy(update={"obimpl_shard": "front"})
+    )
+
+    # 多进程部署时各进程的随机密钥不同，签发的 URL 无法校验
+    with pytest.raises(ValueError, match="obimpl_file_url_secret"):
+        OneBotImplementation(driver)  # type: ignore
@@ -0,0 +1,100 @@
+from asyncio import sleep, create_task
+
+from nonebug import App
+from nonebot.drivers import Request
+
+from tests.conftest import make_event
+
+
+async def test_long_polling(app: App):
+    from nonebot_plugin_all4one import obimpl
+
+    queue = await obimpl.subscribe(linger=0.1)
+
+    async def publish():
+        await sleep(0.05)
+        for i in range(3):
+            await obimpl.dispatch(make_event(str(i)))
+            await sleep(0.01)
+
+    # 被唤醒后在 linger 窗口内收集后续到达的事件
+    task = create_task(publish())
+    events = await obimpl.get_latest_events(queue, limit=2, timeout=1)
+    assert [event.id for event in events] == ["0", "1"]
+    await task
+    events = await obimpl.get_latest_events(queue, timeout=1)
+    assert [event.id for event in events] == ["2"]
+
+    # 超时后返回空列表
+    assert await obimpl.get_latest_events(queue, timeout=1 / 100) == []
+    obimpl.unsubscribe(queue)
+
+
+async def test_client_queue(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(type="http", event_enabled=True)  # type: ignore
+    queues = {"": await obimpl.subscribe(maxsize=conn.event_buffer_size)}
+
+    default = await obimpl._get_client_queue(
+        queues, conn, Request("POST", "http://localhost/all4one/")
+    )
+    assert default is queues[""]
+    client_a = await obimpl._get_client_queue(
+        queues, conn, Request("POST", "http://localhost/all4one/?client_id=a")
+    )
+    client_b = await obimpl._get_client_queue(
+        queues,
+        conn,
+        Request(
+            "POST", "http://localhost/all4one/", headers={"X-All4One-Client-Id": "b"}
+        ),
+    )
+    assert len({id(default), id(client_a), id(client_b)}) == 3
+
+    # 每个客户端都能收到全部事件，互不抢占
+    await obimpl.dispatch(make_event("0"))
+    for queue in (default, client_a, client_b):
+        assert [event.id for event in await obimpl.get_latest_events(queue)] == ["0"]
+
+    for queue in queues.values():
+        obimpl.unsubscribe(queue)
+
+
+async def test_client_queue_allocation(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(
+        type="http", access_token="token", event_enabled=True  # type: ignore
+    )
+    queues = {}
+
+    def request(body: bytes, token: str = "token", client_id: str = "a") -> Request:
+        return Request(
+            "POST",
+            f"http://localhost/all4one/?client_id={client_id}",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+            content=body,
+        )
+
+    # 未通过鉴权、格式错误或没有请求事件时不分配队列
+    response = await obimpl._handle_http(queues, conn, request(b"{}", token="x"))
+    assert response.status_code == 401
+    await obimpl._handle_http(queues, conn, request(b"{", client_id="b"))
+    await obimpl._handle_http(
+        queues,
+        conn,
+        request(b'{"action": "get_version", "params": {}}', client_id="c"),
+    )
+    assert not queues
+
+    await obimpl._handle_http(
+        queues, conn, request(b'{"action": "get_latest_events", "params": {}}')
+    )
+    assert list(queues) == ["a"]
+    obimpl.unsubscribe(queues.pop("a"))
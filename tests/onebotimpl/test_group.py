@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from nonebug import App
+from nonebot.adapters.onebot.v12 import Event
+
+from tests.conftest import make_event
+
+
+def drain(queue) -> list[str]:
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait().id)
+    return events
+
+
+async def test_consumer_group(app: App):
+    from nonebot_plugin_all4one import obimpl
+
+    queues = [await obimpl.subscribe(group="g", member=str(i)) for i in range(3)]
+    assert not obimpl.queues
+
+    for i in range(30):
+        await obimpl.dispatch(make_event(str(i), group_id=str(i % 10)))
+    await obimpl.dispatch(
+        Event(id="m", time=datetime.now(), type="meta", detail_type="x", sub_type="")
+    )
+
+    # 每个事件只投递给一个成员，同一群的事件始终由同一个成员处理
+    received = [drain(queue) for queue in queues]
+    assert all(events[-1] == "m" for events in received)
+    ids = sorted(id for events in received for id in events[:-1])
+    assert ids == sorted(str(i) for i in range(30))
+    for events in received:
+        assert len({int(id) % 10 for id in events[:-1]}) == len(events[:-1]) // 3
+
+    # 成员离开后，其未消费的事件重新分配给其他成员
+    for i in range(10):
+        await obimpl.dispatch(make_event(str(i), group_id=str(i)))
+    pending = list(queues[0]._queue)  # type: ignore
+    obimpl.unsubscribe(queues[0])
+    assert sorted(drain(queues[1]) + drain(queues[2])) == sorted(
+        [str(i) for i in range(10)]
+    )
+    assert pending
+
+    for queue in queues[1:]:
+        obimpl.unsubscribe(queue)
+    assert not obimpl.groups
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from nonebug import App
+
+from tests.conftest import make_event
+
+
+async def test_journal(app: App, tmp_path: Path):
+    from nonebot_plugin_all4one.onebotimpl.journal import Journal
+    from nonebot_plugin_all4one.onebotimpl.replay import ReplayBuffer, get_seq
+
+    path = tmp_path / "journal"
+    replay = ReplayBuffer(0)
+    journal = Journal(path, segment_size=64, max_segments=16)
+    assert journal.open() == 0
+    for i in range(5):
+        event = make_event(str(i))
+        replay.append(event)
+        journal.append(event)
+    await journal.flush()
+    # 超过分段大小后滚动到新的分段文件
+    assert len(list(path.iterdir())) > 1
+
+    events = await journal.read(1, 4)
+    assert [get_seq(event) for event in events] == [2, 3, 4]
+    assert [event.id for event in events] == ["1", "2", "3"]
+    journal.close()
+
+    # 重启后截断不完整的帧并恢复序号
+    last = sorted(path.iterdir())[-1]
+    with last.open("ab") as f:
+        f.write(b"\x00\x00")
+    journal = Journal(path, segment_size=64, max_segments=16)
+    assert journal.open() == 5
+    assert [get_seq(event) for event in await journal.read(0)] == [1, 2, 3, 4, 5]
+    journal.close()
+
+
+async def test_journal_reopen_after_roll(app: App, tmp_path: Path):
+    from nonebot_plugin_all4one.onebotimpl.journal import Journal
+    from nonebot_plugin_all4one.onebotimpl.replay import ReplayBuffer, get_seq
+
+    path = tmp_path / "journal"
+    replay = ReplayBuffer(0)
+    journal = Journal(path, segment_size=64, max_segments=16)
+    journal.open()
+    for i in range(3):
+        event = make_event(str(i))
+        replay.append(event)
+        journal.append(event)
+    await journal.flush()
+    journal.close()
+
+    # 滚动后新分段的帧在写入中途中断，重启后截断为空分段，序号不能回退
+    segments = sorted(path.iterdir())
+    last = path / f"{4:020d}{segments[-1].suffix}"
+    last.write_bytes(b"\x00\x00")
+    journal = Journal(path, segment_size=64, max_segments=16)
+    assert journal.open() == 3
+    assert last.stat().st_size == 0
+
+    event = make_event("3")
+    replay.append(event)
+    journal.append(event)
+    await journal.flush()
+    assert [get_seq(event) for event in await journal.read(0)] == [1, 2, 3, 4]
+    journal.close()
@@ -0,0 +1,61 @@
+import json
+from collections.abc import Awaitable
+from asyncio import sleep, create_task, get_running_loop
+
+from nonebug import App
+from nonebot.drivers import Request
+from pytest_mock import MockerFixture
+
+
+async def max_loop_latency(awaitable: Awaitable) -> float:
+    """等待 awaitable 完成，返回期间事件循环最长的一次停顿，单位：秒"""
+    loop = get_running_loop()
+    gaps = []
+    done = False
+
+    async def tick():
+        last = loop.time()
+        while not done:
+            await sleep(0.001)
+            now = loop.time()
+            gaps.append(now - last)
+            last = now
+
+    task = create_task(tick())
+    await sleep(0.01)
+    await awaitable
+    done = True
+    await task
+    return max(gaps)
+
+
+async def test_offload(app: App, mocker: MockerFixture):
+    import nonebot_plugin_all4one.offload
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPConfig
+
+    conn = HTTPConfig(type="http")  # type: ignore
+    # 转义的中文文本解码开销远大于解码结果的大小
+    message = [{"type": "text", "data": {"text": "你好世界" * 4000}}] * 200
+    body = json.dumps(
+        {"action": "send_message", "params": {"message": message}, "echo": "1"}
+    ).encode()
+    request = Request(
+        "POST",
+        "http://localhost/all4one/",
+        headers={"Content-Type": "application/json"},
+        content=body,
+    )
+
+    # 预热进程池
+    await obimpl._handle_http(None, conn, request)
+    process_latency = await max_loop_latency(obimpl._handle_http(None, conn, request))
+
+    # JSON 解码全程持有 GIL，放到线程池中仍会阻塞事件循环
+    mocker.patch.object(
+        nonebot_plugin_all4one.offload.plugin_config,
+        "obimpl_offload_process_threshold",
+        len(body) + 1,
+    )
+    thread_latency = await max_loop_latency(obimpl._handle_http(None, conn, request))
+    assert process_latency < thread_latency / 2
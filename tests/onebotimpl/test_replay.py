@@ -0,0 +1,35 @@
+from nonebug import App
+
+from tests.conftest import make_event
+
+
+async def test_resume(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.replay import get_seq
+
+    seq = obimpl.replay.seq
+    for i in range(3):
+        await obimpl.dispatch(make_event(str(i)))
+
+    # 断线重连时补发最后确认的序号之后的事件
+    queue = await obimpl.subscribe(seq + 1)
+    assert [get_seq(queue.get_nowait()) for _ in range(2)] == [seq + 2, seq + 3]
+    assert queue.empty()
+
+    # 没有给出序号的连接先暂缓推送，等待客户端补发断线期间的事件
+    queue.hold()
+    await obimpl.dispatch(make_event("3"))
+    resp = await obimpl._call_api(
+        {"action": "all4one.resume", "params": {"seq": seq}}, queue
+    )
+    assert resp["status"] == "ok"
+    assert queue.released.is_set()
+    # 补发的事件排在实时推送的事件之前，且不会重复
+    assert [get_seq(queue.get_nowait()) for _ in range(4)] == [
+        seq + 1,
+        seq + 2,
+        seq + 3,
+        seq + 4,
+    ]
+    assert queue.empty()
+    obimpl.unsubscribe(queue)
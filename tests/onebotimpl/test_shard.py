@@ -0,0 +1,80 @@
+import struct
+from pathlib import Path
+from datetime import datetime
+from asyncio import StreamReader, StreamWriter, create_task, open_unix_connection
+
+import msgpack
+from nonebug import App
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+async def send(writer: StreamWriter, data: dict) -> None:
+    payload = msgpack.packb(data)
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)  # type: ignore
+    await writer.drain()
+
+
+async def receive(reader: StreamReader) -> dict:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return msgpack.unpackb(await reader.readexactly(length))
+
+
+def status_update(online: bool) -> dict:
+    return {
+        "id": "0",
+        "time": datetime.now().timestamp(),
+        "type": "meta",
+        "detail_type": "status_update",
+        "sub_type": "",
+        "status": {
+            "good": True,
+            "bots": [
+                {"self": {"platform": "test", "user_id": "worker"}, "online": online}
+            ],
+        },
+    }
+
+
+async def test_shard_front(app: App, tmp_path: Path):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.shard import ShardBot
+
+    path = tmp_path / "shard.sock"
+    await obimpl._start_unix_server(path, obimpl._handle_shard)
+    server = obimpl.servers.pop()
+    queue = await obimpl.subscribe()
+
+    # 工作进程上线的机器人注册为代理中间件
+    reader, writer = await open_unix_connection(str(path))
+    await send(writer, status_update(True))
+    event = await queue.get()
+    assert isinstance(obimpl.middlewares["worker"], ShardBot)
+    assert event.status.bots[0].self.user_id == "worker"  # type: ignore
+
+    # 动作请求转发给所属的工作进程
+    task = create_task(obimpl.call_action("worker", "get_self_info"))
+    action = await receive(reader)
+    assert action["action"] == "get_self_info"
+    assert action["self"] == {"user_id": "worker"}
+    await send(
+        writer,
+        {
+            "status": "ok",
+            "retcode": 0,
+            "data": {"user_id": "worker"},
+            "message": "",
+            "echo": action["echo"],
+        },
+    )
+    assert await task == {"user_id": "worker"}
+
+    # 工作进程断开后注销代理中间件，并推送下线状态
+    writer.close()
+    event = await queue.get()
+    assert not event.status.bots[0].online  # type: ignore
+    assert "worker" not in obimpl.middlewares
+
+    obimpl.unsubscribe(queue)
+    server.close()
+    await server.wait_closed()
@@ -0,0 +1,106 @@
+import json
+
+from nonebug import App
+from nonebot.drivers import Request
+
+from tests.conftest import make_event
+
+
+def parse_sse(content: str) -> list[dict[str, str]]:
+    messages = []
+    for block in content.split("\n\n"):
+        if block:
+            messages.append(dict(line.split(": ", 1) for line in block.split("\n")))
+    return messages
+
+
+async def test_sse(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import SSEConfig
+
+    conn = SSEConfig(type="sse", access_token="token", timeout=0)  # type: ignore
+    response = await obimpl._handle_sse(
+        conn, Request("GET", "http://localhost/all4one/events")
+    )
+    assert response.status_code == 401
+
+    url = "http://localhost/all4one/events?access_token=token"
+    response = await obimpl._handle_sse(conn, Request("GET", url))
+    assert response.headers["Content-Type"] == "text/event-stream"
+    # 没有事件时返回当前序号作为 Last-Event-ID
+    last_event_id = parse_sse(response.content)[-1]["id"]  # type: ignore
+
+    for i in range(3):
+        await obimpl.dispatch(make_event(str(i)))
+    response = await obimpl._handle_sse(
+        conn, Request("GET", url, headers={"Last-Event-ID": last_event_id})
+    )
+    messages = parse_sse(response.content)[1:]  # type: ignore
+    assert [json.loads(message["data"])["id"] for message in messages] == [
+        "0",
+        "1",
+        "2",
+    ]
+    assert [int(message["id"]) for message in messages] == [
+        int(last_event_id) + i for i in range(1, 4)
+    ]
+
+
+async def test_sse_stream(app: App):
+    from starlette.requests import Request as StarletteRequest
+
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import SSEConfig
+
+    conn = SSEConfig(
+        type="sse",
+        access_token="token",
+        heartbeat_interval=0.01,  # type: ignore
+    )
+    # FastAPI 驱动器下注册流式响应的路由
+    assert obimpl._setup_sse_stream(conn)
+    route = next(
+        route
+        for route in obimpl.driver.server_app.routes  # type: ignore
+        if getattr(route, "name", None) == "All4One SSE"
+    )
+
+    def request(query: str) -> StarletteRequest:
+        return StarletteRequest(
+            {
+                "type": "http",
+                "method": "GET",
+                "scheme": "http",
+                "server": ("localhost", 80),
+                "path": "/all4one/events",
+                "query_string": query.encode(),
+                "headers": [],
+            }
+        )
+
+    response = await route.endpoint(request(""))  # type: ignore
+    assert response.status_code == 401
+
+    response = await route.endpoint(request("access_token=token"))  # type: ignore
+    assert response.media_type == "text/event-stream"
+    stream = response.body_iterator
+    last_event_id = int(parse_sse(await stream.__anext__())[0]["id"])
+    # 没有事件时发送心跳，连接保持打开
+    assert await stream.__anext__() == ": heartbeat\n\n"
+
+    for i in range(2):
+        await obimpl.dispatch(make_event(str(i)))
+    messages = parse_sse(await stream.__anext__())
+    assert [json.loads(message["data"])["id"] for message in messages] == ["0", "1"]
+    assert [int(message["id"]) for message in messages] == [
+        last_event_id + 1,
+        last_event_id + 2,
+    ]
+    await obimpl.dispatch(make_event("2"))
+    messages = parse_sse(await stream.__anext__())
+    assert [json.loads(message["data"])["id"] for message in messages] == ["2"]
+
+    # 客户端断开后注销事件队列
+    queues = len(obimpl.queues)
+    await stream.aclose()
+    assert len(obimpl.queues) == queues - 1
@@ -0,0 +1,113 @@
+import json
+import struct
+from pathlib import Path
+from asyncio import StreamReader, StreamWriter, sleep, open_unix_connection
+
+from nonebug import App
+
+from tests.conftest import make_event
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+async def send(writer: StreamWriter, data: dict) -> None:
+    payload = json.dumps(data).encode()
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def receive(reader: StreamReader) -> dict:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return json.loads(await reader.readexactly(length))
+
+
+async def test_unix_socket(app: App, tmp_path: Path):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import UnixSocketConfig
+
+    conn = UnixSocketConfig(
+        type="unix", path=tmp_path / "all4one.sock", access_token="token"  # type: ignore
+    )
+    await obimpl._open_unix_server(conn)
+    server = obimpl.servers.pop()
+
+    # 握手失败时直接断开连接
+    reader, writer = await open_unix_connection(str(conn.path))
+    await send(writer, {"access_token": "wrong"})
+    assert await reader.read() == b""
+    writer.close()
+
+    reader, writer = await open_unix_connection(str(conn.path))
+    await send(writer, {"access_token": "token"})
+    assert (await receive(reader))["detail_type"] == "connect"
+    assert (await receive(reader))["detail_type"] == "status_update"
+
+    await obimpl.dispatch(make_event("0"))
+    assert (await receive(reader))["id"] == "0"
+
+    await send(writer, {"action": "get_version", "params": {}, "echo": "1"})
+    resp = await receive(reader)
+    assert resp["echo"] == "1"
+    assert resp["data"]["impl"] == "nonebot-plugin-all4one"
+
+    writer.close()
+
+    # 仍在监听的套接字不会被删除
+    await obimpl._open_unix_server(conn)
+    assert not obimpl.servers
+    assert conn.path.is_socket()
+
+    # 关闭时删除套接字文件
+    obimpl.servers.append(server)
+    await obimpl._close_servers()
+    assert not conn.path.exists()
+
+
+async def test_remove_stale_socket(app: App, tmp_path: Path):
+    import socket
+
+    from nonebot_plugin_all4one.onebotimpl.unix import remove_stale_socket
+
+    # 没有进程监听的套接字文件被删除
+    path = tmp_path / "stale.sock"
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind(str(path))
+    sock.close()
+    assert path.is_socket()
+    await remove_stale_socket(path)
+    assert not path.exists()
+
+
+async def test_unix_socket_send(app: App):
+    from asyncio import gather
+
+    from nonebot_plugin_all4one.onebotimpl.unix import UnixSocket
+
+    class Writer:
+        def __init__(self):
+            self.data = b""
+            self.draining = False
+
+        def write(self, data: bytes):
+            assert not self.draining
+            self.data += data
+
+        async def drain(self):
+            assert not self.draining
+            self.draining = True
+            await sleep(0)
+            self.draining = False
+
+    writer = Writer()
+    unix = UnixSocket(None, writer, False, 1024)  # type: ignore
+    frames = [json.dumps({"i": i}) for i in range(8)]
+
+    # 并发写入时逐帧写入并等待缓冲区排空，帧之间不交错
+    await gather(*(unix.send(frame) for frame in frames))
+    received = []
+    data = writer.data
+    while data:
+        (length,) = FRAME_HEADER.unpack(data[: FRAME_HEADER.size])
+        received.append(data[FRAME_HEADER.size : FRAME_HEADER.size + length].decode())
+        data = data[FRAME_HEADER.size + length :]
+    assert received == frames
@@ -0,0 +1,50 @@
+import json
+from asyncio import sleep, create_task
+
+from nonebug import App
+from pytest_mock import MockerFixture
+from nonebot.drivers import Request, Response
+
+from tests.conftest import make_event
+
+
+async def test_webhook_batch(app: App, mocker: MockerFixture):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import HTTPWebhookConfig
+
+    conn = HTTPWebhookConfig(
+        type="http_webhook",  # type: ignore
+        url="http://localhost/webhook",  # type: ignore
+        event_batch=True,
+        max_batch_size=3,
+    )
+    requests: list[Request] = []
+
+    async def request(setup: Request) -> Response:
+        requests.append(setup)
+        body = json.loads(setup.content)  # type: ignore
+        # 只对第二个事件执行快速操作
+        actions = [None] * len(body)
+        actions[1] = [{"action": "get_version", "params": {}}]
+        return Response(
+            200,
+            headers={"Content-Type": "application/json"},
+            content=json.dumps(actions),
+        )
+
+    mocker.patch.object(obimpl, "request", request)
+    call_api = mocker.spy(obimpl, "_call_api")
+
+    task = create_task(obimpl._http_webhook(conn))
+    await sleep(0)
+    for i in range(4):
+        await obimpl.dispatch(make_event(str(i)))
+    await sleep(0.1)
+    task.cancel()
+
+    # 首个 status_update 与事件合并推送，每批不超过 max_batch_size
+    assert [len(json.loads(request.content)) for request in requests] == [3, 2]  # type: ignore
+    assert call_api.call_count == 2
+    call_api.assert_called_with({"action": "get_version", "params": {}})
+    for queue in list(obimpl.queues):
+        obimpl.unsubscribe(queue)
@@ -0,0 +1,213 @@
+import json
+from asyncio import sleep, create_task
+
+from nonebug import App
+from nonebot.exception import WebSocketClosed
+
+from tests.conftest import make_event
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, data):
+        self.frames.append(data)
+
+
+async def test_ws_send_batch(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import WebsocketConfig
+
+    conn = WebsocketConfig(type="websocket", max_batch_size=2)  # type: ignore
+    for batch in (False, True):
+        websocket = FakeWebSocket()
+        queue = await obimpl.subscribe()
+        for i in range(3):
+            await obimpl.dispatch(make_event(str(i)))
+        task = create_task(
+            obimpl._ws_send(websocket, conn, queue, batch)  # type: ignore
+        )
+        await sleep(0.01)
+        task.cancel()
+        frames = [json.loads(frame) for frame in websocket.frames]
+        if batch:
+            # 积压的事件合并为数组帧，每帧不超过 max_batch_size
+            assert [[event["id"] for event in frame] for frame in frames] == [
+                ["0", "1"],
+                ["2"],
+            ]
+        else:
+            assert [frame["id"] for frame in frames] == ["0", "1", "2"]
+        obimpl.unsubscribe(queue)
+
+
+async def test_ws_send_codec(app: App):
+    import msgpack
+    from nonebot.drivers import Request
+
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import WebsocketConfig
+
+    assert obimpl._get_codec(Request("GET", "ws://localhost/?codec=msgpack"))
+    assert not obimpl._get_codec(
+        Request("GET", "ws://localhost/", headers={"Accept": "application/json"})
+    )
+    assert obimpl._get_codec(Request("GET", "ws://localhost/")) is None
+    # q=0 表示不接受该格式
+    assert not obimpl._get_codec(
+        Request(
+            "GET",
+            "ws://localhost/",
+            headers={"Accept": "application/msgpack;q=0, application/json"},
+        )
+    )
+    assert (
+        obimpl._get_codec(
+            Request(
+                "GET", "ws://localhost/", headers={"Accept": "application/msgpack;q=0"}
+            )
+        )
+        is None
+    )
+
+    conn = WebsocketConfig(type="websocket")  # type: ignore
+    json_ws, msgpack_ws = FakeWebSocket(), FakeWebSocket()
+    json_queue, msgpack_queue = await obimpl.subscribe(), await obimpl.subscribe()
+    event = make_event("0")
+    await obimpl.dispatch(event)
+    tasks = [
+        create_task(obimpl._ws_send(json_ws, conn, json_queue, use_msgpack=False)),  # type: ignore
+        create_task(obimpl._ws_send(msgpack_ws, conn, msgpack_queue, use_msgpack=True)),  # type: ignore
+    ]
+    await sleep(0.01)
+    for task in tasks:
+        task.cancel()
+
+    # 每个客户端按各自协商的格式接收，同一格式只编码一次
+    assert json.loads(json_ws.frames[0])["id"] == "0"
+    assert msgpack.unpackb(msgpack_ws.frames[0])["id"] == "0"
+    assert msgpack_ws.frames[0] is event.__dict__["_all4one_encoded"][True]
+    assert "_all4one_encoded" not in event.model_dump()
+
+
+async def test_accept_websocket(app: App):
+    from nonebot.drivers import Request
+
+    from nonebot_plugin_all4one import obimpl
+
+    class NativeWebSocket:
+        def __init__(self):
+            self.subprotocol = None
+
+        async def accept(self, subprotocol=None):
+            self.subprotocol = subprotocol
+
+    class FakeServerWebSocket:
+        def __init__(self, request, native=None):
+            self.request = request
+            self.accepted = False
+            if native is not None:
+                self.websocket = native
+
+        async def accept(self):
+            self.accepted = True
+
+    request = Request(
+        "GET",
+        "ws://localhost/",
+        headers={"Sec-WebSocket-Protocol": "A.nonebot-plugin-all4one.msgpack"},
+    )
+    # 回应选择的子协议，并按子协议使用 MessagePack
+    native = NativeWebSocket()
+    protocol = await obimpl._accept_websocket(FakeServerWebSocket(request, native))  # type: ignore
+    assert protocol == native.subprotocol == "A.nonebot-plugin-all4one.msgpack"
+    assert obimpl._get_codec(request, protocol)
+
+    # 驱动器不支持回应子协议时不使用子协议协商编码格式
+    websocket = FakeServerWebSocket(request)
+    protocol = await obimpl._accept_websocket(websocket)  # type: ignore
+    assert protocol is None
+    assert websocket.accepted
+    assert obimpl._get_codec(request, protocol) is None
+
+
+async def test_ws_recv_invalid_frame(app: App):
+    import msgpack
+
+    from nonebot_plugin_all4one import obimpl
+
+    class FakeReceiveWebSocket(FakeWebSocket):
+        def __init__(self, frames):
+            super().__init__()
+            self.incoming = list(frames)
+
+        async def receive(self):
+            if not self.incoming:
+                raise WebSocketClosed(1000)
+            return self.incoming.pop(0)
+
+    websocket = FakeReceiveWebSocket(
+        [
+            msgpack.packb({"action": "get_version", "echo": "1"}) + b"\x00",
+            b"\xc1",
+            # 嵌套过深的帧
+            "[" * 100000,
+            b"\x91" * 100000,
+            msgpack.packb({"action": "get_version", "params": {}, "echo": "2"}),
+        ]
+    )
+    queue = await obimpl.subscribe()
+    await obimpl._ws_recv(websocket, queue)  # type: ignore
+    obimpl.unsubscribe(queue)
+
+    # 格式错误的帧返回 10001，之后的请求仍然正常处理
+    frames = [
+        json.loads(frame) if isinstance(frame, str) else msgpack.unpackb(frame)
+        for frame in websocket.frames
+    ]
+    assert [frame["retcode"] for frame in frames] == [10001] * 4 + [0]
+    assert frames[0]["echo"] == "1"
+    assert frames[4]["echo"] == "2"
+
+
+async def test_ws_send_resume(app: App):
+    from nonebot_plugin_all4one import obimpl
+    from nonebot_plugin_all4one.onebotimpl.config import WebsocketConfig
+
+    seq = obimpl.replay.seq
+    for i in range(2):
+        await obimpl.dispatch(make_event(str(i)))
+
+    conn = WebsocketConfig(type="websocket", resume_wait_ms=5000)  # type: ignore
+    websocket = FakeWebSocket()
+    queue = await obimpl.subscribe()
+    queue.hold()
+    task = create_task(obimpl._ws_send(websocket, conn, queue))  # type: ignore
+    await obimpl.dispatch(make_event("2"))
+    await sleep(0.01)
+    # 客户端补发断线期间的事件之前暂缓推送实时事件
+    assert websocket.frames == []
+
+    await obimpl.resume(queue, seq=seq)
+    await obimpl.dispatch(make_event("3"))
+    await sleep(0.01)
+    task.cancel()
+    frames = [json.loads(frame) for frame in websocket.frames]
+    assert [frame["all4one.seq"] for frame in frames] == [
+        seq + 1,
+        seq + 2,
+        seq + 3,
+        seq + 4,
+    ]
+
+    # 客户端不补发时超时后恢复推送
+    conn = WebsocketConfig(type="websocket", resume_wait_ms=10)  # type: ignore
+    websocket = FakeWebSocket()
+    queue = await obimpl.subscribe()
+    queue.hold()
+    task = create_task(obimpl._ws_send(websocket, conn, queue))  # type: ignore
+    await obimpl.dispatch(make_event("4"))
+    await sleep(0.05)
+    task.cancel()
+    assert [json.loads(frame)["id"] for frame in websocket.frames] == ["4"]